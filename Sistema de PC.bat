@@ -38,6 +38,14 @@ echo.
 echo Pressione Ctrl+C para parar o servidor
 echo.
 
+REM Aplicar migrações do banco
+python migracoes.py
+if errorlevel 1 (
+    echo ERRO: Falha ao aplicar migrações do banco!
+    pause
+    exit /b 1
+)
+
 REM Iniciar aplicação
 python app.py
 
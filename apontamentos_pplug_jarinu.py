@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+import sys
 import json
 import requests
 import time
@@ -8,8 +9,41 @@ from datetime import datetime, timedelta
 from sqlalchemy import create_engine, text
 from loguru import logger
 
-def atualizar_apontamentos():
-    """Função para atualizar dados de apontamentos"""
+import carga_bulk
+
+# Janela da API quando a tabela está vazia (ou com --dias)
+DIAS_PADRAO = 3
+# Dias antes da marca d'água que são buscados de novo (apontamentos lançados com atraso)
+DIAS_SOBREPOSICAO = 1
+
+def marca_dagua(connection):
+    """(id, data) do último apontamento gravado, ou (None, None) com a tabela vazia.
+
+    Lê só uma linha pelo índice único de id (migracoes/0010), sem varrer a tabela."""
+    row = connection.execute(text("""
+        SELECT id, data FROM public.apontamento_pplug_jarinu
+        WHERE id IS NOT NULL
+        ORDER BY id DESC
+        LIMIT 1
+    """)).fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+def gravar_novos(engine, df):
+    """Grava só os ids que ainda não existem (COPY para tabela temporária + ON CONFLICT (id) DO NOTHING).
+
+    A deduplicação fica no banco: o custo depende das linhas recebidas da API,
+    não do tamanho da tabela. Retorna o carga_bulk.Resultado (linhas gravadas, linhas/s)."""
+    with engine.begin() as connection:
+        return carga_bulk.carregar(
+            connection.connection, 'public.apontamento_pplug_jarinu', list(df.columns), df,
+            chave='id', modo='ignorar'
+        )
+
+def atualizar_apontamentos(dias=None):
+    """Função para atualizar dados de apontamentos
+
+    Incremental: busca na API a partir da data do último apontamento gravado (marca
+    d'água) menos DIAS_SOBREPOSICAO. Com ``dias``, busca os últimos ``dias`` dias."""
     load_dotenv()
     
     try:
@@ -19,8 +53,18 @@ def atualizar_apontamentos():
         DB_PORT = os.getenv('DB_PORT')
         DB_NAME = os.getenv('DB_NAME')
         connection_string = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+        engine = create_engine(connection_string)
+
+        with engine.connect() as connection:
+            id_marca, data_marca = marca_dagua(connection)
 
-        ontem = (datetime.today() - timedelta(days=3)).strftime('%y-%m-%d')
+        if dias is None and data_marca is not None:
+            inicio = data_marca - timedelta(days=DIAS_SOBREPOSICAO)
+            logger.info(f"Marca d'água: id {id_marca}, {data_marca}")
+        else:
+            inicio = datetime.today() - timedelta(days=dias or DIAS_PADRAO)
+
+        ontem = inicio.strftime('%y-%m-%d')
         hoje = datetime.today().strftime('%y-%m-%d')
 
         url = f"https://www.pplug.com.br/PP_pesquisa_api_vertco.php?etapa_aponta=TODAS&data_aponta={ontem}&data_fim={hoje}&token=acessoJARINUconsulta"
@@ -50,7 +94,6 @@ def atualizar_apontamentos():
         df['CÓDIGO DE BARRAS'] = df['ITEM'] + df['OP'].astype(str)
 
         # Merge com dados de metros quadrados do banco
-        engine = create_engine(connection_string)
         with engine.connect() as connection:
             query_m2 = text("SELECT projeto_peca, m2 FROM dados_uso_geral.metro_quadrado_pecas")
             df_m2 = pd.read_sql(query_m2, connection)
@@ -100,30 +143,20 @@ def atualizar_apontamentos():
         for col in ['etapa', 'usuario', 'colaborador', 'cliente', 'prioridade', 'item']:
             df_final[col] = df_final[col].replace("", None).astype(str)
 
-        # Verificação e conexão
-        logger.info("Verificando dados antes da inserção")
-
-        with engine.connect() as connection:
-            query = text(f"SELECT id, data FROM public.apontamento_pplug_jarinu")
-            existing_data = pd.read_sql(query, connection)
-
-        df_final['id'] = df_final['id'].fillna(0).astype('int64')
-        existing_data['id'] = existing_data['id'].astype(int)
-        df_final['data'] = pd.to_datetime(df_final['data'], errors='coerce')
-        existing_data['data'] = pd.to_datetime(existing_data['data'], errors='coerce')
         df_final['op'] = df_final['op'].fillna(0).astype('int64')
-
-        # Remove duplicatas
-        df_novo = df_final[~df_final['id'].isin(existing_data['id']) & ~df_final['data'].isin(existing_data['data'])]
-        df_novo.columns = df_novo.columns.str.strip()
-        df_novo = df_novo.map(lambda x: None if x == '' else x)
-        df_novo['id'] = df_novo['id'].astype(pd.Int64Dtype())
-        df_novo['op'] = df_novo['op'].astype(pd.Int64Dtype())
-        df_novo.drop_duplicates(subset=['id'], inplace=True)
-
-        if not df_novo.empty:
-            df_novo.to_sql('apontamento_pplug_jarinu', engine, schema='public', index=False, if_exists='append')
-            logger.info(f"{len(df_novo)} novos registros inseridos.")
+        df_final.columns = df_final.columns.str.strip()
+        df_final = df_final.map(lambda x: None if x == '' else x)
+        df_final['id'] = df_final['id'].astype(pd.Int64Dtype())
+        df_final['op'] = df_final['op'].astype(pd.Int64Dtype())
+
+        sem_id = df_final['id'].isna().sum()
+        if sem_id:
+            logger.warning(f"{sem_id} apontamentos sem ID ignorados")
+
+        carga = gravar_novos(engine, df_final)
+        if carga.gravadas:
+            logger.info(f"{carga.gravadas} novos registros inseridos ({carga.recebidas} recebidos da API, "
+                        f"{carga.linhas_por_segundo:,.0f} linhas/s).")
         else:
             logger.warning("Nenhum novo dado para inserir.")
 
@@ -136,5 +169,7 @@ def atualizar_apontamentos():
         return {"success": False, "message": str(e)}
 
 if __name__ == "__main__":
-    result = atualizar_apontamentos()
+    # python apontamentos_pplug_jarinu.py [--dias N]
+    dias = int(sys.argv[sys.argv.index('--dias') + 1]) if '--dias' in sys.argv else None
+    result = atualizar_apontamentos(dias)
     print(result)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, make_response
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, make_response, g
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
@@ -7,8 +7,23 @@ from itsdangerous import URLSafeTimedSerializer
 import psycopg2
 import psycopg2.extras
 import pandas as pd
+import db_pool
+import arquivos_corte
+import migracoes
+import consultas
+import etiquetas as etiquetas_pdf
+import exportacao
+import plano_xml
+import jobs
+import arquivos_temp
+import entrega_cnc
+import carga_bulk
+from cache_ttl import CacheTTL
+from reservas_slots import ReservaSlots, TravaSlotsError, liberar_reservas
+from slots import categoria_peca
 import json
 import io
+import multiprocessing
 import os
 import smtplib
 import threading
@@ -75,6 +90,9 @@ if not all(DB_CONFIG.values()):
     print(f"Valores carregados: {DB_CONFIG}")
     exit(1)
 
+# Pool de conexões por processo (DB_POOL_MIN / DB_POOL_MAX no .env)
+db_pool.registrar_no_app(app, DB_CONFIG)
+
 SSO_SHARED_SECRET = os.getenv('SSO_SHARED_SECRET')
 SSO_SALT = os.getenv('SSO_SALT', 'app-pc-acomp-sso')
 ACOMP_CORTE_BASE_URL = os.getenv('ACOMP_CORTE_BASE_URL')
@@ -190,23 +208,34 @@ class User(UserMixin):
         self.role = funcao
         self.setor = setor
 
+# Usuários autenticados por processo: evita ir ao banco em toda requisição.
+# Edição/exclusão invalidam no worker atual; nos demais vale o TTL (USER_CACHE_TTL, segundos).
+usuarios_cache = CacheTTL(
+    maximo=int(os.getenv('USER_CACHE_MAX', '500')),
+    ttl=float(os.getenv('USER_CACHE_TTL', '60'))
+)
+
 @login_manager.user_loader
 def load_user(user_id):
+    user = usuarios_cache.obter(str(user_id))
+    if user is not None:
+        return user
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT * FROM public.users WHERE id = %s AND sistema = 'PC'", (user_id,))
-        user_data = cur.fetchone()
-        conn.close()
+        with db_pool.db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            cur.execute("SELECT id, usuario, funcao, setor FROM public.users WHERE id = %s AND sistema = 'PC'", (user_id,))
+            user_data = cur.fetchone()
         
         if user_data:
-            return User(user_data['id'], user_data['usuario'], user_data['funcao'], user_data.get('setor', ''))
+            user = User(user_data['id'], user_data['usuario'], user_data['funcao'], user_data.get('setor', ''))
+            usuarios_cache.definir(str(user_id), user)
+            return user
     except:
         pass
     return None
 
 def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    return db_pool.get_db_connection()
 
 @app.route('/')
 def login():
@@ -244,6 +273,7 @@ def login_post():
             
             if senha_correta:
                 user = User(user_data['id'], user_data['usuario'], user_data['funcao'], user_data.get('setor', ''))
+                usuarios_cache.definir(str(user.id), user)
                 login_user(user, remember=True, duration=timedelta(days=365))
                 from flask import session
                 session.permanent = True
@@ -343,6 +373,7 @@ def resetar_senha(user_id):
         )
         conn.commit()
         conn.close()
+        usuarios_cache.invalidar(str(user_id))
         
         return jsonify({'success': True, 'message': 'Senha resetada com sucesso!'})
     
@@ -373,6 +404,7 @@ def editar_usuario(user_id):
         )
         conn.commit()
         conn.close()
+        usuarios_cache.invalidar(str(user_id))
         
         return jsonify({'success': True, 'message': 'Usuário atualizado com sucesso!'})
     
@@ -392,6 +424,7 @@ def excluir_usuario(user_id):
         cur.execute("DELETE FROM public.users WHERE id = %s AND sistema = 'PC'", (user_id,))
         conn.commit()
         conn.close()
+        usuarios_cache.invalidar(str(user_id))
         
         return jsonify({'success': True, 'message': 'Usuário excluído com sucesso!'})
     
@@ -564,48 +597,29 @@ def importar_etiquetas():
 @login_required
 def gerar_etiquetas_pdf():
     try:
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.units import mm
-        from datetime import datetime
-        import tempfile
-        import os
-        
         dados = request.get_json().get('dados', [])
         
         if not dados:
-            return jsonify({'success': False, 'message': 'Nenhum dado fornecido'})
+            return jsonify({'success': False, 'message': 'Nenhum dado fornecido'}), 400
+        
+        # Lotes grandes vão para a fila (jobs.py) e são desenhados em paralelo;
+        # o navegador acompanha por /api/jobs/<id> e baixa o PDF no final
+        total = etiquetas_pdf.total_paginas(dados)
+        if total > etiquetas_pdf.LIMITE_SINCRONO:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            job_id = jobs.enfileirar(cur, 'etiquetas_pdf', {'dados': dados}, current_user.username, total)
+            conn.commit()
+            conn.close()
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'message': f'Geração de {total} etiqueta(s) iniciada'
+            }), 202
         
-        # Criar PDF em memória com tamanho personalizado para etiquetas
+        # PDF em memória, uma página do tamanho da etiqueta para cada cópia
         buffer = io.BytesIO()
-        etiqueta_width = 100*mm
-        etiqueta_height = 50*mm
-        
-        # Usar tamanho da página igual ao da etiqueta
-        c = canvas.Canvas(buffer, pagesize=(etiqueta_width, etiqueta_height))
-        width, height = etiqueta_width, etiqueta_height
-        
-        x_pos = 0
-        y_pos = 0
-        
-        primeira_etiqueta = True
-        for item in dados:
-            for i in range(item['quantidade_etiquetas']):
-                # Nova página para cada etiqueta (exceto a primeira)
-                if not primeira_etiqueta:
-                    c.showPage()
-                primeira_etiqueta = False
-                
-                # Desenhar etiqueta ocupando toda a página
-                desenhar_etiqueta_simples(c, 0, 0, width, height, {
-                    'OP': item['op'],
-                    'Peca': item['peca'],
-                    'Veiculo': item['veiculo'],
-                    'Descricao': item.get('descricao', ''),
-                    'ID': item['id']
-                })
-        
-        c.save()
+        etiquetas_pdf.gerar_pdf(dados, buffer)
         buffer.seek(0)
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -619,224 +633,135 @@ def gerar_etiquetas_pdf():
         )
         
     except Exception as e:
-        return jsonify({'success': False, 'message': f'Erro: {str(e)}'})
+        # Status de erro: o navegador não pode salvar este JSON como se fosse o PDF
+        return jsonify({'success': False, 'message': f'Erro: {str(e)}'}), 500
 
-def desenhar_etiqueta_simples(c, x, y, width, height, dados):
-    from reportlab.lib.units import mm
-    from datetime import datetime
-    
-    # Desenhar borda externa
-    c.setStrokeColorRGB(0, 0, 0)
-    c.setLineWidth(1)
-    c.rect(x + 1*mm, y + 1*mm, width - 2*mm, height - 2*mm)
-    
-    # Título PU no canto superior esquerdo
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(x + 3*mm, y + height - 6*mm, "PU")
-    
-    # Data atual no canto superior direito
-    data_atual = datetime.now().strftime("%d/%m/%Y")
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(x + width - 25*mm, y + height - 6*mm, data_atual)
-    
-    # OP na linha principal (maior)
-    y_pos = y + height - 15*mm
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(x + 3*mm, y_pos, "OP:")
-    c.setFont("Helvetica-Bold", 24)
-    c.drawString(x + 15*mm, y_pos, f"{dados['OP']}")
-    
-    # CARRO (mais acima)
-    y_pos -= 6*mm
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(x + 3*mm, y_pos, "CARRO:")
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(x + 20*mm, y_pos, f"{dados['Veiculo']}")
-    
-    # ID na linha abaixo do carro (maior)
-    y_pos -= 6*mm
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(x + 3*mm, y_pos, "ID:")
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(x + 15*mm, y_pos, f"{dados['ID']}")
-    
-    # DESCRIÇÃO abaixo da camada (grande)
-    y_pos -= 8*mm
-    c.setFont("Helvetica-Bold", 22)
-    descricao = dados.get('Descricao', '')
-    if len(descricao) > 30:
-        descricao = descricao[:30] + '...'
-    c.drawString(x + 3*mm, y_pos, descricao)
-    
-    # Código de barras Code128
-    codigo_barras_texto = f"{dados['Peca']}{dados['OP']}"
-    
-    try:
-        import barcode
-        from barcode.writer import ImageWriter
-        import tempfile
-        import os
-        
-        # Configurar writer sem texto
-        writer = ImageWriter()
-        writer.quiet_zone = 3
-        writer.font_size = 0
-        writer.text_distance = 0
-        writer.write_text = False
-        
-        # Gerar código de barras Code128 sem texto
-        codigo_barras_obj = barcode.get('code128', codigo_barras_texto, writer=writer)
-        codigo_barras_obj.default_writer_options['write_text'] = False
-        
-        # Salvar código de barras temporariamente
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_barcode:
-            img_barcode = codigo_barras_obj.render()
-            img_barcode.save(tmp_barcode.name, 'PNG')
-            tmp_barcode.close()
-            
-            # Inserir código de barras na parte inferior ocupando toda a largura
-            c.drawImage(tmp_barcode.name, x + 2*mm, y + 1*mm, width=width-4*mm, height=10*mm)
-            
-            # Limpar arquivo temporário
-            try:
-                os.remove(tmp_barcode.name)
-            except:
-                pass
-                
-    except Exception as e:
-        # Fallback: texto simples se código de barras falhar
-        c.setFont("Courier", 8)
-        c.drawString(x + 3*mm, y + 3*mm, codigo_barras_texto)
+@jobs.tarefa('etiquetas_pdf')
+def _job_etiquetas_pdf(job, conn):
+    """PDF de um lote grande de etiquetas, desenhado em blocos por vários processos."""
+    dados = job.parametros.get('dados', [])
+    filename = f"etiquetas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    caminho = arquivos_temp.pdfs.caminho(filename)
+    with arquivos_temp.escrever_atomico(caminho) as f:
+        total = etiquetas_pdf.gerar_pdf_paralelo(dados, f, progresso=lambda feito, total: job.progresso(feito, total))
+    return {
+        'resultado': {
+            'success': True,
+            'message': f'{total} etiqueta(s) gerada(s) com sucesso!',
+            'download': True
+        },
+        'nome_arquivo': filename,
+        'caminho_arquivo': caminho
+    }
+
+def _reserva_slots_requisicao(conn):
+    """Contexto de reserva de slots da requisição atual (motor de ocupação + retenções)"""
+    if '_reserva_slots' not in g:
+        g._reserva_slots = ReservaSlots(conn)
+    return g._reserva_slots
 
-# Contador global para simular ocupação durante processamento
-contador_slots_temp = {}
+@app.teardown_request
+def finalizar_reserva_slots(exc=None):
+    reserva = g.pop('_reserva_slots', None)
+    if reserva is not None:
+        reserva.finalizar(sucesso=exc is None)
 
-def sugerir_local_armazenamento(tipo_peca, locais_ocupados, conn):
-    """Sugere slot baseado no tipo de peça e capacidade"""
-    global contador_slots_temp
+def sugerir_local_armazenamento(tipo_peca, locais_ocupados, conn, op=None, reter=True):
+    """Sugere slot baseado no tipo de peça e capacidade (regras em slots.MotorSlots).
     
+    Sugestões da mesma requisição se acumulam na reserva da requisição.
+    reter=False quando a peça é gravada na própria requisição.
+    """
     try:
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        # Buscar slots com limites da tabela pc_locais
-        cur.execute("SELECT local, limite FROM public.pc_locais WHERE status = 'Ativo' ORDER BY local")
-        slots_info = {row['local']: int(row['limite']) if row['limite'] else 6 for row in cur.fetchall()}
-        
-        # Contar ocupação atual (estoque + otimizadas)
-        cur.execute("""
-            SELECT local, COUNT(*) as total 
-            FROM (
-                SELECT local FROM public.pc_inventory WHERE local IS NOT NULL AND local != ''
-                UNION ALL
-                SELECT local FROM public.pc_otimizadas WHERE local IS NOT NULL AND local != '' AND tipo = 'PC'
-            ) as todos_locais
-            GROUP BY local
-        """)
-        ocupacao_atual = {row['local']: row['total'] for row in cur.fetchall()}
-        
-        # Somar com contador temporário
-        for slot, count in contador_slots_temp.items():
-            ocupacao_atual[slot] = ocupacao_atual.get(slot, 0) + count
+        reserva = _reserva_slots_requisicao(conn)
         
         # Verificar se o projeto+peça tem tamanho "GG" na tabela arquivos_pc
-        # Buscar projeto da peça atual (assumindo que está disponível no contexto)
-        projeto_atual = ''
-        try:
-            # Tentar buscar projeto da última peça processada
-            cur.execute("""
-                SELECT projeto FROM public.apontamento_pplug_jarinu 
-                WHERE item = %s 
-                ORDER BY data DESC LIMIT 1
-            """, (tipo_peca,))
-            projeto_result = cur.fetchone()
-            if projeto_result:
-                projeto_atual = projeto_result['projeto']
-        except:
-            pass
-        
-        cur.execute("""
-            SELECT tamanho_peca FROM public.arquivos_pc 
-            WHERE projeto = %s AND peca = %s AND tamanho_peca = 'GG'
-            LIMIT 1
-        """, (projeto_atual, tipo_peca))
-        tem_tamanho_gg = cur.fetchone() is not None
-        
-        # Definir slots permitidos por tipo
-        if tem_tamanho_gg:
-            # Peças com tamanho "GG" são exclusivas para slots 1-3
-            slots_permitidos = [f'SLOT {i}' for i in range(1, 4)]
-        elif tipo_peca in ['TSP', 'TSA', 'TSC', 'TSB', 'PBS', 'VGA']:
-            # Peças tamanho G: slots 4-40 e 81-117
-            slots_permitidos = [f'SLOT {i}' for i in range(4, 41)] + [f'SLOT {i}' for i in range(81, 118)]
-        elif tipo_peca in ['PDE', 'PDD', 'PTE', 'PTD', 'TME', 'TMD']:
-            # Slots específicos: 41-80 e 118-157
-            slots_permitidos = [f'SLOT {i}' for i in range(41, 81)] + [f'SLOT {i}' for i in range(118, 158)]
-        elif tipo_peca in ['FTE', 'FTD', 'QTD', 'QTE', 'QDD', 'QDE', 'FDD', 'FDE', 'CBE', 'CBD']:
-            # Slots 158-273
-            slots_permitidos = [f'SLOT {i}' for i in range(158, 274)]
-        else:
-            # Peças não categorizadas - usar slots para peças tamanho G
-            slots_permitidos = [f'SLOT {i}' for i in range(4, 41)] + [f'SLOT {i}' for i in range(81, 118)]
+        tem_tamanho_gg = tipo_peca in _pecas_tamanho_gg(cur, [tipo_peca])
         
-        # Regra especial para peças CBD e CBE (4 camadas)
-        if tipo_peca in ['CBD', 'CBE']:
-            print(f"DEBUG SLOT: Aplicando regra especial para peça {tipo_peca} (4 camadas)")
-            
-            # Primeiro, buscar slots vazios
-            for slot in slots_permitidos:
-                if slot in slots_info:
-                    ocupado = ocupacao_atual.get(slot, 0)
-                    
-                    if ocupado == 0:  # Slot vazio
-                        contador_slots_temp[slot] = contador_slots_temp.get(slot, 0) + 1
-                        print(f"DEBUG SLOT: Peça {tipo_peca} alocada em slot vazio {slot}")
-                        return slot, 'SLOT'
-            
-            # Se não encontrou slot vazio, buscar slots com apenas 1 peça
-            for slot in slots_permitidos:
-                if slot in slots_info:
-                    ocupado = ocupacao_atual.get(slot, 0)
-                    
-                    if ocupado == 1:  # Slot com apenas 1 peça
-                        contador_slots_temp[slot] = contador_slots_temp.get(slot, 0) + 1
-                        print(f"DEBUG SLOT: Peça {tipo_peca} alocada em slot com 1 peça {slot} (ocupação após: 2)")
-                        return slot, 'SLOT'
-            
-            # Se não encontrou slot vazio nem com 1 peça, não alocar
-            print(f"DEBUG SLOT: Peça {tipo_peca} não pode ser alocada - não há slots vazios ou com apenas 1 peça")
+        slot = reserva.sugerir(tipo_peca, tem_tamanho_gg, op=op, peca=tipo_peca, reter=reter)
+        if slot is None:
+            print(f"DEBUG SLOT: Todos os slots para {tipo_peca} estão cheios!")
             return None, None
         
-        # Lógica normal para outras peças
-        for slot in slots_permitidos:
-            if slot in slots_info:
-                limite = slots_info[slot]
-                ocupado = ocupacao_atual.get(slot, 0)
-                disponivel = limite - ocupado
-                
-                print(f"DEBUG SLOT: {slot} - Limite: {limite}, Ocupado: {ocupado}, Disponível: {disponivel}")
-                
-                if disponivel > 0:  # Tem espaço disponível
-                    contador_slots_temp[slot] = contador_slots_temp.get(slot, 0) + 1
-                    print(f"DEBUG SLOT: Selecionado {slot} (ocupação após: {ocupado + 1}/{limite})")
-                    return slot, 'SLOT'
-                else:
-                    print(f"DEBUG SLOT: {slot} está cheio ({ocupado}/{limite})")
-        
-        # Se chegou aqui, todos os slots estão cheios
-        print(f"DEBUG SLOT: Todos os slots para {tipo_peca} estão cheios!")
-        return None, None
+        print(f"DEBUG SLOT: Peça {tipo_peca} alocada em {slot} (ocupação após: {reserva.motor.ocupacao_de(slot)}/{reserva.motor.limite_de(slot)})")
+        return slot, 'SLOT'
         
+    except TravaSlotsError:
+        # Não é falta de slot: a requisição falha e o usuário tenta de novo
+        raise
     except Exception as e:
         print(f"DEBUG: Erro na sugestão: {e}")
         import traceback
         traceback.print_exc()
         return None, None
 
+def _travar_slots(conn, tipos_peca):
+    """Trava antes de alocar, de uma vez e em ordem, os grupos de slots das peças da requisição.
+
+    Retorna os tipos com tamanho GG (_pecas_tamanho_gg). Levanta TravaSlotsError.
+    """
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    tipos_peca = set(tipos_peca)
+    tipos_gg = _pecas_tamanho_gg(cur, tipos_peca)
+    _reserva_slots_requisicao(conn).travar(categoria_peca(tipo, tipo in tipos_gg) for tipo in tipos_peca)
+    return tipos_gg
+
+def _pecas_tamanho_gg(cur, tipos_peca):
+    """Versão em lote da verificação GG de sugerir_local_armazenamento: tipos de peça com tamanho GG"""
+    tipos_peca = list(tipos_peca)
+    if not tipos_peca:
+        return set()
+    
+    # Projeto da última peça apontada de cada tipo
+    projeto_por_tipo = {}
+    try:
+        cur.execute("""
+            SELECT DISTINCT ON (item) item, projeto
+            FROM public.apontamento_pplug_jarinu
+            WHERE item = ANY(%s)
+            ORDER BY item, data DESC
+        """, (tipos_peca,))
+        projeto_por_tipo = {row['item']: row['projeto'] for row in cur.fetchall()}
+    except Exception as e:
+        print(f"DEBUG SLOT: Erro ao buscar projetos apontados: {e}")
+        cur.connection.rollback()
+    
+    pares_gg = arquivos_corte.obter_indice(cur.connection).pares_gg
+    
+    return {
+        tipo for tipo in tipos_peca
+        if (str(projeto_por_tipo.get(tipo) or ''), str(tipo)) in pares_gg
+    }
+
+def _sensores_pbs_por_op(cur, ops):
+    """Sensor do item PBS de cada OP em dados_uso_geral.dados_op (ex: PBS_2 -> '2')"""
+    # dados_op.op é bigint: a OP vai como número para a consulta usar o índice de op
+    ops_por_numero = {}
+    for op in ops:
+        if op and str(op).strip().isdigit():
+            ops_por_numero.setdefault(int(str(op).strip()), set()).add(str(op))
+    if not ops_por_numero:
+        return {}
+    try:
+        cur.execute("""
+            SELECT DISTINCT ON (op) op, item
+            FROM dados_uso_geral.dados_op
+            WHERE op = ANY(%s::bigint[]) AND item LIKE 'PBS%%'
+        """, (sorted(ops_por_numero),))
+        sensores = {}
+        for row in cur.fetchall():
+            if '_' in str(row['item']):
+                for op in ops_por_numero[row['op']]:
+                    sensores[op] = str(row['item']).split('_')[-1]
+        return sensores
+    except Exception as pbs_error:
+        print(f"DEBUG SENSOR: Erro ao buscar sensores PBS: {pbs_error}")
+        cur.connection.rollback()
+        return {}
+
 @app.route('/api/adicionar-peca-manual', methods=['POST'])
 def adicionar_peca_manual():
-    global contador_slots_temp
-    contador_slots_temp = {}  # Limpar contador no início de cada operação
-    
     dados = request.get_json()
     op = dados.get('op', '').strip()
     peca = dados.get('peca', '').strip()
@@ -851,10 +776,9 @@ def adicionar_peca_manual():
     
     try:
         conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
         
         # Sugerir local com contador limpo
-        local_sugerido, rack_sugerido = sugerir_local_armazenamento(peca, set(), conn)
+        local_sugerido, rack_sugerido = sugerir_local_armazenamento(peca, set(), conn, op=op)
         
         if local_sugerido is None:
             conn.close()
@@ -865,45 +789,9 @@ def adicionar_peca_manual():
         
         print(f"DEBUG MANUAL: Buscando arquivo para projeto='{projeto}', peca='{peca}', sensor_original='{sensor}', sensor_busca='{sensor_busca}'")
         
-        # Buscar arquivo com sensor exato primeiro
-        cur.execute("""
-            SELECT nome_peca FROM public.arquivos_pc
-            WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-            AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-            AND UPPER(TRIM(CAST(sensor AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-            ORDER BY id DESC
-            LIMIT 1
-        """, (str(projeto), str(peca), str(sensor_busca)))
-        
-        arquivo_result = cur.fetchone()
-        print(f"DEBUG MANUAL: Busca por sensor exato '{sensor_busca}': {arquivo_result}")
-        
-        # Se não encontrou com sensor exato, buscar por nome_peca que contenha o sensor
-        if not arquivo_result:
-            cur.execute("""
-                SELECT nome_peca FROM public.arquivos_pc
-                WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                AND nome_peca LIKE %s
-                ORDER BY id DESC
-                LIMIT 1
-            """, (str(projeto), str(peca), f'%_{sensor_busca}'))
-            arquivo_result = cur.fetchone()
-            print(f"DEBUG MANUAL: Busca por nome com sensor '{sensor_busca}': {arquivo_result}")
-        
-        # Se ainda não encontrou, buscar qualquer arquivo da peça
-        if not arquivo_result:
-            cur.execute("""
-                SELECT nome_peca FROM public.arquivos_pc
-                WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                ORDER BY id DESC
-                LIMIT 1
-            """, (str(projeto), str(peca)))
-            arquivo_result = cur.fetchone()
-            print(f"DEBUG MANUAL: Busca genérica: {arquivo_result}")
-        
-        print(f"DEBUG MANUAL: Resultado final: {arquivo_result}")
+        # Sensor exato -> nome com sensor -> qualquer arquivo da peça (índice em memória)
+        arquivo_result, tipo_busca = arquivos_corte.obter_indice(conn).resolver(projeto, peca, sensor_busca)
+        print(f"DEBUG MANUAL: Resultado final ({tipo_busca}): {arquivo_result}")
         arquivo_status = arquivo_result['nome_peca'] if arquivo_result else 'Sem arquivo de corte'
         
         conn.close()
@@ -923,12 +811,31 @@ def adicionar_peca_manual():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro: {str(e)}'})
 
+def _pecas_ja_cadastradas(cur, chaves):
+    """Das chaves (op, peca) da planilha, as que já estão em pc_inventory ou em pc_otimizadas (PC)."""
+    if not chaves:
+        return set()
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS tmp_importar_pecas (
+            op TEXT, peca TEXT
+        ) ON COMMIT DROP
+    """)
+    carga_bulk.copiar(cur, 'tmp_importar_pecas', ('op', 'peca'), chaves)
+    cur.execute("ANALYZE tmp_importar_pecas")
+    cur.execute("""
+        SELECT DISTINCT c.op, c.peca FROM tmp_importar_pecas c
+        WHERE EXISTS (
+            SELECT 1 FROM public.pc_inventory i WHERE i.op = c.op AND i.peca = c.peca
+        )
+        OR EXISTS (
+            SELECT 1 FROM public.pc_otimizadas o WHERE o.op = c.op AND o.peca = c.peca AND o.tipo = 'PC'
+        )
+    """)
+    return {(row[0], row[1]) for row in cur.fetchall()}
+
 @app.route('/api/importar-excel-pecas', methods=['POST'])
 @login_required
 def importar_excel_pecas():
-    global contador_slots_temp
-    contador_slots_temp = {}  # Limpar contador no início de cada importação
-    
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'message': 'Nenhum arquivo enviado'})
@@ -951,6 +858,13 @@ def importar_excel_pecas():
         
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        indice_arquivos = arquivos_corte.obter_indice(conn)
+        
+        # Duplicatas (já no estoque ou otimizadas como PC) verificadas de uma vez para a planilha toda
+        ja_cadastradas = _pecas_ja_cadastradas(cur, [
+            (str(op).strip(), str(peca).strip()) for op, peca in zip(df['OP'], df['PECA'])
+        ])
+        _travar_slots(conn, {str(peca).strip() for peca in df['PECA']})
         
         pecas_processadas = []
         
@@ -971,16 +885,11 @@ def importar_excel_pecas():
                 continue
             
             # Verificar duplicatas
-            cur.execute("SELECT COUNT(*) FROM public.pc_inventory WHERE op = %s AND peca = %s", (op, peca))
-            if cur.fetchone()[0] > 0:
-                continue
-            
-            cur.execute("SELECT COUNT(*) FROM public.pc_otimizadas WHERE op = %s AND peca = %s AND tipo = 'PC'", (op, peca))
-            if cur.fetchone()[0] > 0:
+            if (op, peca) in ja_cadastradas:
                 continue
             
             # Sugerir local com contador limpo
-            local_sugerido, rack_sugerido = sugerir_local_armazenamento(peca, set(), conn)
+            local_sugerido, rack_sugerido = sugerir_local_armazenamento(peca, set(), conn, op=op)
             
             if local_sugerido is None:
                 # Pular esta peça se não há slot disponível
@@ -991,44 +900,9 @@ def importar_excel_pecas():
             
             print(f"DEBUG EXCEL: Buscando arquivo para projeto='{projeto}', peca='{peca}', sensor_original='{sensor}', sensor_busca='{sensor_busca}'")
             
-            # Buscar arquivo com sensor exato primeiro
-            cur.execute("""
-                SELECT nome_peca FROM public.arquivos_pc
-                WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                AND UPPER(TRIM(CAST(sensor AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                ORDER BY id DESC
-                LIMIT 1
-            """, (str(projeto), str(peca), str(sensor_busca)))
-            
-            arquivo_result = cur.fetchone()
-            print(f"DEBUG EXCEL: Busca por sensor exato '{sensor_busca}': {arquivo_result}")
-            
-            # Se não encontrou com sensor exato, buscar por nome_peca que contenha o sensor
-            if not arquivo_result:
-                cur.execute("""
-                    SELECT nome_peca FROM public.arquivos_pc
-                    WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                    AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                    AND nome_peca LIKE %s
-                    ORDER BY id DESC
-                    LIMIT 1
-                """, (str(projeto), str(peca), f'%_{sensor_busca}'))
-                arquivo_result = cur.fetchone()
-                print(f"DEBUG EXCEL: Busca por nome com sensor '{sensor_busca}': {arquivo_result}")
-            
-            # Se ainda não encontrou, buscar qualquer arquivo da peça
-            if not arquivo_result:
-                cur.execute("""
-                    SELECT nome_peca FROM public.arquivos_pc
-                    WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                    AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                    ORDER BY id DESC
-                    LIMIT 1
-                """, (str(projeto), str(peca)))
-                arquivo_result = cur.fetchone()
-                print(f"DEBUG EXCEL: Busca genérica: {arquivo_result}")
-            print(f"DEBUG EXCEL: Resultado final: {arquivo_result}")
+            # Sensor exato -> nome com sensor -> qualquer arquivo da peça (índice em memória)
+            arquivo_result, tipo_busca = indice_arquivos.resolver(projeto, peca, sensor_busca)
+            print(f"DEBUG EXCEL: Resultado final ({tipo_busca}): {arquivo_result}")
             arquivo_status = arquivo_result['nome_peca'] if arquivo_result else 'Sem arquivo de corte'
             
             peca_data = {
@@ -1052,6 +926,8 @@ def importar_excel_pecas():
             'total': len(pecas_processadas)
         })
         
+    except TravaSlotsError as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao processar Excel: {str(e)}'}), 500
 
@@ -1059,9 +935,6 @@ def importar_excel_pecas():
 
 @app.route('/api/dados')
 def api_dados():
-    global contador_slots_temp
-    contador_slots_temp = {}  # Limpar contador no início de cada coleta
-    
     lote = request.args.get('lote')
     
     print(f"DEBUG: Buscando dados - lote: {lote}")
@@ -1077,10 +950,6 @@ def api_dados():
         cur.execute("SELECT op, peca FROM public.pc_otimizadas WHERE tipo = 'PC'")
         pecas_otimizadas = cur.fetchall()
         
-        # Buscar locais ocupados
-        cur.execute("SELECT local FROM public.pc_inventory UNION SELECT local FROM public.pc_otimizadas WHERE tipo = 'PC'")
-        locais_ocupados = {row['local'] for row in cur.fetchall() if row['local']}
-        
         # Criar set para busca rápida
         pecas_existentes = {f"{row['op']}_{row['peca']}" for row in pecas_estoque}
         pecas_existentes.update({f"{row['op']}_{row['peca']}" for row in pecas_otimizadas})
@@ -1112,111 +981,84 @@ def api_dados():
         
         # Não atualizar status na coleta - apenas quando otimizar
         
-        # Processar dados do banco com verificação de duplicatas
+        # Selecionar peças novas (sem duplicatas e fora do estoque/otimizadas)
+        pecas_novas = []
+        pecas_processadas = set()  # Para evitar duplicatas no processamento
+        for row in dados_banco:
+            chave_peca = f"{row['op']}_{row['peca']}"
+            if chave_peca in pecas_processadas or chave_peca in pecas_existentes:
+                continue
+            pecas_processadas.add(chave_peca)
+            pecas_novas.append(row)
+        
+        # Pré-carregar em lote tudo que antes era consultado linha a linha:
+        # slots/ocupação, peças GG, sensores PBS e arquivos de corte
+        reserva_slots = _reserva_slots_requisicao(conn)
+        tipos_gg = _travar_slots(conn, {row['peca'] for row in pecas_novas})
+        sensores_pbs = _sensores_pbs_por_op(cur, [
+            row['op'] for row in pecas_novas
+            if not (row['sensor'] and str(row['sensor']).strip() != '-')
+        ])
+        indice_arquivos = arquivos_corte.obter_indice(conn)
+        
+        # Processar dados em memória
         dados_filtrados = []
         pecas_sem_local = []  # Lista para peças que não têm local disponível
-        pecas_processadas = set()  # Para evitar duplicatas no processamento
         
-        for row in dados_banco:
+        for row in pecas_novas:
             try:
-                chave_peca = f"{row['op']}_{row['peca']}"
+                # Aplicar lógica de sugestão
+                local_sugerido = reserva_slots.sugerir(row['peca'], row['peca'] in tipos_gg, op=row['op'], peca=row['peca'])
+                rack_sugerido = 'SLOT' if local_sugerido else None
                 
-                # Verificar se já processamos esta peça
-                if chave_peca in pecas_processadas:
-                    continue
-                    
-                if chave_peca not in pecas_existentes:
-                    pecas_processadas.add(chave_peca)  # Marcar como processada
-                    # Aplicar lógica de sugestão
-                    local_sugerido, rack_sugerido = sugerir_local_armazenamento(row['peca'], locais_ocupados, conn)
-                    
-                    # Se não há slot disponível, adicionar à lista de peças sem local
-                    if local_sugerido is None:
-                        peca_sem_local = {
-                            'op': str(row['op']) if row['op'] else '',
-                            'peca': str(row['peca']) if row['peca'] else '',
-                            'projeto': str(row['projeto']) if row['projeto'] else '',
-                            'veiculo': str(row['veiculo']) if row['veiculo'] else '',
-                            'sensor': str(row['sensor']) if row['sensor'] else '',
-                            'motivo': 'Não há slots disponíveis'
-                        }
-                        pecas_sem_local.append(peca_sem_local)
-                        continue
-                    
-                    # Verificar se existe arquivo de corte e buscar nome com sensor correto
-                    sensor_busca = str(row['sensor']) if row['sensor'] and str(row['sensor']).strip() != '-' else None
-                    
-                    # Se não encontrou sensor, buscar na tabela dados_uso_geral.dados_op
-                    if not sensor_busca:
-                        try:
-                            print(f"DEBUG SENSOR: Buscando PBS para OP {row['op']}")
-                            cur.execute("""
-                                SELECT item FROM dados_uso_geral.dados_op 
-                                WHERE op = %s AND item LIKE 'PBS%'
-                                LIMIT 1
-                            """, (row['op'],))
-                            pbs_result = cur.fetchone()
-                            print(f"DEBUG SENSOR: Resultado PBS: {pbs_result}")
-                            if pbs_result:
-                                # Extrair sensor do item PBS (ex: PBS_2 -> sensor 2)
-                                pbs_item = pbs_result['item']
-                                print(f"DEBUG SENSOR: Item PBS encontrado: {pbs_item}")
-                                if '_' in str(pbs_item):
-                                    sensor_busca = str(pbs_item).split('_')[-1]
-                                    print(f"DEBUG SENSOR: Sensor extraído: {sensor_busca}")
-                        except Exception as pbs_error:
-                            print(f"DEBUG SENSOR: Erro ao buscar sensor PBS: {pbs_error}")
-                    
-                    # Se ainda não encontrou, usar padrão '1'
-                    if not sensor_busca:
-                        sensor_busca = '1'
-                    
-                    print(f"DEBUG ARQUIVO: Buscando arquivo para projeto='{row['projeto']}', peca='{row['peca']}', sensor='{sensor_busca}'")
-                    
-                    # Buscar arquivo com sensor exato na coluna sensor
-                    cur.execute("""
-                        SELECT nome_peca FROM public.arquivos_pc
-                        WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                        AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                        AND UPPER(TRIM(CAST(sensor AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                        ORDER BY id DESC
-                        LIMIT 1
-                    """, (str(row['projeto']) if row['projeto'] else '', str(row['peca']) if row['peca'] else '', sensor_busca))
-                    
-                    arquivo_result = cur.fetchone()
-                    
-                    # Se não encontrou com sensor exato, buscar qualquer arquivo da peça
-                    if not arquivo_result:
-                        cur.execute("""
-                            SELECT nome_peca FROM public.arquivos_pc
-                            WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                            AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                            ORDER BY id DESC
-                            LIMIT 1
-                        """, (str(row['projeto']) if row['projeto'] else '', str(row['peca']) if row['peca'] else ''))
-                        arquivo_result = cur.fetchone()
-                    
-                    print(f"DEBUG ARQUIVO: Resultado encontrado: {arquivo_result}")
-                    arquivo_status = arquivo_result['nome_peca'] if arquivo_result else 'Sem arquivo de corte'
-                    
-                    # Converter lote VD para PC
-                    lote_vd = str(row['id_lote']) if row['id_lote'] else ''
-                    lote_pc = lote_vd.replace('VD', 'PC') if lote_vd else ''
-                    
-                    item = {
+                # Se não há slot disponível, adicionar à lista de peças sem local
+                if local_sugerido is None:
+                    peca_sem_local = {
                         'op': str(row['op']) if row['op'] else '',
                         'peca': str(row['peca']) if row['peca'] else '',
                         'projeto': str(row['projeto']) if row['projeto'] else '',
                         'veiculo': str(row['veiculo']) if row['veiculo'] else '',
-                        'local': local_sugerido or '',
-                        'rack': rack_sugerido or '',
-                        'arquivo_status': arquivo_status,
                         'sensor': str(row['sensor']) if row['sensor'] else '',
-                        'lote_vd': lote_vd,
-                        'lote_pc': lote_pc
+                        'motivo': 'Não há slots disponíveis'
                     }
-                    
-                    dados_filtrados.append(item)
+                    pecas_sem_local.append(peca_sem_local)
+                    continue
+                
+                # Verificar se existe arquivo de corte e buscar nome com sensor correto
+                sensor_busca = str(row['sensor']) if row['sensor'] and str(row['sensor']).strip() != '-' else None
+                
+                # Se não encontrou sensor, usar o do PBS da OP (dados_uso_geral.dados_op) ou padrão '1'
+                if not sensor_busca:
+                    sensor_busca = sensores_pbs.get(str(row['op']), '1')
+                
+                # Arquivo com sensor exato; senão qualquer arquivo da peça
+                arquivo_status = indice_arquivos.nome_arquivo(
+                    row['projeto'] if row['projeto'] else '',
+                    row['peca'] if row['peca'] else '',
+                    sensor_busca,
+                    por_nome=False
+                )
+                
+                # Converter lote VD para PC
+                lote_vd = str(row['id_lote']) if row['id_lote'] else ''
+                lote_pc = lote_vd.replace('VD', 'PC') if lote_vd else ''
+                
+                item = {
+                    'op': str(row['op']) if row['op'] else '',
+                    'peca': str(row['peca']) if row['peca'] else '',
+                    'projeto': str(row['projeto']) if row['projeto'] else '',
+                    'veiculo': str(row['veiculo']) if row['veiculo'] else '',
+                    'local': local_sugerido or '',
+                    'rack': rack_sugerido or '',
+                    'arquivo_status': arquivo_status,
+                    'sensor': str(row['sensor']) if row['sensor'] else '',
+                    'lote_vd': lote_vd,
+                    'lote_pc': lote_pc
+                }
+                
+                dados_filtrados.append(item)
+            except TravaSlotsError:
+                raise
             except Exception as row_error:
                 print(f"DEBUG: Erro ao processar linha: {row_error}")
                 continue
@@ -1231,44 +1073,141 @@ def api_dados():
             'total_sem_local': len(pecas_sem_local)
         })
         
+    except TravaSlotsError as e:
+        print(f"DEBUG: Erro na API dados: {str(e)}")
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         print(f"DEBUG: Erro na API dados: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Erro ao buscar dados: {str(e)}'}), 500
 
-@app.route('/api/estoque')
-def api_estoque():
+# Listagens com filtro/ordenação/paginação por cursor (consultas.py)
+LISTAGEM_ESTOQUE = consultas.Listagem(
+    'public.pc_inventory',
+    'id, op, peca, projeto, veiculo, local, sensor, camada, lote_pc',
+    ordenaveis={'op': 'op', 'peca': 'peca', 'projeto': 'projeto', 'veiculo': 'veiculo',
+                'local': 'local', 'sensor': 'sensor', 'lote_pc': 'lote_pc', 'data': 'data'},
+    filtros={'op': 'op', 'peca': 'peca', 'projeto': 'projeto', 'veiculo': 'veiculo',
+             'local': 'local', 'sensor': 'sensor', 'lote_pc': 'lote_pc'},
+    busca=('op', 'peca', 'projeto', 'veiculo', 'local', 'sensor', 'camada', 'lote_pc'),
+    coluna_data='data'
+)
+
+LISTAGEM_OTIMIZADAS = consultas.Listagem(
+    'public.pc_otimizadas',
+    'id, op, peca, projeto, veiculo, local, cortada, user_otimizacao, data_corte, sensor, camada, lote_pc',
+    ordenaveis={'op': 'op', 'peca': 'peca', 'projeto': 'projeto', 'veiculo': 'veiculo', 'local': 'local',
+                'lote_pc': 'lote_pc', 'data_corte': 'data_corte', 'data': 'data_otimizacao'},
+    filtros={'op': 'op', 'peca': 'peca', 'projeto': 'projeto', 'veiculo': 'veiculo',
+             'local': 'local', 'sensor': 'sensor', 'lote_pc': 'lote_pc'},
+    busca=('op', 'peca', 'projeto', 'veiculo', 'local', 'sensor', 'camada', 'lote_pc', 'user_otimizacao'),
+    coluna_data='data_otimizacao',
+    condicao_fixa="tipo = 'PC'"
+)
+
+LISTAGEM_SAIDAS = consultas.Listagem(
+    'public.pc_exit',
+    'id, op, peca, projeto, veiculo, local, usuario, data',
+    ordenaveis={'op': 'op', 'peca': 'peca', 'projeto': 'projeto', 'veiculo': 'veiculo',
+                'local': 'local', 'usuario': 'usuario', 'data': 'data'},
+    filtros={'op': 'op', 'peca': 'peca', 'projeto': 'projeto', 'veiculo': 'veiculo',
+             'local': 'local', 'usuario': 'usuario'},
+    # Mesma busca da tela: inclui o código da etiqueta (peça + OP + 'PC') e a data formatada
+    busca=('op', 'peca', 'projeto', 'veiculo', 'local', 'usuario',
+           "CONCAT(peca, op, 'PC')", "TO_CHAR(data, 'DD/MM/YYYY HH24:MI')"),
+    coluna_data='data',
+    ordem_padrao=('data', 'desc')
+)
+
+LISTAGEM_BAIXAS = consultas.Listagem(
+    'public.pc_baixas',
+    'id, op, peca, projeto, veiculo, sensor, motivo_baixa, data_baixa, status, usuario_apontamento, data_criacao',
+    ordenaveis={'op': 'op', 'peca': 'peca', 'projeto': 'projeto', 'veiculo': 'veiculo', 'status': 'status',
+                'motivo_baixa': 'motivo_baixa', 'data_baixa': 'data_baixa', 'data': 'data_criacao'},
+    filtros={'op': 'op', 'peca': 'peca', 'projeto': 'projeto', 'veiculo': 'veiculo',
+             'sensor': 'sensor', 'status': 'status', 'motivo_baixa': 'motivo_baixa'},
+    busca=('op', 'peca', 'projeto', 'veiculo', 'sensor', 'motivo_baixa', 'status', 'usuario_apontamento'),
+    coluna_data='data_criacao',
+    ordem_padrao=('data', 'desc')
+)
+
+LISTAGEM_LOGS = consultas.Listagem(
+    'public.pc_logs',
+    'id, usuario, acao, detalhes, data_acao',
+    ordenaveis={'usuario': 'usuario', 'acao': 'acao', 'data': 'data_acao'},
+    filtros={'usuario': 'usuario', 'acao': 'acao'},
+    busca=('usuario', 'acao', 'detalhes'),
+    coluna_data='data_acao',
+    ordem_padrao=('data', 'desc')
+)
+
+RELATORIO_OTIMIZACAO = exportacao.Relatorio('otimizacao', [
+    ('op', 'OP'), ('peca', 'PEÇA'), ('projeto', 'PROJETO'), ('veiculo', 'VEÍCULO'),
+    ('local', 'LOCAL'), ('rack', 'RACK'), ('tipo_programacao', 'TIPO PROGRAMAÇÃO'),
+])
+RELATORIO_ESTOQUE = exportacao.Relatorio('estoque', [
+    ('op', 'OP'), ('peca', 'PEÇA'), ('projeto', 'PROJETO'), ('veiculo', 'VEÍCULO'),
+    ('local', 'LOCAL'), ('sensor', 'SENSOR'), ('camada', 'CAMADA'), ('lote_pc', 'LOTE PC'),
+])
+RELATORIO_OTIMIZADAS = exportacao.Relatorio('pecas_otimizadas', [
+    ('op', 'OP'), ('peca', 'PEÇA'), ('projeto', 'PROJETO'), ('veiculo', 'VEÍCULO'), ('local', 'LOCAL'),
+    ('sensor', 'SENSOR'), ('camada', 'CAMADA'), ('lote_pc', 'LOTE PC'), ('data_corte', 'DATA CORTE'),
+])
+RELATORIO_SAIDAS = exportacao.Relatorio('saidas', [
+    ('op', 'OP'), ('peca', 'PEÇA'), ('projeto', 'PROJETO'), ('veiculo', 'VEÍCULO'), ('local', 'LOCAL'),
+    ('usuario', 'USUÁRIO'), ('data', 'DATA SAÍDA', exportacao.data_br),
+])
+RELATORIO_BAIXAS = exportacao.Relatorio('baixas', [
+    ('op', 'OP'), ('peca', 'PEÇA'), ('projeto', 'PROJETO'), ('veiculo', 'VEÍCULO'), ('sensor', 'SENSOR'),
+    ('motivo_baixa', 'MOTIVO'), ('data_baixa', 'DATA BAIXA'), ('status', 'STATUS'),
+    ('usuario_apontamento', 'APONTADO POR'), ('data_criacao', 'DATA REGISTRO', exportacao.data_hora_br),
+])
+RELATORIO_LOGS = exportacao.Relatorio('logs', [
+    ('usuario', 'USUÁRIO'), ('acao', 'AÇÃO'), ('detalhes', 'DETALHES'),
+    ('data_acao', 'DATA AÇÃO', exportacao.data_hora_br),
+])
+
+def _exportar_listagem(listagem, relatorio):
+    """Todas as linhas da listagem, com os filtros da tela (query string ou form), no formato pedido"""
+    formato = exportacao.formato_pedido(request)
+    sql, params = listagem.consulta_completa(request.values)
+    linhas = exportacao.linhas_da_consulta(sql, params, cursor_factory=psycopg2.extras.DictCursor)
+    return exportacao.resposta(relatorio, linhas, formato)
+
+def _resposta_listagem(listagem, formatar):
+    """Lista completa (formato antigo) ou {'dados': [...], 'paginacao': {...}} quando há limite/cursor"""
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        # Buscar todos os dados
-        cur.execute("""
-            SELECT id, op, peca, projeto, veiculo, local, sensor, camada, lote_pc
-            FROM public.pc_inventory
-            ORDER BY id DESC
-        """)
-        dados = cur.fetchall()
+        linhas, paginacao = listagem.buscar(cur, request.args)
+    finally:
         conn.close()
-        
-        resultado = []
-        for row in dados:
-            resultado.append({
-                'id': row['id'],
-                'op': row['op'] or '',
-                'peca': row['peca'] or '',
-                'projeto': row['projeto'] or '',
-                'veiculo': row['veiculo'] or '',
-                'local': row['local'] or '',
-                'sensor': row['sensor'] or '',
-                'camada': row['camada'] or '',
-                'lote_pc': row['lote_pc'] or ''
-            })
-        
-        print(f"DEBUG: Retornando {len(resultado)} itens do estoque")
+    
+    resultado = [formatar(row) for row in linhas]
+    if paginacao is None:
         return jsonify(resultado)
-        
+    return jsonify({'dados': resultado, 'paginacao': paginacao})
+
+def _formatar_item_estoque(row):
+    return {
+        'id': row['id'],
+        'op': row['op'] or '',
+        'peca': row['peca'] or '',
+        'projeto': row['projeto'] or '',
+        'veiculo': row['veiculo'] or '',
+        'local': row['local'] or '',
+        'sensor': row['sensor'] or '',
+        'camada': row['camada'] or '',
+        'lote_pc': row['lote_pc'] or ''
+    }
+
+@app.route('/api/estoque')
+def api_estoque():
+    try:
+        return _resposta_listagem(LISTAGEM_ESTOQUE, _formatar_item_estoque)
+    except consultas.ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"ERRO na API estoque: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1282,6 +1221,50 @@ def estoque_data():
     conn.close()
     return jsonify([dict(row) for row in dados])
 
+def _linhas_otimizacao(peca, camadas_result):
+    """(peca_atual, camada_id) que uma peça gera em pc_otimizadas.
+    
+    Peças especiais de pc_camadas ("TSA - TSB") substituem a peça original; cada camada
+    com quantidade N gera N linhas (L4_01, L4_02...). Sem pc_camadas: uma linha sem camada.
+    """
+    linhas = []
+    for peca_atual in plano_xml.pecas_especiais(peca, camadas_result):
+        if not camadas_result:
+            linhas.append((peca_atual, None))
+            continue
+        for camada, quantidade_camada in plano_xml.quantidades_camadas(camadas_result):
+            for i in range(quantidade_camada):
+                camada_id = f"{camada}_{i+1:02d}" if quantidade_camada > 1 else camada
+                linhas.append((peca_atual, camada_id))
+    return linhas
+
+def _chaves_otimizacao_novas(cur, chaves):
+    """Das chaves (op, peca, camada) candidatas, as que não estão em pc_inventory nem em pc_otimizadas.
+    
+    camada '' representa peça sem camada (NULL ou vazio no banco).
+    """
+    if not chaves:
+        return set()
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS tmp_otimizar_chaves (
+            op TEXT, peca TEXT, camada TEXT
+        ) ON COMMIT DROP
+    """)
+    psycopg2.extras.execute_values(cur, "INSERT INTO tmp_otimizar_chaves (op, peca, camada) VALUES %s", chaves, page_size=1000)
+    cur.execute("ANALYZE tmp_otimizar_chaves")
+    cur.execute("""
+        SELECT c.op, c.peca, c.camada FROM tmp_otimizar_chaves c
+        WHERE NOT EXISTS (
+            SELECT 1 FROM public.pc_inventory i
+            WHERE i.op = c.op AND i.peca = c.peca AND COALESCE(i.camada, '') = c.camada
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM public.pc_otimizadas o
+            WHERE o.op = c.op AND o.peca = c.peca AND COALESCE(o.camada, '') = c.camada AND o.tipo = 'PC'
+        )
+    """)
+    return {(row[0], row[1], row[2]) for row in cur.fetchall()}
+
 @app.route('/api/otimizar-pecas', methods=['POST'])
 @login_required
 def otimizar_pecas():
@@ -1308,156 +1291,58 @@ def otimizar_pecas():
                 'allow_retry': True
             })
         
-        # Criar tabelas se não existirem
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS public.pc_otimizadas (
-                id SERIAL PRIMARY KEY,
-                op_pai TEXT,
-                op TEXT,
-                peca TEXT,
-                projeto TEXT,
-                veiculo TEXT,
-                local TEXT,
-                rack TEXT,
-                cortada BOOLEAN DEFAULT FALSE,
-                user_otimizacao TEXT,
-                data_otimizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                tipo TEXT DEFAULT 'PC',
-                camada TEXT
-            )
-        """)
-        
-        # Adicionar colunas se não existirem
-        try:
-            cur.execute("ALTER TABLE public.pc_otimizadas ADD COLUMN IF NOT EXISTS tipo TEXT DEFAULT 'PC'")
-            cur.execute("ALTER TABLE public.pc_otimizadas ADD COLUMN IF NOT EXISTS camada TEXT")
-            cur.execute("ALTER TABLE public.pc_otimizadas ADD COLUMN IF NOT EXISTS sensor TEXT")
-        except:
-            pass
-        
-        total_inseridas = 0
-        
-        # Inserir cada peça selecionada quebrada por camadas
+        # Expandir em memória peça -> peças especiais -> camadas -> quantidade
+        camadas_por_peca = plano_xml.carregar_camadas(cur, [
+            (peca.get('projeto', ''), peca['peca']) for peca in pecas_selecionadas
+        ])
+        linhas = []
+        chaves_vistas = set()
         for peca in pecas_selecionadas:
-            print(f"DEBUG: Processando peça {peca['peca']}")
-            
-            # Buscar todas as camadas da peça na tabela pc_camadas
-            cur.execute("""
-                SELECT * FROM public.pc_camadas 
-                WHERE projeto = %s AND peca = %s
-            """, (peca.get('projeto', ''), peca['peca']))
-            
-            camadas_result = cur.fetchone()
-            print(f"DEBUG: Resultado camadas para peça {peca['peca']}: {camadas_result}")
-            
-            # Verificar se há peças especiais definidas na tabela pc_camadas
-            pecas_para_processar = [peca['peca']]  # Padrão: peça original
-            
-            if camadas_result and camadas_result.get('pecas_especiais'):
-                pecas_especiais_str = camadas_result['pecas_especiais'].strip()
-                if pecas_especiais_str and pecas_especiais_str != '-':
-                    # Parse do formato "TSA - TSB" -> ['TSA', 'TSB']
-                    pecas_especiais_db = [p.strip() for p in pecas_especiais_str.split('-') if p.strip()]
-                    pecas_para_processar = pecas_especiais_db  # Usar as peças especiais da DB
-                    print(f"DEBUG: Peças especiais encontradas: {pecas_especiais_db}")
-            
-            print(f"DEBUG: Peças que serão processadas: {pecas_para_processar}")
-            
-            # Processar cada peça (original ou especiais)
-            for peca_atual in pecas_para_processar:
-                print(f"DEBUG: Processando peça: {peca_atual}")
-                
-                if camadas_result:
-                    # Processar apenas colunas específicas de camadas conhecidas
-                    colunas_camadas_conhecidas = ['l3', 'l3_b', 'l4', 'l5', 'l6', 'l7', 'l8']
-                    colunas_encontradas = [col for col in camadas_result.keys() if col in colunas_camadas_conhecidas]
-                    
-                    for coluna in colunas_encontradas:
-                        valor_camada = camadas_result[coluna]
-                        # Processar apenas se existir e for diferente de "-" ou vazio
-                        if valor_camada and str(valor_camada).strip() not in ['-', '', 'None', 'NULL', 'null']:
-                            try:
-                                quantidade_camada = int(float(str(valor_camada)))
-                                if quantidade_camada <= 0:
-                                    continue
-                            except (ValueError, TypeError):
-                                quantidade_camada = 1
-                            
-                            # Inserir múltiplas linhas baseado na quantidade da camada
-                            for i in range(quantidade_camada):
-                                # Verificar duplicata antes de inserir (considerando índice da quantidade)
-                                camada_id = f"{coluna.upper()}_{i+1:02d}" if quantidade_camada > 1 else coluna.upper()
-                                
-                                cur.execute("SELECT COUNT(*) FROM public.pc_inventory WHERE op = %s AND peca = %s AND camada = %s", (peca['op'], peca_atual, camada_id))
-                                if cur.fetchone()[0] > 0:
-                                    print(f"DEBUG: Peça {peca_atual} OP {peca['op']} camada {camada_id} já existe no estoque, pulando")
-                                    continue
-                                
-                                cur.execute("SELECT COUNT(*) FROM public.pc_otimizadas WHERE op = %s AND peca = %s AND camada = %s AND tipo = 'PC'", (peca['op'], peca_atual, camada_id))
-                                if cur.fetchone()[0] > 0:
-                                    print(f"DEBUG: Peça {peca_atual} OP {peca['op']} camada {camada_id} já existe nas otimizadas, pulando")
-                                    continue
-                            
-                                cur.execute("""
-                                    INSERT INTO public.pc_otimizadas (op, peca, projeto, veiculo, sensor, local, rack, user_otimizacao, tipo, camada, lote_vd, lote_pc, data_corte)
-                                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                                """, (
-                                    peca['op'],
-                                    peca_atual,  # Usar a peça atual (pode ser especial)
-                                    peca.get('projeto', ''),
-                                    peca['veiculo'],
-                                    peca.get('sensor', ''),
-                                    peca['local'],
-                                    peca['rack'],
-                                    current_user.username,
-                                    'PC',
-                                    camada_id,
-                                    peca.get('lote_vd', ''),
-                                    peca.get('lote_pc', ''),
-                                    peca.get('data_corte')
-                                ))
-                                total_inseridas += 1
-                                print(f"DEBUG: Inserida linha {peca_atual} {camada_id} ({i+1}/{quantidade_camada})")
-                else:
-                    print(f"DEBUG: Nenhuma camada encontrada para {peca_atual}, inserindo sem camada")
-                    # Se não encontrou camadas, inserir como antes (sem camada)
-                    # Verificar duplicata antes de inserir
-                    cur.execute("SELECT COUNT(*) FROM public.pc_inventory WHERE op = %s AND peca = %s AND (camada IS NULL OR camada = '')", (peca['op'], peca_atual))
-                    if cur.fetchone()[0] > 0:
-                        print(f"DEBUG: Peça {peca_atual} OP {peca['op']} sem camada já existe no estoque, pulando")
-                        continue
-                    
-                    cur.execute("SELECT COUNT(*) FROM public.pc_otimizadas WHERE op = %s AND peca = %s AND (camada IS NULL OR camada = '') AND tipo = 'PC'", (peca['op'], peca_atual))
-                    if cur.fetchone()[0] > 0:
-                        print(f"DEBUG: Peça {peca_atual} OP {peca['op']} sem camada já existe nas otimizadas, pulando")
-                        continue
-                    
-                    cur.execute("""
-                        INSERT INTO public.pc_otimizadas (op, peca, projeto, veiculo, sensor, local, rack, user_otimizacao, tipo, lote_vd, lote_pc, data_corte)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        peca['op'],
-                        peca_atual,  # Usar a peça atual (pode ser especial)
-                        peca.get('projeto', ''),
-                        peca['veiculo'],
-                        peca.get('sensor', ''),
-                        peca['local'],
-                        peca['rack'],
-                        current_user.username,
-                        'PC',
-                        peca.get('lote_vd', ''),
-                        peca.get('lote_pc', ''),
-                        peca.get('data_corte')
-                    ))
-                    total_inseridas += 1
+            camadas_result = plano_xml.camadas_da_peca(camadas_por_peca, peca.get('projeto', ''), peca['peca'])
+            for peca_atual, camada_id in _linhas_otimizacao(peca['peca'], camadas_result):
+                # Mesma (op, peça, camada) duas vezes no lote: só a primeira entra
+                chave = (str(peca['op']), str(peca_atual), camada_id or '')
+                if chave in chaves_vistas:
+                    continue
+                chaves_vistas.add(chave)
+                linhas.append((chave, (
+                    peca['op'],
+                    peca_atual,  # Usar a peça atual (pode ser especial)
+                    peca.get('projeto', ''),
+                    peca['veiculo'],
+                    peca.get('sensor', ''),
+                    peca['local'],
+                    peca['rack'],
+                    current_user.username,
+                    'PC',
+                    camada_id,
+                    peca.get('lote_vd', ''),
+                    peca.get('lote_pc', ''),
+                    peca.get('data_corte')
+                )))
+        
+        # Descartar o que já está no estoque ou nas otimizadas (uma consulta para o lote todo)
+        novas = _chaves_otimizacao_novas(cur, [chave for chave, _ in linhas])
+        valores = [valores for chave, valores in linhas if chave in novas]
+        print(f"DEBUG: {len(linhas)} linha(s) expandida(s), {len(linhas) - len(valores)} já existente(s)")
+        
+        if valores:
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO public.pc_otimizadas (op, peca, projeto, veiculo, sensor, local, rack, user_otimizacao, tipo, camada, lote_vd, lote_pc, data_corte)
+                VALUES %s
+            """, valores, page_size=500)
+        total_inseridas = len(valores)
+        
+        # Peças gravadas não precisam mais das retenções de slot da coleta
+        liberar_reservas(cur, [(peca['op'], peca['peca']) for peca in pecas_selecionadas])
         
         # Atualizar status para PROGRAMADO na tabela plano_controle_corte_vidro2
-        for peca in pecas_selecionadas:
-            cur.execute("""
-                UPDATE public.plano_controle_corte_vidro2 
-                SET pc_cortado = 'PROGRAMADO' 
-                WHERE op = %s AND peca = %s
-            """, (peca['op'], peca['peca']))
+        psycopg2.extras.execute_values(cur, """
+            UPDATE public.plano_controle_corte_vidro2 p
+            SET pc_cortado = 'PROGRAMADO'
+            FROM (VALUES %s) AS v(op, peca)
+            WHERE p.op::text = v.op AND p.peca = v.peca
+        """, sorted({(str(peca['op']), str(peca['peca'])) for peca in pecas_selecionadas}), page_size=500)
         
         conn.commit()
         conn.close()
@@ -1474,29 +1359,18 @@ def otimizar_pecas():
 @app.route('/api/otimizadas')
 @login_required
 def api_otimizadas():
+    def formatar(item):
+        if item.get('data_corte'):
+            item['data_corte'] = item['data_corte'].strftime('%d/%m/%Y') if item['data_corte'] else ''
+        item['sensor'] = item.get('sensor', '') or ''
+        item['camada'] = item.get('camada', '') or ''
+        item['lote_pc'] = item.get('lote_pc', '') or ''
+        return item
+    
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("""
-            SELECT id, op, peca, projeto, veiculo, local, cortada, user_otimizacao, data_corte, sensor, camada, lote_pc
-            FROM public.pc_otimizadas
-            WHERE tipo = 'PC'
-            ORDER BY id DESC
-        """)
-        dados = cur.fetchall()
-        conn.close()
-        
-        resultado = []
-        for row in dados:
-            item = dict(row)
-            if item.get('data_corte'):
-                item['data_corte'] = item['data_corte'].strftime('%d/%m/%Y') if item['data_corte'] else ''
-            item['sensor'] = item.get('sensor', '') or ''
-            item['camada'] = item.get('camada', '') or ''
-            item['lote_pc'] = item.get('lote_pc', '') or ''
-            resultado.append(item)
-        
-        return jsonify(resultado)
+        return _resposta_listagem(LISTAGEM_OTIMIZADAS, formatar)
+    except consultas.ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1681,6 +1555,7 @@ def enviar_estoque():
         # Remover da tabela de otimizadas
         placeholders = ','.join(['%s'] * len(ids))
         cur.execute(f"DELETE FROM public.pc_otimizadas WHERE id IN ({placeholders})", ids)
+        liberar_reservas(cur, [(peca['op'], peca['peca']) for peca in pecas])
         
         conn.commit()
         conn.close()
@@ -1737,13 +1612,6 @@ def api_arquivos():
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
         
-        # Adicionar coluna sensor se não existir
-        try:
-            cur.execute("ALTER TABLE public.arquivos_pc ADD COLUMN IF NOT EXISTS sensor TEXT")
-            conn.commit()
-        except:
-            pass
-        
         # Buscar dados
         cur.execute("SELECT * FROM public.arquivos_pc ORDER BY id DESC")
         dados = cur.fetchall()
@@ -1817,13 +1685,6 @@ def adicionar_arquivo():
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Adicionar coluna sensor se não existir
-        try:
-            cur.execute("ALTER TABLE public.arquivos_pc ADD COLUMN IF NOT EXISTS sensor TEXT")
-            conn.commit()
-        except:
-            pass
-        
         # Verificar se já existe um arquivo idêntico
         cur.execute("""
             SELECT COUNT(*) FROM public.arquivos_pc 
@@ -1840,9 +1701,11 @@ def adicionar_arquivo():
             INSERT INTO public.arquivos_pc (projeto, peca, nome_peca, camada, espessura, quantidade, sensor)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
         """, (projeto, peca, nome_peca, camada, espessura_val, quantidade_val, sensor))
+        arquivos_corte.registrar_alteracao(cur)
         
         conn.commit()
         conn.close()
+        arquivos_corte.resolvedor.invalidar()
         
         response = jsonify({'success': True, 'message': 'Arquivo adicionado com sucesso!'})
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -1881,22 +1744,17 @@ def editar_arquivo(arquivo_id):
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Adicionar coluna sensor se não existir
-        try:
-            cur.execute("ALTER TABLE public.arquivos_pc ADD COLUMN IF NOT EXISTS sensor TEXT")
-            conn.commit()
-        except:
-            pass
-        
         cur.execute("""
             UPDATE public.arquivos_pc 
             SET projeto = %s, peca = %s, nome_peca = %s, camada = %s, 
                 espessura = %s, quantidade = %s, sensor = %s
             WHERE id = %s
         """, (projeto, peca, nome_peca, camada, float(espessura), int(quantidade), sensor, arquivo_id))
+        arquivos_corte.registrar_alteracao(cur)
         
         conn.commit()
         conn.close()
+        arquivos_corte.resolvedor.invalidar()
         
         response = jsonify({'success': True, 'message': 'Arquivo atualizado com sucesso!'})
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -1922,9 +1780,11 @@ def excluir_arquivo(arquivo_id):
         cur = conn.cursor()
         
         cur.execute("DELETE FROM public.arquivos_pc WHERE id = %s", (arquivo_id,))
+        arquivos_corte.registrar_alteracao(cur)
         
         conn.commit()
         conn.close()
+        arquivos_corte.resolvedor.invalidar()
         
         response = jsonify({'success': True, 'message': 'Arquivo excluído com sucesso!'})
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -1997,172 +1857,12 @@ def api_local_detalhes(local):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# Executar uma única vez para popular a tabela
-def popular_locais_iniciais():
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Criar tabelas se não existirem
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS public.pc_locais (
-                id SERIAL PRIMARY KEY,
-                local TEXT,
-                status TEXT DEFAULT 'Ativo',
-                limite TEXT
-            )
-        """)
-        
-        # Adicionar coluna email na tabela users_pc se não existir
-        try:
-            cur.execute("ALTER TABLE public.users_pc ADD COLUMN IF NOT EXISTS email TEXT")
-            conn.commit()
-        except:
-            pass
-        
-
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS public.pc_inventory (
-                id SERIAL PRIMARY KEY,
-                op_pai TEXT,
-                op TEXT,
-                peca TEXT,
-                projeto TEXT,
-                veiculo TEXT,
-                local TEXT,
-                data TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                usuario TEXT
-            )
-        """)
-        
-        # Adicionar colunas se não existirem
-        try:
-            cur.execute("ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS data TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-            cur.execute("ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS usuario TEXT")
-            cur.execute("ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS sensor TEXT")
-            cur.execute("ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS camada TEXT")
-            cur.execute("ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS lote_vd TEXT")
-            cur.execute("ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS lote_pc TEXT")
-            conn.commit()
-        except:
-            pass
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS public.pc_exit (
-                id SERIAL PRIMARY KEY,
-                op_pai TEXT,
-                op TEXT,
-                peca TEXT,
-                projeto TEXT,
-                veiculo TEXT,
-                local TEXT,
-                usuario TEXT,
-                data TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                motivo TEXT
-            )
-        """)
-        
-        # Criar tabela pc_baixas se não existir
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS public.pc_baixas (
-                id SERIAL PRIMARY KEY,
-                op TEXT,
-                peca TEXT,
-                projeto TEXT,
-                veiculo TEXT,
-                sensor TEXT,
-                motivo_baixa TEXT,
-                data_baixa DATE,
-                status TEXT DEFAULT 'PENDENTE',
-                usuario_apontamento TEXT,
-                processado_por TEXT,
-                data_processamento TIMESTAMP,
-                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Criar tabela pc_camadas se não existir
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS public.pc_camadas (
-                id SERIAL PRIMARY KEY,
-                projeto TEXT,
-                peca TEXT,
-                l3 TEXT,
-                l3_b TEXT,
-                l4 TEXT,
-                l5 TEXT,
-                l6 TEXT,
-                l7 TEXT,
-                l8 TEXT,
-                pecas_especiais TEXT
-            )
-        """)
-        
-        # Criar tabela pc_controle se não existir
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS public.pc_controle (
-                id SERIAL PRIMARY KEY,
-                op_pai TEXT,
-                op TEXT,
-                peca TEXT,
-                projeto TEXT,
-                veiculo TEXT,
-                local TEXT,
-                rack TEXT,
-                cortada BOOLEAN DEFAULT FALSE,
-                user_otimizacao TEXT,
-                data_otimizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                tipo TEXT DEFAULT 'PC',
-                camada TEXT
-            )
-        """)
-        
-        # Adicionar colunas se não existirem na tabela pc_baixas
-        try:
-            cur.execute("ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS veiculo TEXT")
-            cur.execute("ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS sensor TEXT")
-            cur.execute("ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'PENDENTE'")
-            cur.execute("ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS processado_por TEXT")
-            cur.execute("ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS data_processamento TIMESTAMP")
-            cur.execute("ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-            conn.commit()
-        except:
-            pass
-        
-        # Adicionar coluna pecas_especiais se não existir na tabela pc_camadas
-        try:
-            cur.execute("ALTER TABLE public.pc_camadas ADD COLUMN IF NOT EXISTS pecas_especiais TEXT")
-            conn.commit()
-        except:
-            pass
-        
-        # Verificar se já existem slots
-        cur.execute("SELECT COUNT(*) FROM public.pc_locais WHERE local LIKE 'SLOT%'")
-        count = cur.fetchone()[0]
-        
-        if count == 0:
-            # Criar slots de 1 a 169
-            for i in range(1, 170):
-                local = f"SLOT {i}"
-                cur.execute("""
-                    INSERT INTO public.pc_locais (local, status, limite)
-                    VALUES (%s, %s, %s)
-                """, (local, 'Ativo', '6'))
-
-            conn.commit()
-            print("Slots populados com sucesso: SLOT 1 até SLOT 169")
-        
-        conn.close()
-        
-    except Exception as e:
-        print(f"Erro ao popular locais: {e}")
-
-# Executar automaticamente na inicialização
+# Schema criado/atualizado por migracoes.py (start.sh roda antes de subir o app)
 try:
-    popular_locais_iniciais()
-    
-
+    with db_pool.db_connection() as conn:
+        migracoes_pendentes = migracoes.pendentes(conn)
+    if migracoes_pendentes:
+        print(f"AVISO: {len(migracoes_pendentes)} migração(ões) pendente(s). Execute: python migracoes.py")
 except Exception as e:
     print(f"Erro na inicialização: {e}")
 
@@ -2267,25 +1967,116 @@ def alterar_status_local():
 
 @app.route('/api/saidas')
 def api_saidas():
+    def formatar(item):
+        if item.get('data'):
+            item['data'] = item['data'].strftime('%d/%m/%Y %H:%M')
+        return item
+    
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT id, op, peca, projeto, veiculo, local, usuario, data FROM public.pc_exit ORDER BY data DESC")
-        dados = cur.fetchall()
-        conn.close()
-        
-        resultado = []
-        for row in dados:
-            item = dict(row)
-            if item.get('data'):
-                item['data'] = item['data'].strftime('%d/%m/%Y %H:%M')
-            resultado.append(item)
-        
-        return jsonify(resultado)
+        return _resposta_listagem(LISTAGEM_SAIDAS, formatar)
+    except consultas.ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Erro na API saidas: {e}")
         return jsonify([])
 
+def _escrever_zip_xml(arquivo, ordens, data_entrega, job=None):
+    """Grava os XMLs das ordens direto no arquivo ZIP aberto, entrada por entrada"""
+    import zipfile
+    
+    with zipfile.ZipFile(arquivo, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for i, ordem in enumerate(ordens):
+            zip_file.writestr(ordem.nome_arquivo(), ordem.xml(data_entrega))
+            if job:
+                job.progresso(i + 1)
+
+@jobs.tarefa('gerar_xml')
+def _job_gerar_xml(job, conn):
+    """Gera os XMLs das peças do job em um ZIP, posto na fila de envio para a CNC ou deixado para download."""
+    pecas_selecionadas = job.parametros.get('pecas', [])
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    indice_arquivos = arquivos_corte.obter_indice(conn)
+    
+    camadas_por_peca = plano_xml.carregar_camadas(cur, [
+        (peca_data.get('projeto', ''), peca_data['peca']) for peca_data in pecas_selecionadas
+    ])
+    plano = plano_xml.planejar(pecas_selecionadas, camadas_por_peca, indice_arquivos)
+    xmls_gerados = [
+        f"OP {ordem.op_diferenciada} - Peça {ordem.peca} - {ordem.camada} (Qtd: {ordem.itens}) - {ordem.nome_peca}"
+        for ordem in plano.ordens
+    ]
+    xmls_nao_gerados = plano.faltando
+    
+    # Se não gerou nenhum XML
+    if not xmls_gerados:
+        cur.execute("""
+            INSERT INTO public.pc_logs (usuario, acao, detalhes)
+            VALUES (%s, %s, %s)
+        """, (job.usuario, 'GERAR_XML', f"XMLs: 0 gerados, {len(xmls_nao_gerados)} não encontrados - {'; '.join(xmls_nao_gerados[:5])}"))
+        conn.commit()
+        return {'resultado': {
+            'success': False,
+            'message': f'Nenhum XML foi gerado. Peças não encontradas: {"; ".join(xmls_nao_gerados)}',
+            'gerados': [],
+            'nao_gerados': xmls_nao_gerados
+        }}
+    
+    data_entrega = datetime.now().strftime('%d/%m/%Y')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    zip_filename = f'xmls_otimizacao_{timestamp}.zip'
+    job.progresso(0, len(plano.ordens), forcar=True)
+    
+    # O ZIP é escrito direto no spool da CNC (entregue em segundo plano por entrega_cnc).
+    # Com a pasta da CNC fora do ar na última verificação, fica para download.
+    na_fila_cnc = False
+    caminho_download = None
+    if entrega_cnc.entrega.disponivel():
+        with entrega_cnc.entrega.arquivo(zip_filename) as f:
+            _escrever_zip_xml(f, plano.ordens, data_entrega, job)
+        na_fila_cnc = True
+    else:
+        caminho_download = arquivos_temp.xmls.caminho(zip_filename)
+        with arquivos_temp.escrever_atomico(caminho_download) as f:
+            _escrever_zip_xml(f, plano.ordens, data_entrega, job)
+    
+    # Log da ação com detalhes
+    if xmls_nao_gerados:
+        detalhes_log = f"XMLs: {len(xmls_gerados)} gerados, {len(xmls_nao_gerados)} não encontrados - {'; '.join(xmls_nao_gerados[:5])}"
+        if len(xmls_nao_gerados) > 5:
+            detalhes_log += f" e mais {len(xmls_nao_gerados) - 5}"
+    else:
+        detalhes_log = f"Gerou {len(xmls_gerados)} XML(s) com sucesso"
+    
+    cur.execute("""
+        INSERT INTO public.pc_logs (usuario, acao, detalhes)
+        VALUES (%s, %s, %s)
+    """, (job.usuario, 'GERAR_XML', detalhes_log))
+    conn.commit()
+    
+    # Preparar mensagem de retorno
+    mensagem = f'{len(xmls_gerados)} XML(s) gerado(s) com sucesso!'
+    if xmls_nao_gerados:
+        mensagem += f'\n\nArquivos não encontrados ({len(xmls_nao_gerados)}):'
+        for item in xmls_nao_gerados:
+            mensagem += f'\n• {item}'
+    if na_fila_cnc:
+        # Só foi para o spool: a cópia para a pasta da CNC é feita depois pelo expedidor
+        mensagem += f"\n\nArquivo ZIP {zip_filename} na fila de envio para a CNC ({entrega_cnc.entrega.destino})"
+    else:
+        mensagem += f"\n\nArquivo preparado para download: {zip_filename}"
+    
+    return {
+        'resultado': {
+            'success': True,
+            'message': mensagem,
+            'download': caminho_download is not None,
+            'gerados': xmls_gerados,
+            'nao_gerados': xmls_nao_gerados
+        },
+        'nome_arquivo': zip_filename,
+        'caminho_arquivo': caminho_download
+    }
+
 @app.route('/api/gerar-xml', methods=['POST'])
 @login_required
 def gerar_xml():
@@ -2300,307 +2091,101 @@ def gerar_xml():
         if not pecas_selecionadas:
             return jsonify({'success': False, 'message': 'Nenhuma peça selecionada'})
         
+        # A geração roda em segundo plano (jobs.py); o navegador acompanha por /api/jobs/<id>
         conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        import zipfile
-        import os
-        from xml.etree.ElementTree import Element, SubElement, tostring
-        from xml.dom import minidom
-        
-        zip_buffer = io.BytesIO()
-        xmls_gerados = []
-        xmls_nao_gerados = []
-        contador_xml = {}  # Controlar contador por OP+PROJETO+PEÇA
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for peca_data in pecas_selecionadas:
-                projeto = peca_data.get('projeto', '')
-                peca_codigo = peca_data['peca']
-                op = peca_data['op']
-                sensor = peca_data.get('sensor', '')
-                
-                # Buscar todas as camadas da peça na tabela pc_camadas
-                cur.execute("""
-                    SELECT * FROM public.pc_camadas 
-                    WHERE projeto = %s AND peca = %s
-                """, (projeto, peca_codigo))
-                
-                camadas_result = cur.fetchone()
-                print(f"DEBUG XML: Camadas encontradas para {projeto} {peca_codigo}: {dict(camadas_result) if camadas_result else 'Nenhuma'}")
-                
-                # Verificar se há peças especiais definidas na tabela pc_camadas
-                pecas_para_gerar = [peca_codigo]  # Padrão: peça original
-                
-                if camadas_result and camadas_result.get('pecas_especiais'):
-                    pecas_especiais_str = camadas_result['pecas_especiais'].strip()
-                    if pecas_especiais_str and pecas_especiais_str != '-':
-                        # Parse do formato "TSA - TSB" -> ['TSA', 'TSB']
-                        pecas_especiais = [p.strip() for p in pecas_especiais_str.split('-') if p.strip()]
-                        pecas_para_gerar = pecas_especiais  # Usar as peças especiais da DB
-                
-                # Processar cada peça (original ou especiais)
-                for peca_atual in pecas_para_gerar:
-                    
-                    # Lista para armazenar as camadas válidas desta peça
-                    camadas_para_processar = []
-                    
-                    if camadas_result:
-                        # Processar apenas colunas específicas de camadas conhecidas
-                        colunas_camadas_conhecidas = ['l3', 'l3_b', 'l4', 'l5', 'l6', 'l7', 'l8']
-                        colunas_encontradas = [col for col in camadas_result.keys() if col in colunas_camadas_conhecidas]
-                        for coluna in colunas_encontradas:
-                            valor_camada = camadas_result[coluna]
-                            # Processar apenas se existir e for diferente de "-" ou vazio
-                            if valor_camada and str(valor_camada).strip() not in ['-', '', 'None', 'NULL', 'null']:
-                                try:
-                                    quantidade = int(float(str(valor_camada)))
-                                    if quantidade > 0:
-                                        # Gerar apenas 1 XML por camada, independente da quantidade
-                                        camadas_para_processar.append((coluna.upper(), '01', 1, quantidade))
-                                except (ValueError, TypeError):
-                                    # Se não conseguir converter para número, tratar como 1
-                                    camadas_para_processar.append((coluna.upper(), '01', 1, 1))
-
-                
-                    # Se não encontrou camadas válidas, tentar buscar arquivo genérico
-                    if not camadas_para_processar:
-                        # Buscar qualquer arquivo do projeto/peça
-                        cur.execute("""
-                            SELECT nome_peca, espessura FROM public.arquivos_pc
-                            WHERE projeto = %s AND peca = %s
-                            ORDER BY id DESC LIMIT 1
-                        """, (projeto, peca_atual))
-                        
-                        arquivo_generico = cur.fetchone()
-                        
-                        if arquivo_generico:
-                            # Adicionar como camada genérica com 4 valores
-                            camadas_para_processar.append(('GENERICO', '01', 1, 1))
-                        else:
-                            if camadas_result:
-                                # Mostrar todas as camadas encontradas no log
-                                colunas_camadas = ['l3', 'l3_b']
-                                camadas_info = ', '.join([f"{col}: {camadas_result.get(col, 'N/A')}" for col in colunas_camadas])
-                                xmls_nao_gerados.append(f"{projeto} {peca_atual} - Sem camadas válidas ({camadas_info})")
-                            else:
-                                xmls_nao_gerados.append(f"{projeto} {peca_atual} - Não encontrado na tabela pc_camadas nem arquivos_pc")
-                            continue
-                
-                    # Buscar todos os arquivos disponíveis para a peça atual
-                    sensor_peca = peca_data.get('sensor', '') or ''
-                    
-                    # Tratar sensor '-' ou inválido
-                    if sensor_peca in ['-', '', 'None', 'NULL', 'null']:
-                        sensor_peca = '1'
-                    
-                    cur.execute("""
-                        SELECT nome_peca, espessura FROM public.arquivos_pc
-                        WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                        AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                        AND UPPER(TRIM(CAST(sensor AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                        ORDER BY id DESC
-                    """, (str(projeto), str(peca_atual), str(sensor_peca)))
-                    
-                    arquivos_disponiveis = cur.fetchall()
-                    
-                    # Se não encontrou com sensor exato, buscar por nome_peca que contenha o sensor
-                    if not arquivos_disponiveis:
-                        cur.execute("""
-                            SELECT nome_peca, espessura FROM public.arquivos_pc
-                            WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                            AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                            AND nome_peca LIKE %s
-                            ORDER BY id DESC
-                        """, (str(projeto), str(peca_atual), f'%_{sensor_peca}'))
-                        arquivos_disponiveis = cur.fetchall()
-                    
-
-                    
-                    if not arquivos_disponiveis:
-                        xmls_nao_gerados.append(f"{projeto} {peca_atual} - Nenhum arquivo encontrado na tabela arquivos_pc")
-                        continue
-                
-                    # Gerar XML para cada camada válida usando arquivos correspondentes
-                    for idx, camada_info in enumerate(camadas_para_processar):
-                        camada_nome, numero_sequencia, item_num, total_items = camada_info
-                        
-                        # Selecionar arquivo baseado na camada
-                        if camada_nome == 'L3':
-                            # Para L3, usar arquivo _A
-                            arquivo_selecionado = None
-                            for arq in arquivos_disponiveis:
-                                if '_A' in arq['nome_peca'] or arq['nome_peca'].endswith('_A'):
-                                    arquivo_selecionado = arq
-                                    break
-                            if not arquivo_selecionado:
-                                arquivo_selecionado = arquivos_disponiveis[0]  # Fallback
-                        elif camada_nome == 'L3_B':
-                            # Para L3_B, usar arquivo _B
-                            arquivo_selecionado = None
-                            for arq in arquivos_disponiveis:
-                                if '_B' in arq['nome_peca'] or arq['nome_peca'].endswith('_B'):
-                                    arquivo_selecionado = arq
-                                    break
-                            if not arquivo_selecionado:
-                                # Se não encontrou _B, usar o segundo arquivo se existir
-                                arquivo_selecionado = arquivos_disponiveis[1] if len(arquivos_disponiveis) > 1 else arquivos_disponiveis[0]
-                        else:
-                            # Para outras camadas, usar arquivo baseado no índice
-                            if idx < len(arquivos_disponiveis):
-                                arquivo_selecionado = arquivos_disponiveis[idx]
-                            else:
-                                arquivo_selecionado = arquivos_disponiveis[0]  # Fallback
-                        
-                        nome_peca = arquivo_selecionado['nome_peca']
-                        espessura = arquivo_selecionado.get('espessura', '1.0')
-                        
-                        # Gerar OP diferenciada para cada peça e camada
-                        peca_index = pecas_para_gerar.index(peca_atual)
-                        op_diferenciada = f"{op}-{chr(65 + (peca_index * 10) + idx)}"
-                        
-                        # Criar XML
-                        root = Element('RPOrderGenerator')
-                        root.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
-                        root.set('xmlns:xsd', 'http://www.w3.org/2001/XMLSchema')
-
-                        queued_item = SubElement(root, 'QueuedItem')
-
-                        SubElement(queued_item, 'Driver').text = 'D006'
-                        SubElement(queued_item, 'TransactionId').text = '000'
-                        
-                        # PartCode e FilePart devem ser o nome completo do arquivo
-                        SubElement(queued_item, 'PartCode').text = nome_peca
-                        SubElement(queued_item, 'CustomerCode').text = peca_data.get('veiculo', '')
-                        part_description = f"{peca_data.get('local', '')} | {projeto} | {peca_atual} | {camada_nome}"
-                        SubElement(queued_item, 'CustomerDescription').text = part_description
-                        SubElement(queued_item, 'Material').text = 'Acrílico-0'
-                        SubElement(queued_item, 'Thickness').text = str(espessura)
-                        SubElement(queued_item, 'Order').text = op_diferenciada
-                        SubElement(queued_item, 'QtyRequired').text = str(total_items)
-                        SubElement(queued_item, 'DeliveryDate').text = datetime.now().strftime('%d/%m/%Y')
-                        
-                        # FilePart deve ser o caminho relativo do arquivo
-                        file_part = f"{nome_peca}"
-                        SubElement(queued_item, 'FilePart').text = file_part
-
-                        # Formatar XML
-                        rough_string = tostring(root, 'utf-8')
-                        reparsed = minidom.parseString(rough_string)
-                        pretty_xml = reparsed.toprettyxml(indent='  ', encoding='utf-8')
-                        
-                        # Nome do arquivo XML - incluir peça atual
-                        xml_filename = f"{op}_{projeto}_{peca_atual}_{camada_nome}.xml"
-                        
-                        zip_file.writestr(xml_filename, pretty_xml)
-                        
-                        xmls_gerados.append(f"OP {op_diferenciada} - Peça {peca_atual} - {camada_nome} (Qtd: {total_items}) - {nome_peca}")
-        
-        # Log da ação com detalhes
-        if xmls_nao_gerados:
-            detalhes_log = f"XMLs: {len(xmls_gerados)} gerados, {len(xmls_nao_gerados)} não encontrados - {'; '.join(xmls_nao_gerados[:5])}"
-            if len(xmls_nao_gerados) > 5:
-                detalhes_log += f" e mais {len(xmls_nao_gerados) - 5}"
-        else:
-            detalhes_log = f"Gerou {len(xmls_gerados)} XML(s) com sucesso"
-        
-        cur.execute("""
-            INSERT INTO public.pc_logs (usuario, acao, detalhes)
-            VALUES (%s, %s, %s)
-        """, (current_user.username, 'GERAR_XML', detalhes_log))
-        
+        cur = conn.cursor()
+        job_id = jobs.enfileirar(cur, 'gerar_xml', {'pecas': pecas_selecionadas}, current_user.username)
         conn.commit()
         conn.close()
         
-        # Se não gerou nenhum XML
-        if not xmls_gerados:
-            return jsonify({
-                'success': False, 
-                'message': f'Nenhum XML foi gerado. Peças não encontradas: {"; ".join(xmls_nao_gerados)}'
-            })
-        
-        zip_buffer.seek(0)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Preparar mensagem de retorno
-        mensagem = f'{len(xmls_gerados)} XML(s) gerado(s) com sucesso!'
-        if xmls_nao_gerados:
-            mensagem += f'\n\nArquivos não encontrados ({len(xmls_nao_gerados)}):'
-            for item in xmls_nao_gerados:
-                mensagem += f'\n• {item}'
-        
-        # Tentar salvar na pasta da rede primeiro
-        zip_saved_network = False
-        network_paths = [
-            r"\\10.150.16.39\cnc-policarbonato" # Caminho UNC da rede
-        ]
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'message': f'Geração de XMLs de {len(pecas_selecionadas)} peça(s) iniciada'
+        }), 202
+    except Exception as e:
+        import traceback
+        print("Erro ao gerar XML:", traceback.format_exc())  # Log detalhado no console
+        return jsonify({'success': False, 'message': f'Erro ao gerar XMLs: {str(e)}'}), 500
+
+def _job_do_usuario(cur, job_id):
+    """Job visível para o usuário atual (o próprio ou qualquer um para T.I), ou None"""
+    job = jobs.obter(cur, job_id)
+    if job and job['usuario'] != current_user.username and current_user.setor != 'T.I':
+        return None
+    return job
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def status_job(job_id):
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        job = _job_do_usuario(cur, job_id)
+        conn.close()
         
-        zip_filename = f'xmls_otimizacao_{timestamp}.zip'
+        if not job:
+            return jsonify({'success': False, 'message': 'Job não encontrado'}), 404
         
-        for network_path in network_paths:
-            try:
-                # Testar se o caminho de rede está acessível
-                if network_path.startswith(r"\\"):
-                    test_path = os.path.dirname(network_path)
-                    if not os.path.exists(test_path):
-                        continue
-                
-                os.makedirs(network_path, exist_ok=True)
-                zip_file_path = os.path.join(network_path, zip_filename)
-                with open(zip_file_path, 'wb') as f:
-                    f.write(zip_buffer.getvalue())
-                zip_saved_network = True
-                mensagem += f"\n\nArquivo ZIP salvo em: {zip_file_path}"
-                break
-            except Exception as e:
-                continue
+        resultado = job.pop('resultado') or {}
+        job['message'] = resultado.get('message') or job['erro']
+        job['sucesso_resultado'] = resultado.get('success')
+        job['download'] = bool(resultado.get('download')) and job['tem_arquivo']
+        job['quantidade_gerados'] = len(resultado.get('gerados', []))
+        job['quantidade_nao_gerados'] = len(resultado.get('nao_gerados', []))
+        return jsonify({'success': True, 'job': job})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro: {str(e)}'}), 500
+
+@app.route('/api/jobs/<int:job_id>/arquivos')
+@login_required
+def arquivos_job(job_id):
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        job = _job_do_usuario(cur, job_id)
+        conn.close()
         
-        # Se não conseguiu salvar na rede, preparar para download
-        if not zip_saved_network:
-            # Salvar temporariamente para download
-            import tempfile
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, zip_filename)
-            with open(temp_file, 'wb') as f:
-                f.write(zip_buffer.getvalue())
-            
-            mensagem += f"\n\nArquivo preparado para download: {zip_filename}"
-            return jsonify({
-                'success': True,
-                'message': mensagem,
-                'download': True,
-                'filename': zip_filename
-            })
+        if not job:
+            return jsonify({'success': False, 'message': 'Job não encontrado'}), 404
         
+        resultado = job['resultado'] or {}
         return jsonify({
             'success': True,
-            'message': mensagem,
-            'download': False
+            'status': job['status'],
+            'gerados': resultado.get('gerados', []),
+            'nao_gerados': resultado.get('nao_gerados', [])
         })
     except Exception as e:
-        import traceback
-        print("Erro ao gerar XML:", traceback.format_exc())  # Log detalhado no console
-        return jsonify({'success': False, 'message': f'Erro ao gerar XMLs: {str(e)}'}), 500
+        return jsonify({'success': False, 'message': f'Erro: {str(e)}'}), 500
+
+@app.route('/api/jobs/<int:job_id>/download')
+@login_required
+def download_job(job_id):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    job = _job_do_usuario(cur, job_id)
+    nome_arquivo, arquivo, caminho = jobs.obter_arquivo(cur, job_id) if job else (None, None, None)
+    conn.close()
+    
+    if arquivo is not None:
+        return send_file(io.BytesIO(arquivo), as_attachment=True, download_name=nome_arquivo)
+    # Arquivo em disco é enviado em blocos; some depois de XML_TEMP_TTL (arquivos_temp.py)
+    if caminho and os.path.isfile(caminho):
+        return send_file(caminho, as_attachment=True, download_name=nome_arquivo)
+    return jsonify({'error': 'Arquivo não encontrado'}), 404
 
 @app.route('/download-xml/<filename>')
 @login_required
 def download_xml(filename):
-    import tempfile
-    import os
-    
-    temp_dir = tempfile.gettempdir()
-    file_path = os.path.join(temp_dir, filename)
+    # ZIPs avulsos da pasta de downloads: removidos assim que a resposta termina
+    file_path = arquivos_temp.xmls.existente(filename)
     
-    if os.path.exists(file_path):
-        def remove_file(response):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-            return response
-        
+    if file_path:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        return send_file(file_path, as_attachment=True, download_name=f'xmls_otimizacao_{timestamp}.zip')
+        response = send_file(file_path, as_attachment=True, download_name=f'xmls_otimizacao_{timestamp}.zip')
+        response.call_on_close(lambda: arquivos_temp.xmls.remover(file_path))
+        return response
     else:
         return jsonify({'error': 'Arquivo não encontrado'}), 404
 
@@ -2608,24 +2193,30 @@ def download_xml(filename):
 @login_required
 def gerar_excel_otimizacao():
     try:
+        formato = exportacao.formato_pedido(request)
+        
+        # Peças selecionadas na tela (o local sugerido só existe no navegador)
         dados_json = request.form.get('dados', '[]')
         dados = json.loads(dados_json)
         
         if not dados:
             return jsonify({'success': False, 'message': 'Nenhum dado encontrado'})
         
-        # Buscar tipo_programacao e etapa_baixa para cada peça
+        # tipo_programacao e etapa_baixa de todas as peças em uma consulta
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        programacao = {}
+        for row in psycopg2.extras.execute_values(cur, """
+            SELECT DISTINCT ON (p.op, p.peca) p.op, p.peca, p.tipo_programacao, p.etapa_baixa
+            FROM public.plano_controle_corte_vidro2 p
+            JOIN (VALUES %s) AS v(op, peca) ON p.op::text = v.op AND p.peca = v.peca
+            ORDER BY p.op, p.peca
+        """, sorted({(str(item.get('op', '')), str(item.get('peca', ''))) for item in dados}), page_size=1000, fetch=True):
+            programacao[(str(row['op']), str(row['peca']))] = row
+        conn.close()
         
         for item in dados:
-            cur.execute("""
-                SELECT tipo_programacao, etapa_baixa FROM public.plano_controle_corte_vidro2
-                WHERE op = %s AND peca = %s
-                LIMIT 1
-            """, (item.get('op', ''), item.get('peca', '')))
-            
-            result = cur.fetchone()
+            result = programacao.get((str(item.get('op', '')), str(item.get('peca', ''))))
             if result:
                 tipo_prog = result['tipo_programacao'] or ''
                 etapa_baixa = result['etapa_baixa'] or ''
@@ -2637,195 +2228,65 @@ def gerar_excel_otimizacao():
             else:
                 item['tipo_programacao'] = ''
         
-        conn.close()
-        
-        df = pd.DataFrame(dados)
-        df = df.rename(columns={
-            'op': 'OP',
-            'peca': 'PEÇA',
-            'projeto': 'PROJETO',
-            'veiculo': 'VEÍCULO',
-            'local': 'LOCAL',
-            'rack': 'RACK',
-            'tipo_programacao': 'TIPO PROGRAMAÇÃO'
-        })
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'otimizacao_{timestamp}.xlsx'
-        
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return exportacao.resposta(RELATORIO_OTIMIZACAO, dados, formato)
     
+    except exportacao.FormatoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao gerar Excel: {str(e)}'}), 500
 
-@app.route('/api/gerar-excel-estoque', methods=['POST'])
+# As exportações abaixo consultam o banco com os mesmos filtros das listagens
+# (busca, filtros por coluna, ordenar/direcao, data_de/data_ate)
+
+@app.route('/api/gerar-excel-estoque', methods=['GET', 'POST'])
 def gerar_excel_estoque():
     try:
-        dados_json = request.form.get('dados', '[]')
-        dados = json.loads(dados_json)
-        
-        if not dados:
-            return jsonify({'success': False, 'message': 'Nenhum dado encontrado'})
-        
-        df = pd.DataFrame(dados)
-        df = df.rename(columns={
-            'op': 'OP',
-            'peca': 'PEÇA',
-            'projeto': 'PROJETO',
-            'veiculo': 'VEÍCULO',
-            'local': 'LOCAL',
-            'rack': 'RACK'
-        })
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'estoque_{timestamp}.xlsx'
-        
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    
+        return _exportar_listagem(LISTAGEM_ESTOQUE, RELATORIO_ESTOQUE)
+    except (consultas.ParametroInvalido, exportacao.FormatoInvalido) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao gerar Excel: {str(e)}'}), 500
 
-@app.route('/api/gerar-excel-otimizadas', methods=['POST'])
+@app.route('/api/gerar-excel-otimizadas', methods=['GET', 'POST'])
 @login_required
 def gerar_excel_otimizadas():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        cur.execute("""
-            SELECT op, peca, projeto, veiculo, local, sensor, camada, lote_pc, data_corte
-            FROM public.pc_otimizadas
-            WHERE tipo = 'PC'
-            ORDER BY id DESC
-        """)
-        dados = cur.fetchall()
-        conn.close()
-        
-        if not dados:
-            return jsonify({'success': False, 'message': 'Nenhuma peça otimizada encontrada'})
-        
-        df = pd.DataFrame([dict(row) for row in dados])
-        df = df.rename(columns={
-            'op': 'OP',
-            'peca': 'PEÇA',
-            'projeto': 'PROJETO',
-            'veiculo': 'VEÍCULO',
-            'local': 'LOCAL',
-            'sensor': 'SENSOR',
-            'camada': 'CAMADA',
-            'lote_pc': 'LOTE PC',
-            'data_corte': 'DATA CORTE'
-        })
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'pecas_otimizadas_{timestamp}.xlsx'
-        
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    
+        return _exportar_listagem(LISTAGEM_OTIMIZADAS, RELATORIO_OTIMIZADAS)
+    except (consultas.ParametroInvalido, exportacao.FormatoInvalido) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao gerar Excel: {str(e)}'}), 500
 
-@app.route('/api/gerar-excel-saidas', methods=['POST'])
+@app.route('/api/gerar-excel-saidas', methods=['GET', 'POST'])
 @login_required
 def gerar_excel_saidas():
     try:
-        dados_json = request.form.get('dados', '[]')
-        dados = json.loads(dados_json)
-        
-        if not dados:
-            return jsonify({'success': False, 'message': 'Nenhum dado encontrado'})
-        
-        df = pd.DataFrame(dados)
-        df = df.rename(columns={
-            'op': 'OP',
-            'peca': 'PEÇA',
-            'projeto': 'PROJETO',
-            'veiculo': 'VEÍCULO',
-            'local': 'LOCAL',
-            'rack': 'RACK',
-            'usuario': 'USUÁRIO',
-            'data': 'DATA SAÍDA'
-        })
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'saidas_{timestamp}.xlsx'
-        
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    
+        return _exportar_listagem(LISTAGEM_SAIDAS, RELATORIO_SAIDAS)
+    except (consultas.ParametroInvalido, exportacao.FormatoInvalido) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro ao gerar Excel: {str(e)}'}), 500
+
+@app.route('/api/gerar-excel-baixas', methods=['GET', 'POST'])
+@login_required
+def gerar_excel_baixas():
+    try:
+        return _exportar_listagem(LISTAGEM_BAIXAS, RELATORIO_BAIXAS)
+    except (consultas.ParametroInvalido, exportacao.FormatoInvalido) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao gerar Excel: {str(e)}'}), 500
 
-@app.route('/api/gerar-excel-logs', methods=['POST'])
+@app.route('/api/gerar-excel-logs', methods=['GET', 'POST'])
 @login_required
 def gerar_excel_logs():
     if current_user.setor != 'T.I' or current_user.role != 'admin':
         return jsonify({'success': False, 'message': 'Acesso negado'}), 403
     
     try:
-        dados_json = request.form.get('dados', '[]')
-        dados = json.loads(dados_json)
-        
-        if not dados:
-            return jsonify({'success': False, 'message': 'Nenhum dado encontrado'})
-        
-        df = pd.DataFrame(dados)
-        df = df.rename(columns={
-            'usuario': 'USUÁRIO',
-            'acao': 'AÇÃO',
-            'detalhes': 'DETALHES',
-            'data_acao': 'DATA AÇÃO'
-        })
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'logs_{timestamp}.xlsx'
-        
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    
+        return _exportar_listagem(LISTAGEM_LOGS, RELATORIO_LOGS)
+    except (consultas.ParametroInvalido, exportacao.FormatoInvalido) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao gerar Excel: {str(e)}'}), 500
 
@@ -2833,6 +2294,7 @@ def gerar_excel_logs():
 @login_required
 def gerar_excel_dashboard():
     try:
+        formato = exportacao.formato_pedido(request)
         dados = request.get_json()
         dados_dashboard = dados.get('dados', [])
         aba_ativa = dados.get('aba_ativa', 'premontagem')
@@ -2851,47 +2313,12 @@ def gerar_excel_dashboard():
         if not dados_filtrados:
             return jsonify({'success': False, 'message': f'Nenhum dado encontrado para a aba {nome_aba}'})
         
-        # Preparar dados para Excel
-        dados_excel = []
-        for item in dados_filtrados:
-            # Mapear status para categoria descritiva
-            status_map = {
-                'aviso': 'Peças no Corte Curvo - Pré-Montagem',
-                'plano': 'Bloco Plano - Peças Sem PC',
-                'curvo': 'Bloco Curvo - Peças Sem PC', 
-                'critico': 'Peças que já passaram da Montagem'
-            }
-            
-            categoria = status_map.get(item.get('status', ''), item.get('status', '').upper())
-            
-            dados_excel.append({
-                'OP': item.get('op', ''),
-                'PEÇA': item.get('peca', ''),
-                'PROJETO': item.get('projeto', ''),
-                'VEÍCULO': item.get('veiculo', ''),
-                'LOCAL': item.get('local', ''),
-                'ETAPA': item.get('etapa', ''),
-                'PRIORIDADE': item.get('prioridade', ''),
-                'CATEGORIA': categoria,
-                'QUANTIDADE': item.get('quantidade', 1)
-            })
-        
-        df = pd.DataFrame(dados_excel)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'dashboard_producao_{timestamp}.xlsx'
-        
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl', sheet_name=nome_aba)
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        # Categoria descritiva de cada status; colunas em exportacao.RELATORIO_DASHBOARD
+        linhas = exportacao.linhas_dashboard(dados_filtrados)
+        return exportacao.resposta(exportacao.RELATORIO_DASHBOARD, linhas, formato, aba=nome_aba)
     
+    except exportacao.FormatoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao gerar Excel: {str(e)}'}), 500
 
@@ -2958,32 +2385,19 @@ def baixar_peca():
 @app.route('/api/baixas')
 @login_required
 def api_baixas():
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        cur.execute("""
-            SELECT id, op, peca, projeto, veiculo, sensor, motivo_baixa, data_baixa, status, 
-                   usuario_apontamento, data_criacao
-            FROM public.pc_baixas 
-            ORDER BY data_criacao DESC
-        """)
-        dados = cur.fetchall()
-        conn.close()
-        
-        resultado = []
-        for row in dados:
-            item = dict(row)
-            if item.get('data_baixa'):
-                item['data_baixa'] = item['data_baixa'].strftime('%d/%m/%Y')
-            if item.get('data_criacao'):
-                item['data_criacao'] = item['data_criacao'].strftime('%d/%m/%Y %H:%M')
-            item['veiculo'] = item.get('veiculo', '') or ''
-            item['sensor'] = item.get('sensor', '') or ''
-            resultado.append(item)
-        
-        return jsonify(resultado)
+    def formatar(item):
+        if item.get('data_baixa'):
+            item['data_baixa'] = item['data_baixa'].strftime('%d/%m/%Y')
+        if item.get('data_criacao'):
+            item['data_criacao'] = item['data_criacao'].strftime('%d/%m/%Y %H:%M')
+        item['veiculo'] = item.get('veiculo', '') or ''
+        item['sensor'] = item.get('sensor', '') or ''
+        return item
     
+    try:
+        return _resposta_listagem(LISTAGEM_BAIXAS, formatar)
+    except consultas.ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2999,6 +2413,7 @@ def reprocessar_baixa():
         
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        indice_arquivos = arquivos_corte.obter_indice(conn)
         
         # Buscar baixa
         cur.execute("SELECT * FROM public.pc_baixas WHERE id = %s", (baixa_id,))
@@ -3043,7 +2458,7 @@ def reprocessar_baixa():
         locais_ocupados = {row['local'] for row in cur.fetchall() if row['local']}
         
         # Sugerir local usando a mesma lógica do index
-        local_sugerido, rack_sugerido = sugerir_local_armazenamento(baixa['peca'], locais_ocupados, conn)
+        local_sugerido, rack_sugerido = sugerir_local_armazenamento(baixa['peca'], locais_ocupados, conn, reter=False)
         
         if local_sugerido is None:
             conn.close()
@@ -3071,201 +2486,42 @@ def reprocessar_baixa():
         
         # Gerar XMLs usando a mesma lógica da função gerar_xml
         try:
-            import zipfile
-            import os
-            from xml.etree.ElementTree import Element, SubElement, tostring
-            from xml.dom import minidom
-            
             xmls_gerados = []
-            contador_xml = {}
-            
-            # Buscar todas as camadas da peça na tabela pc_camadas
-            cur.execute("""
-                SELECT * FROM public.pc_camadas 
-                WHERE projeto = %s AND peca = %s
-            """, (baixa['projeto'], baixa['peca']))
             
-            camadas_result = cur.fetchone()
-            print(f"DEBUG BAIXAS: Camadas encontradas para {baixa['projeto']} {baixa['peca']}: {dict(camadas_result) if camadas_result else 'Nenhuma'}")
-            
-            # Lista para armazenar as camadas válidas
-            camadas_para_processar = []
+            sensor_peca = baixa.get('sensor', '') or ''
+            if sensor_peca in plano_xml.VALORES_VAZIOS:
+                # Sem sensor na baixa: usar o sensor do PBS da mesma OP
+                cur.execute("""
+                    SELECT sensor FROM public.plano_controle_corte_vidro2
+                    WHERE op = %s AND peca = 'PBS' AND sensor IS NOT NULL AND sensor != '' AND sensor != '-'
+                    LIMIT 1
+                """, (baixa['op'],))
+                pbs_sensor = cur.fetchone()
+                sensor_peca = pbs_sensor['sensor'] if pbs_sensor else plano_xml.SENSOR_PADRAO
             
-            if camadas_result:
-                # Processar apenas colunas específicas de camadas conhecidas
-                colunas_camadas_conhecidas = ['l3', 'l3_b', 'l4', 'l5', 'l6', 'l7', 'l8']
-                colunas_encontradas = [col for col in camadas_result.keys() if col in colunas_camadas_conhecidas]
-                print(f"DEBUG BAIXAS: Colunas de camadas válidas encontradas: {colunas_encontradas}")
-                
-                contador_sequencia = 1
-                for coluna in colunas_encontradas:
-                    valor_camada = camadas_result[coluna]
-                    print(f"DEBUG BAIXAS: Coluna {coluna} = '{valor_camada}' (tipo: {type(valor_camada)})")
-                    # Processar apenas se existir e for diferente de "-" ou vazio
-                    if valor_camada and str(valor_camada).strip() not in ['-', '', 'None', 'NULL', 'null']:
-                        try:
-                            quantidade = int(float(str(valor_camada)))
-                            if quantidade > 0:
-                                # Gerar múltiplos XMLs se quantidade > 1
-                                for i in range(quantidade):
-                                    numero_sequencia = f"{contador_sequencia:02d}"
-                                    camadas_para_processar.append((coluna.upper(), numero_sequencia, i + 1, quantidade))
-                                    print(f"DEBUG BAIXAS: Camada {coluna.upper()} #{i+1}/{quantidade} adicionada (seq: {numero_sequencia})")
-                                    contador_sequencia += 1
-                        except (ValueError, TypeError):
-                            # Se não conseguir converter para número, tratar como 1
-                            numero_sequencia = f"{contador_sequencia:02d}"
-                            camadas_para_processar.append((coluna.upper(), numero_sequencia, 1, 1))
-                            contador_sequencia += 1
-                    else:
-                        print(f"DEBUG BAIXAS: Camada {coluna} ignorada (valor inválido)")
-                
-                print(f"DEBUG BAIXAS: Total de camadas para processar: {len(camadas_para_processar)}")
+            # Reprocessamento: um XML por unidade de cada camada
+            camadas_por_peca = plano_xml.carregar_camadas(cur, [(baixa['projeto'], baixa['peca'])])
+            plano = plano_xml.planejar([{
+                'op': baixa['op'],
+                'projeto': baixa['projeto'],
+                'peca': baixa['peca'],
+                'sensor': sensor_peca,
+                'local': local_sugerido,
+                'veiculo': veiculo
+            }], camadas_por_peca, indice_arquivos, um_xml_por_unidade=True)
+            for faltando in plano.faltando:
+                print(f"DEBUG BAIXAS: {faltando}")
             
-            # Se não encontrou camadas válidas, tentar buscar arquivo genérico
-            if not camadas_para_processar:
-                print(f"DEBUG BAIXAS: Nenhuma camada válida encontrada, buscando arquivo genérico")
-                cur.execute("""
-                    SELECT nome_peca, espessura FROM public.arquivos_pc
-                    WHERE projeto = %s AND peca = %s
-                    ORDER BY id DESC LIMIT 1
-                """, (baixa['projeto'], baixa['peca']))
-                
-                arquivo_generico = cur.fetchone()
-                
-                if arquivo_generico:
-                    camadas_para_processar.append(('GENERICO', '01', 1, 1))
-                    print(f"DEBUG BAIXAS: Arquivo genérico encontrado, adicionado como GENERICO")
+            data_entrega = datetime.now().strftime('%d/%m/%Y')
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             
-            # Gerar XML para cada camada válida
-            for idx, camada_info in enumerate(camadas_para_processar):
-                camada_nome, numero_sequencia, item_num, total_items = camada_info
-                # Buscar arquivo de corte específico para a camada e sensor
-                sensor_peca = baixa.get('sensor', '') or ''
-                
-                # Tratar sensor '-' ou inválido
-                if sensor_peca in ['-', '', 'None', 'NULL', 'null']:
-                    # Buscar sensor do PBS da mesma OP
-                    cur.execute("""
-                        SELECT sensor FROM public.plano_controle_corte_vidro2
-                        WHERE op = %s AND peca = 'PBS' AND sensor IS NOT NULL AND sensor != '' AND sensor != '-'
-                        LIMIT 1
-                    """, (baixa['op'],))
-                    pbs_sensor = cur.fetchone()
-                    sensor_peca = pbs_sensor['sensor'] if pbs_sensor else '1'
-                
-                # Buscar por sensor específico
-                if sensor_peca and sensor_peca not in ['-', '', 'None', 'NULL', 'null']:
-                    cur.execute("""
-                        SELECT nome_peca, espessura FROM public.arquivos_pc
-                        WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                        AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                        AND UPPER(TRIM(CAST(sensor AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                        ORDER BY id DESC
-                    """, (str(baixa['projeto']), str(baixa['peca']), str(sensor_peca)))
-                    
-                    arquivos_encontrados = cur.fetchall()
-                    
-                    # Se não encontrou com sensor exato, buscar por nome_peca que contenha o sensor
-                    if not arquivos_encontrados:
-                        cur.execute("""
-                            SELECT nome_peca, espessura FROM public.arquivos_pc
-                            WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                            AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                            AND nome_peca LIKE %s
-                            ORDER BY id DESC
-                        """, (str(baixa['projeto']), str(baixa['peca']), f'%_{sensor_peca}'))
-                        arquivos_encontrados = cur.fetchall()
+            for ordem in plano.ordens:
+                # Vai para o spool; a cópia para a pasta da CNC acontece em segundo plano
+                entrega_cnc.entrega.enviar(ordem.nome_arquivo(f"_reprocessado_{timestamp}"), ordem.xml(data_entrega))
+                if ordem.itens > 1:
+                    xmls_gerados.append(f"OP {ordem.op_diferenciada} - Peça {ordem.peca} - {ordem.camada} #{ordem.item}/{ordem.itens} - {ordem.nome_peca}")
                 else:
-                    cur.execute("""
-                        SELECT nome_peca, espessura FROM public.arquivos_pc
-                        WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                        AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                        ORDER BY id DESC
-                    """, (str(baixa['projeto']), str(baixa['peca'])))
-                    arquivos_encontrados = cur.fetchall()
-                
-                
-                if not arquivos_encontrados:
-                    print(f"DEBUG BAIXAS: Nenhum arquivo encontrado para projeto={baixa['projeto']}, peca={baixa['peca']}, sensor={sensor_peca}")
-                    continue
-                
-                # Para cada camada, usar o arquivo correspondente se existir múltiplos
-                if len(arquivos_encontrados) > idx:
-                    arquivo_info = arquivos_encontrados[idx]
-                else:
-                    arquivo_info = arquivos_encontrados[0]  # Usar o primeiro se não houver suficientes
-                
-                nome_peca = arquivo_info['nome_peca']
-                espessura = arquivo_info.get('espessura', '1.0')
-                
-                # Gerar OP diferenciada para cada camada
-                op_diferenciada = f"{baixa['op']}-{chr(65 + idx)}"  # 65 = 'A', então será A, B, C, etc.
-                
-                # Criar XML
-                root = Element('RPOrderGenerator')
-                root.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
-                root.set('xmlns:xsd', 'http://www.w3.org/2001/XMLSchema')
-                
-                queued_item = SubElement(root, 'QueuedItem')
-                
-                SubElement(queued_item, 'Driver').text = 'D006'
-                SubElement(queued_item, 'TransactionId').text = '000'
-                SubElement(queued_item, 'PartCode').text = nome_peca
-                SubElement(queued_item, 'CustomerCode').text = veiculo
-                part_description = f"{local_sugerido} | {baixa['projeto']} | {baixa['peca']} | {camada_nome}"
-                SubElement(queued_item, 'CustomerDescription').text = part_description
-                SubElement(queued_item, 'Material').text = 'Acrílico-0'
-                SubElement(queued_item, 'Thickness').text = str(espessura)
-                SubElement(queued_item, 'Order').text = op_diferenciada
-                SubElement(queued_item, 'QtyRequired').text = '1'
-                SubElement(queued_item, 'DeliveryDate').text = datetime.now().strftime('%d/%m/%Y')
-                SubElement(queued_item, 'FilePart').text = nome_peca
-                
-                # Formatar XML
-                rough_string = tostring(root, 'utf-8')
-                reparsed = minidom.parseString(rough_string)
-                pretty_xml = reparsed.toprettyxml(indent='  ', encoding='utf-8')
-                
-                # Salvar XML na pasta da rede (Windows)
-                network_paths = [
-                    r"\\10.150.16.39\cnc-policarbonato",  # Caminho UNC da rede
-                    r"Z:\cnc-policarbonato",  # Drive mapeado (se existir)
-                    os.path.expanduser(r"~\Documents\XMLs"),  # Pasta local como fallback
-                    r"C:\temp\xmls"  # Pasta temporária como fallback
-                ]
-                
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                if total_items > 1:
-                    xml_filename = f"{baixa['op']}_{baixa['projeto']}_{baixa['peca']}_{camada_nome}_{item_num:02d}_reprocessado_{timestamp}.xml"
-                else:
-                    xml_filename = f"{baixa['op']}_{baixa['projeto']}_{baixa['peca']}_{camada_nome}_reprocessado_{timestamp}.xml"
-                
-                # Tentar salvar na pasta da rede
-                xml_salvo = False
-                network_paths_xml = [
-                    r"\\10.150.16.39\cnc-policarbonato"
-                    ]
-                
-                for network_path in network_paths_xml:
-                    try:
-                        if network_path.startswith(r"\\"):
-                            test_path = os.path.dirname(network_path)
-                            if not os.path.exists(test_path):
-                                continue
-                        
-                        os.makedirs(network_path, exist_ok=True)
-                        xml_file_path = os.path.join(network_path, xml_filename)
-                        with open(xml_file_path, 'wb') as f:
-                            f.write(pretty_xml)
-                        xml_salvo = True
-                        if total_items > 1:
-                            xmls_gerados.append(f"OP {op_diferenciada} - Peça {baixa['peca']} - {camada_nome} #{item_num}/{total_items} - {nome_peca}")
-                        else:
-                            xmls_gerados.append(f"OP {op_diferenciada} - Peça {baixa['peca']} - {camada_nome} - {nome_peca}")
-                        break
-                    except Exception as e:
-                        continue
+                    xmls_gerados.append(f"OP {ordem.op_diferenciada} - Peça {ordem.peca} - {ordem.camada} - {ordem.nome_peca}")
         
         except Exception as xml_error:
             print(f"Erro ao gerar XML: {xml_error}")
@@ -3276,6 +2532,7 @@ def reprocessar_baixa():
             SET status = 'PROCESSADO', processado_por = %s, data_processamento = NOW()
             WHERE id = %s
         """, (current_user.username, baixa_id))
+        liberar_reservas(cur, [(baixa['op'], baixa['peca'])])
         
         conn.commit()
         conn.close()
@@ -3383,67 +2640,20 @@ def buscar_arquivo():
             return jsonify({'encontrado': False, 'message': 'Projeto e peça são obrigatórios'})
         
         conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        # Buscar arquivo com sensor exato primeiro
-        cur.execute("""
-            SELECT nome_peca FROM public.arquivos_pc
-            WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-            AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-            AND UPPER(TRIM(CAST(sensor AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-            ORDER BY id DESC
-            LIMIT 1
-        """, (str(projeto), str(peca), str(sensor)))
-        
-        arquivo_exato = cur.fetchone()
-        
-        if arquivo_exato:
-            conn.close()
-            return jsonify({
-                'encontrado': True,
-                'nome_arquivo': arquivo_exato['nome_peca'],
-                'tipo': 'exato'
-            })
-        
-        # Se não encontrou com sensor exato, buscar por nome_peca que contenha o sensor
-        cur.execute("""
-            SELECT nome_peca FROM public.arquivos_pc
-            WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-            AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-            AND nome_peca LIKE %s
-            ORDER BY id DESC
-            LIMIT 1
-        """, (str(projeto), str(peca), f'%_{sensor}'))
-        
-        arquivo_similar = cur.fetchone()
-        
-        if arquivo_similar:
-            conn.close()
-            return jsonify({
-                'encontrado': True,
-                'nome_arquivo': arquivo_similar['nome_peca'],
-                'tipo': 'similar',
-                'message': 'Arquivo encontrado com sensor no nome'
-            })
-        
-        # Se ainda não encontrou, buscar qualquer arquivo da peça
-        cur.execute("""
-            SELECT nome_peca FROM public.arquivos_pc
-            WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-            AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-            ORDER BY id DESC LIMIT 1
-        """, (str(projeto), str(peca)))
-        
-        arquivo_generico = cur.fetchone()
+        arquivo, tipo = arquivos_corte.obter_indice(conn).resolver(projeto, peca, sensor)
         conn.close()
         
-        if arquivo_generico:
-            return jsonify({
+        if arquivo:
+            resposta = {
                 'encontrado': True,
-                'nome_arquivo': arquivo_generico['nome_peca'],
-                'tipo': 'generico',
-                'message': 'Arquivo encontrado sem sensor específico'
-            })
+                'nome_arquivo': arquivo['nome_peca'],
+                'tipo': tipo
+            }
+            if tipo == 'similar':
+                resposta['message'] = 'Arquivo encontrado com sensor no nome'
+            elif tipo == 'generico':
+                resposta['message'] = 'Arquivo encontrado sem sensor específico'
+            return jsonify(resposta)
         
         return jsonify({
             'encontrado': False,
@@ -3453,6 +2663,13 @@ def buscar_arquivo():
     except Exception as e:
         return jsonify({'encontrado': False, 'message': f'Erro: {str(e)}'}), 500
 
+@app.route('/api/cnc/status')
+@login_required
+def status_cnc():
+    # Último resultado do expedidor deste worker; não acessa a pasta da rede
+    estado = entrega_cnc.entrega.estado()
+    return jsonify({'success': estado['acessivel'] is not False, 'entrega': estado})
+
 @app.route('/api/limpar-pecas-manuais', methods=['POST'])
 @login_required
 def limpar_pecas_manuais():
@@ -3460,19 +2677,6 @@ def limpar_pecas_manuais():
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Criar tabela se não existir
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS public.pc_manuais (
-                id SERIAL PRIMARY KEY,
-                op TEXT,
-                peca TEXT,
-                projeto TEXT,
-                veiculo TEXT,
-                sensor TEXT,
-                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
         # Fazer truncate na tabela
         cur.execute("TRUNCATE TABLE public.pc_manuais RESTART IDENTITY")
         
@@ -3487,12 +2691,10 @@ def limpar_pecas_manuais():
 @app.route('/api/buscar-veiculo-local')
 @login_required
 def buscar_veiculo_local():
-    global contador_slots_temp
-    contador_slots_temp = {}  # Limpar contador no início de cada busca
-    
     try:
         projeto = request.args.get('projeto', '').strip()
         peca = request.args.get('peca', '').strip()
+        op = request.args.get('op', '').strip()
         
         if not projeto or not peca:
             return jsonify({'success': False, 'message': 'Projeto e peça são obrigatórios'})
@@ -3511,8 +2713,8 @@ def buscar_veiculo_local():
         veiculo_result = cur.fetchone()
         veiculo = veiculo_result['veiculo'] if veiculo_result else 'Não encontrado'
         
-        # Sugerir local com contador limpo
-        local_sugerido, rack_sugerido = sugerir_local_armazenamento(peca, set(), conn)
+        # Sugerir local com contador limpo (retenção pela OP, liberada na entrada manual)
+        local_sugerido, rack_sugerido = sugerir_local_armazenamento(peca, set(), conn, op=op)
         
         conn.close()
         
@@ -3534,9 +2736,6 @@ def buscar_veiculo_local():
 @app.route('/api/entrada-manual-estoque', methods=['POST'])
 @login_required
 def entrada_manual_estoque():
-    global contador_slots_temp
-    contador_slots_temp = {}  # Limpar contador no início de cada entrada manual
-    
     try:
         dados = request.get_json()
         op = dados.get('op', '').strip()
@@ -3596,29 +2795,8 @@ def entrada_manual_estoque():
         
         print(f"DEBUG ENTRADA MANUAL: Buscando arquivo para projeto='{projeto}', peca='{peca}', sensor_busca='{sensor_busca}'")
         
-        # Buscar arquivo com sensor exato primeiro
-        cur.execute("""
-            SELECT nome_peca FROM public.arquivos_pc
-            WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-            AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-            AND UPPER(TRIM(CAST(sensor AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-            ORDER BY id DESC
-            LIMIT 1
-        """, (str(projeto), str(peca), str(sensor_busca)))
-        
-        arquivo_result = cur.fetchone()
-        
-        # Se não encontrou com sensor exato, buscar por nome_peca que contenha o sensor
-        if not arquivo_result:
-            cur.execute("""
-                SELECT nome_peca FROM public.arquivos_pc
-                WHERE UPPER(TRIM(CAST(projeto AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT))) 
-                AND UPPER(TRIM(CAST(peca AS TEXT))) = UPPER(TRIM(CAST(%s AS TEXT)))
-                AND nome_peca LIKE %s
-                ORDER BY id DESC
-                LIMIT 1
-            """, (str(projeto), str(peca), f'%_{sensor_busca}'))
-            arquivo_result = cur.fetchone()
+        # Sensor exato -> nome com sensor (índice em memória)
+        arquivo_result, _ = arquivos_corte.obter_indice(conn).resolver(projeto, peca, sensor_busca, generico=False)
         
         print(f"DEBUG ENTRADA MANUAL: Resultado encontrado: {arquivo_result}")
         
@@ -3627,6 +2805,7 @@ def entrada_manual_estoque():
             INSERT INTO public.pc_inventory (op, peca, projeto, veiculo, local, sensor, usuario, data)
             VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
         """, (op, peca, projeto, veiculo, local, sensor, current_user.username))
+        liberar_reservas(cur, [(op, peca)])
         
         conn.commit()
         conn.close()
@@ -3887,7 +3066,7 @@ def voltar_estoque():
         locais_ocupados = {row['local'] for row in cur.fetchall() if row['local']}
         
         # Sugerir novo local usando a regra de alocação
-        local_sugerido, rack_sugerido = sugerir_local_armazenamento(saida['peca'], locais_ocupados, conn)
+        local_sugerido, rack_sugerido = sugerir_local_armazenamento(saida['peca'], locais_ocupados, conn, reter=False)
         
         if local_sugerido is None:
             conn.close()
@@ -3911,6 +3090,7 @@ def voltar_estoque():
         
         # Remover da tabela de saídas
         cur.execute("DELETE FROM public.pc_exit WHERE id = %s", (saida_id,))
+        liberar_reservas(cur, [(saida['op'], saida['peca'])])
         
         conn.commit()
         conn.close()
@@ -3923,6 +3103,13 @@ def voltar_estoque():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro: {str(e)}'}), 500
 
+# Executores da fila de jobs deste processo (depois de registradas as tarefas).
+# Os processos que desenham etiquetas (etiquetas.py) reimportam este módulo
+# quando o app roda com "python app.py" e não devem consumir a fila.
+if multiprocessing.parent_process() is None:
+    jobs.iniciar_executor()
+    entrega_cnc.entrega.iniciar()
+
 if __name__ == '__main__':
     # Verificar se está rodando em container (sem inicialização do dashboard)
     is_container = os.getenv('FLASK_ENV') == 'production'
@@ -0,0 +1,156 @@
+"""Cache em memória de arquivos_pc para resolver arquivos de corte.
+
+A tabela quase não muda (só pelos endpoints /api/arquivos), mas é consultada
+várias vezes por peça. Cada processo mantém um ``IndiceArquivos`` com as
+linhas agrupadas pela chave normalizada (projeto, peca) e por sensor, e
+responde a busca em três níveis sem ir ao banco:
+
+    1. sensor exato             (UPPER(TRIM(sensor)) = sensor)
+    2. nome terminado no sensor (nome_peca LIKE '%_<sensor>')
+    3. qualquer arquivo da peça
+
+Sempre na ordem id DESC, como as consultas que substitui.
+
+Os endpoints de escrita incrementam ``pc_arquivos_versao`` na mesma transação
+(``registrar_alteracao``). Cada ``obter`` lê a versão (uma consulta de uma
+linha) e recarrega o índice quando outro worker alterou a tabela.
+"""
+import threading
+
+import psycopg2.extras
+
+SEM_ARQUIVO = 'Sem arquivo de corte'
+
+
+def normalizar_chave(valor):
+    """Equivalente em Python de UPPER(TRIM(CAST(valor AS TEXT)))"""
+    return '' if valor is None else str(valor).strip(' ').upper()
+
+
+def _termina_com_sensor(nome_peca, sensor):
+    """Equivalente de nome_peca LIKE '%_<sensor>' (o '_' exige ao menos um caractere antes)"""
+    return nome_peca is not None and len(nome_peca) > len(sensor) and nome_peca.endswith(sensor)
+
+
+class IndiceArquivos:
+    """Retrato imutável de arquivos_pc numa versão."""
+
+    def __init__(self, versao, linhas):
+        """linhas: dicts com id, projeto, peca, sensor, nome_peca, espessura, camada, tamanho_peca"""
+        self.versao = versao
+        self._por_peca = {}
+        self._por_sensor = {}
+        self.pares_gg = set()
+        for linha in sorted(linhas, key=lambda l: l['id'], reverse=True):
+            arquivo = {
+                'id': linha['id'],
+                'nome_peca': linha['nome_peca'],
+                'espessura': linha['espessura'],
+                'camada': linha['camada'],
+                'sensor': linha['sensor'],
+            }
+            chave = (normalizar_chave(linha['projeto']), normalizar_chave(linha['peca']))
+            self._por_peca.setdefault(chave, []).append(arquivo)
+            if linha['sensor'] is not None:
+                self._por_sensor.setdefault(chave + (normalizar_chave(linha['sensor']),), []).append(arquivo)
+            if linha['tamanho_peca'] == 'GG':
+                self.pares_gg.add((str(linha['projeto']), str(linha['peca'])))
+
+    def __len__(self):
+        return sum(len(arquivos) for arquivos in self._por_peca.values())
+
+    def todos(self, projeto, peca):
+        return self._por_peca.get((normalizar_chave(projeto), normalizar_chave(peca)), [])
+
+    def por_sensor(self, projeto, peca, sensor):
+        return self._por_sensor.get((normalizar_chave(projeto), normalizar_chave(peca), normalizar_chave(sensor)), [])
+
+    def por_nome_sensor(self, projeto, peca, sensor):
+        sensor = str(sensor)
+        return [arq for arq in self.todos(projeto, peca) if _termina_com_sensor(arq['nome_peca'], sensor)]
+
+    def resolver(self, projeto, peca, sensor, por_nome=True, generico=True):
+        """Primeiro arquivo na ordem sensor exato -> nome com sensor -> qualquer um.
+
+        Retorna (arquivo, tipo) com tipo 'exato', 'similar' ou 'generico', ou (None, None).
+        """
+        arquivos = self.por_sensor(projeto, peca, sensor)
+        if arquivos:
+            return arquivos[0], 'exato'
+        if por_nome:
+            arquivos = self.por_nome_sensor(projeto, peca, sensor)
+            if arquivos:
+                return arquivos[0], 'similar'
+        if generico:
+            arquivos = self.todos(projeto, peca)
+            if arquivos:
+                return arquivos[0], 'generico'
+        return None, None
+
+    def nome_arquivo(self, projeto, peca, sensor, por_nome=True):
+        arquivo, _ = self.resolver(projeto, peca, sensor, por_nome=por_nome)
+        return arquivo['nome_peca'] if arquivo else SEM_ARQUIVO
+
+
+def _ler_versao(cur):
+    cur.execute("SELECT versao FROM public.pc_arquivos_versao WHERE id = 1")
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+class ResolvedorArquivos:
+    """Mantém o índice do processo e o recarrega quando a versão no banco muda."""
+
+    def __init__(self):
+        self._indice = None
+        self._lock = threading.Lock()
+
+    def obter(self, conn):
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        try:
+            versao = _ler_versao(cur)
+        except psycopg2.Error as e:
+            # Sem tabela de versão não há como saber se o cache vale: ler direto
+            print(f"DEBUG ARQUIVOS: Versão indisponível, recarregando sem cache: {e}")
+            conn.rollback()
+            return self._carregar(cur, None)
+
+        indice = self._indice
+        if indice is not None and indice.versao == versao:
+            return indice
+        with self._lock:
+            indice = self._indice
+            if indice is None or indice.versao != versao:
+                # Versão lida antes das linhas: uma alteração no meio só causa uma recarga a mais
+                indice = self._carregar(cur, versao)
+                self._indice = indice
+                print(f"DEBUG ARQUIVOS: Índice recarregado (versão {versao}, {len(indice)} arquivos)")
+        return indice
+
+    def _carregar(self, cur, versao):
+        cur.execute("""
+            SELECT id, projeto, peca, sensor, nome_peca, espessura, camada, tamanho_peca
+            FROM public.arquivos_pc
+        """)
+        return IndiceArquivos(versao, cur.fetchall())
+
+    def invalidar(self):
+        self._indice = None
+
+
+resolvedor = ResolvedorArquivos()
+
+
+def obter_indice(conn):
+    return resolvedor.obter(conn)
+
+
+def registrar_alteracao(cur):
+    """Incrementa a versão de arquivos_pc. Chamar na mesma transação da escrita."""
+    cur.execute("""
+        INSERT INTO public.pc_arquivos_versao (id, versao, atualizado_em)
+        VALUES (1, 1, NOW())
+        ON CONFLICT (id) DO UPDATE
+        SET versao = pc_arquivos_versao.versao + 1, atualizado_em = NOW()
+    """)
+
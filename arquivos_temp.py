@@ -0,0 +1,87 @@
+"""Arquivos gerados para download (ZIPs de XML, PDFs de etiquetas) e gravação atômica em disco.
+
+Os ZIPs que não vão para a pasta da CNC e os PDFs de etiquetas gerados em
+segundo plano ficam cada um num diretório próprio dentro de
+``tempfile.gettempdir()``. Cada novo arquivo dispara a limpeza dos que
+passaram da validade (``XML_TEMP_TTL``, em segundos), e o download de arquivo
+avulso remove o arquivo ao final da resposta.
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    TTL_PADRAO = float(os.getenv('XML_TEMP_TTL', '3600'))
+except ValueError:
+    TTL_PADRAO = 3600.0
+
+
+@contextmanager
+def escrever_atomico(caminho):
+    """Abre ``caminho + '.tmp'`` para escrita e só o renomeia para ``caminho`` se tudo deu certo.
+
+    Quem lê a pasta (a CNC, outro worker) nunca vê um arquivo pela metade.
+    """
+    temporario = f"{caminho}.tmp"
+    try:
+        with open(temporario, 'wb') as f:
+            yield f
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+
+
+class DiretorioTemporario:
+    def __init__(self, nome, ttl=TTL_PADRAO):
+        self.diretorio = os.path.join(tempfile.gettempdir(), nome)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def caminho(self, nome_arquivo):
+        """Caminho para um novo arquivo no diretório (limpa os vencidos antes)"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.limpar()
+        return os.path.join(self.diretorio, os.path.basename(nome_arquivo))
+
+    def existente(self, nome_arquivo):
+        """Caminho de um arquivo já gerado, ou None (nome sem diretório, para não sair da pasta)"""
+        nome_arquivo = os.path.basename(nome_arquivo)
+        caminho = os.path.join(self.diretorio, nome_arquivo)
+        return caminho if nome_arquivo and os.path.isfile(caminho) else None
+
+    def limpar(self):
+        """Remove os arquivos com mais de ``ttl`` segundos. Retorna quantos foram removidos."""
+        limite = time.time() - self.ttl
+        removidos = 0
+        with self._lock:
+            try:
+                entradas = list(os.scandir(self.diretorio))
+            except FileNotFoundError:
+                return 0
+            for entrada in entradas:
+                try:
+                    if entrada.is_file() and entrada.stat().st_mtime < limite:
+                        os.remove(entrada.path)
+                        removidos += 1
+                except OSError:
+                    # Removido por outro worker ou ainda em uso
+                    continue
+        if removidos:
+            print(f"DEBUG TEMP: {removidos} arquivo(s) vencido(s) removido(s) de {self.diretorio}")
+        return removidos
+
+    def remover(self, caminho):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+xmls = DiretorioTemporario('app_pc_xmls')
+pdfs = DiretorioTemporario('app_pc_pdfs')
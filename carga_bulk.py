@@ -0,0 +1,190 @@
+"""Carga em massa no Postgres por COPY FROM STDIN.
+
+As linhas (DataFrame do pandas ou iterável de tuplas) viram CSV num buffer em
+memória e entram por COPY numa tabela temporária com a mesma estrutura da tabela
+de destino; de lá vão para a tabela com um único INSERT ... SELECT:
+
+    inserir      todas as linhas
+    ignorar      só chaves novas (ON CONFLICT (chave) DO NOTHING)
+    atualizar    chaves novas entram, existentes são atualizadas (ON CONFLICT ... DO UPDATE)
+    substituir   apaga o conteúdo da tabela e grava as linhas (dados de referência)
+
+ignorar e atualizar precisam de um índice único nas colunas da ``chave``. Com
+``chave``, linhas repetidas na própria carga ficam uma só e linhas com chave nula
+são descartadas. Nada é confirmado aqui: quem chama faz ``conn.commit()``.
+
+Uso (colunas do arquivo com os nomes das colunas da tabela; com --chave o modo padrão
+é atualizar, sem ela inserir):
+    python carga_bulk.py ARQUIVO.xlsx|.csv TABELA [--chave COLUNA,...] [--modo MODO]
+
+    ex. metro quadrado das peças (planilha com projeto_peca e m2):
+    python carga_bulk.py m2.xlsx dados_uso_geral.metro_quadrado_pecas --modo substituir
+"""
+import csv
+import io
+import os
+import sys
+import time
+import uuid
+
+# Linhas por COPY quando as linhas vêm de um iterável (um bloco por vez na memória)
+TAMANHO_BLOCO = 50000
+MODOS = ('inserir', 'ignorar', 'atualizar', 'substituir')
+
+
+class Resultado:
+    def __init__(self, tabela, recebidas, gravadas, segundos):
+        self.tabela = tabela
+        self.recebidas = recebidas
+        self.gravadas = gravadas
+        self.segundos = segundos
+
+    @property
+    def linhas_por_segundo(self):
+        return self.recebidas / self.segundos if self.segundos > 0 else 0.0
+
+    def __str__(self):
+        return (f"{self.tabela}: {self.recebidas} linhas recebidas, {self.gravadas} gravadas "
+                f"em {self.segundos:.2f}s ({self.linhas_por_segundo:,.0f} linhas/s)")
+
+
+def _identificador(nome):
+    """Nome de tabela ou coluna entre aspas; ``schema.tabela`` vira ``"schema"."tabela"``"""
+    return '.'.join('"' + parte.replace('"', '""') + '"' for parte in nome.split('.'))
+
+
+def _blocos_csv(linhas):
+    """Buffers CSV de até TAMANHO_BLOCO linhas; None vira campo vazio (NULL no COPY)"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    quantidade = 0
+    for linha in linhas:
+        escritor.writerow(linha)
+        quantidade += 1
+        if quantidade == TAMANHO_BLOCO:
+            buffer.seek(0)
+            yield buffer, quantidade
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer, lineterminator='\n')
+            quantidade = 0
+    if quantidade:
+        buffer.seek(0)
+        yield buffer, quantidade
+
+
+def copiar(cur, tabela, colunas, linhas):
+    """COPY das linhas para ``tabela`` (DataFrame com ``colunas``, ou iterável de tuplas na ordem de ``colunas``).
+
+    Retorna quantas linhas foram copiadas.
+    """
+    comando = f"COPY {_identificador(tabela)} ({', '.join(map(_identificador, colunas))}) FROM STDIN WITH (FORMAT csv)"
+    if hasattr(linhas, 'to_csv'):
+        buffer = io.StringIO()
+        linhas[list(colunas)].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cur.copy_expert(comando, buffer)
+        return len(linhas)
+    total = 0
+    for buffer, quantidade in _blocos_csv(linhas):
+        cur.copy_expert(comando, buffer)
+        total += quantidade
+    return total
+
+
+def tabela_temporaria(cur, modelo):
+    """Tabela temporária vazia com a estrutura de ``modelo``; some no fim da transação. Retorna o nome."""
+    nome = f"stg_{uuid.uuid4().hex[:12]}"
+    cur.execute(f"CREATE TEMP TABLE {nome} (LIKE {_identificador(modelo)} INCLUDING DEFAULTS) ON COMMIT DROP")
+    return nome
+
+
+def carregar(conn, tabela, colunas, linhas, chave=None, modo='inserir'):
+    """Grava as linhas em ``tabela`` passando por uma tabela temporária. Retorna um ``Resultado``."""
+    if modo not in MODOS:
+        raise ValueError(f"Modo inválido: {modo} (use {', '.join(MODOS)})")
+    if modo in ('ignorar', 'atualizar') and not chave:
+        raise ValueError(f"O modo {modo} precisa da chave")
+    chave = [chave] if isinstance(chave, str) else list(chave or ())
+
+    inicio = time.monotonic()
+    cur = conn.cursor()
+    try:
+        temporaria = tabela_temporaria(cur, tabela)
+        recebidas = copiar(cur, temporaria, colunas, linhas)
+
+        lista = ', '.join(map(_identificador, colunas))
+        selecao = f"SELECT {lista} FROM {temporaria}"
+        if chave:
+            chaves = ', '.join(map(_identificador, chave))
+            selecao = (f"SELECT DISTINCT ON ({chaves}) {lista} FROM {temporaria} "
+                       f"WHERE {' AND '.join(f'{_identificador(c)} IS NOT NULL' for c in chave)} "
+                       f"ORDER BY {chaves}")
+        comando = f"INSERT INTO {_identificador(tabela)} ({lista}) {selecao}"
+        if modo == 'ignorar':
+            comando += f" ON CONFLICT ({chaves}) DO NOTHING"
+        elif modo == 'atualizar':
+            atualizadas = [coluna for coluna in colunas if coluna not in chave]
+            if atualizadas:
+                comando += f" ON CONFLICT ({chaves}) DO UPDATE SET " + ', '.join(
+                    f"{_identificador(coluna)} = EXCLUDED.{_identificador(coluna)}" for coluna in atualizadas
+                )
+            else:
+                comando += f" ON CONFLICT ({chaves}) DO NOTHING"
+        elif modo == 'substituir':
+            cur.execute(f"DELETE FROM {_identificador(tabela)}")
+
+        cur.execute(comando)
+        gravadas = cur.rowcount
+    finally:
+        cur.close()
+
+    resultado = Resultado(tabela, recebidas, gravadas, time.monotonic() - inicio)
+    print(f"DEBUG CARGA: {resultado}")
+    return resultado
+
+
+def _ler_arquivo(caminho):
+    import pandas as pd
+    if caminho.lower().endswith(('.xlsx', '.xls')):
+        return pd.read_excel(caminho, engine='openpyxl')
+    with open(caminho, encoding='utf-8-sig') as f:
+        cabecalho = f.readline()
+    # ';' é o CSV do Excel em português (como o da exportacao.py): vírgula decimal
+    if ';' in cabecalho:
+        return pd.read_csv(caminho, sep=';', decimal=',', encoding='utf-8-sig')
+    return pd.read_csv(caminho, encoding='utf-8-sig')
+
+
+def main(argv):
+    import psycopg2
+    import migracoes
+
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+    caminho, tabela = argv[0], argv[1]
+    chave = argv[argv.index('--chave') + 1].split(',') if '--chave' in argv else None
+    modo = argv[argv.index('--modo') + 1] if '--modo' in argv else ('atualizar' if chave else 'inserir')
+
+    df = _ler_arquivo(caminho)
+    df.columns = [str(coluna).strip() for coluna in df.columns]
+
+    db_config = migracoes._db_config()
+    if not all(db_config.values()):
+        print("ERRO: Variáveis de ambiente do banco não configuradas!")
+        return 1
+    conn = psycopg2.connect(**db_config)
+    try:
+        carregar(conn, tabela, list(df.columns), df, chave=chave, modo=modo)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"ERRO na carga de {os.path.basename(caminho)}: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
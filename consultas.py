@@ -0,0 +1,173 @@
+"""Listagens com filtro, ordenação e paginação por cursor (keyset).
+
+Usado por /api/estoque, /api/otimizadas, /api/saidas e /api/baixas. A
+paginação segue a ordenação escolhida com ``id`` como desempate: a próxima
+página começa depois da última linha entregue, sem OFFSET, então o custo de
+uma página não cresce com o tamanho da tabela.
+
+Parâmetros aceitos na query string:
+    limite          tamanho da página (ativa o modo paginado)
+    cursor          valor de ``proximo_cursor`` da página anterior
+    ordenar         coluna de ordenação (ver ``ordenaveis`` de cada listagem)
+    direcao         asc | desc
+    busca           texto procurado em todas as colunas de busca
+    op, peca, projeto, local, lote_pc ...   filtro por coluna (contém, sem diferenciar maiúsculas)
+    data_de, data_ate                       intervalo de datas (AAAA-MM-DD, inclusivo)
+    total=1         inclui a contagem total com os filtros aplicados
+
+Sem ``limite`` nem ``cursor`` a resposta continua sendo a lista completa, no
+formato antigo (compatibilidade com as telas que paginam no navegador). As
+exportações usam ``consulta_completa`` com os mesmos filtros da tela.
+"""
+import base64
+import json
+from datetime import date, datetime, timedelta
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 1000
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def _codificar_cursor(valor, id_linha):
+    if isinstance(valor, (datetime, date)):
+        valor = valor.isoformat()
+    bruto = json.dumps([valor, id_linha], default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii')
+
+
+def _decodificar_cursor(cursor):
+    try:
+        valor, id_linha = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return valor, int(id_linha)
+    except (ValueError, TypeError):
+        raise ParametroInvalido('cursor inválido')
+
+
+def _data_param(texto, nome):
+    try:
+        return datetime.strptime(texto, '%Y-%m-%d').date()
+    except ValueError:
+        raise ParametroInvalido(f'{nome} deve estar no formato AAAA-MM-DD')
+
+
+def modo_paginado(args):
+    return 'limite' in args or 'cursor' in args
+
+
+class Listagem:
+    """Definição de uma listagem: tabela, colunas e o que pode ser filtrado/ordenado."""
+
+    def __init__(self, tabela, colunas, ordenaveis, filtros, busca=(), coluna_data=None,
+                 condicao_fixa=None, ordem_padrao=('id', 'desc')):
+        """ordenaveis/filtros: {nome no parâmetro: coluna SQL}"""
+        self.tabela = tabela
+        self.colunas = colunas
+        self.ordenaveis = dict(ordenaveis, id='id')
+        self.filtros = filtros
+        self.busca = busca
+        self.coluna_data = coluna_data
+        self.condicao_fixa = condicao_fixa
+        self.ordem_padrao = ordem_padrao
+
+    def _condicoes(self, args):
+        condicoes = [self.condicao_fixa] if self.condicao_fixa else []
+        params = []
+        for nome, coluna in self.filtros.items():
+            valor = (args.get(nome) or '').strip()
+            if valor:
+                condicoes.append(f"CAST({coluna} AS TEXT) ILIKE %s")
+                params.append(f'%{valor}%')
+
+        busca = (args.get('busca') or '').strip()
+        if busca and self.busca:
+            condicoes.append('(' + ' OR '.join(f"CAST({coluna} AS TEXT) ILIKE %s" for coluna in self.busca) + ')')
+            params.extend([f'%{busca}%'] * len(self.busca))
+
+        if self.coluna_data:
+            if args.get('data_de'):
+                condicoes.append(f"{self.coluna_data} >= %s")
+                params.append(_data_param(args['data_de'], 'data_de'))
+            if args.get('data_ate'):
+                condicoes.append(f"{self.coluna_data} < %s")
+                params.append(_data_param(args['data_ate'], 'data_ate') + timedelta(days=1))
+        return condicoes, params
+
+    def _ordem(self, args):
+        ordenar = args.get('ordenar') or self.ordem_padrao[0]
+        if ordenar not in self.ordenaveis:
+            raise ParametroInvalido(f'ordenar deve ser um de: {", ".join(sorted(self.ordenaveis))}')
+        direcao = (args.get('direcao') or self.ordem_padrao[1]).lower()
+        if direcao not in ('asc', 'desc'):
+            raise ParametroInvalido('direcao deve ser asc ou desc')
+        return ordenar, direcao
+
+    def consulta_completa(self, args):
+        """(sql, params) de todas as linhas com os filtros e a ordenação de ``args``, sem paginação"""
+        condicoes, params = self._condicoes(args)
+        ordenar, direcao = self._ordem(args)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+        ordem_sql = f"ORDER BY {self.ordenaveis[ordenar]} {direcao.upper()} NULLS LAST, id {direcao.upper()}"
+        return f"SELECT {self.colunas} FROM {self.tabela} {where} {ordem_sql}", params
+
+    def buscar(self, cur, args):
+        """Executa a listagem. Retorna (linhas, paginacao); paginacao é None no modo lista completa."""
+        if not modo_paginado(args):
+            cur.execute(*self.consulta_completa(args))
+            return [dict(row) for row in cur.fetchall()], None
+
+        condicoes, params = self._condicoes(args)
+        ordenar, direcao = self._ordem(args)
+        coluna_ordem = self.ordenaveis[ordenar]
+        comparador = '<' if direcao == 'desc' else '>'
+        ordem_sql = f"ORDER BY {coluna_ordem} {direcao.upper()} NULLS LAST, id {direcao.upper()}"
+
+        try:
+            limite = min(max(int(args.get('limite') or LIMITE_PADRAO), 1), LIMITE_MAXIMO)
+        except ValueError:
+            raise ParametroInvalido('limite deve ser um número')
+
+        total = None
+        if args.get('total') == '1':
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+            cur.execute(f"SELECT COUNT(*) FROM {self.tabela} {where}", params)
+            total = cur.fetchone()[0]
+
+        condicoes_pagina = list(condicoes)
+        params_pagina = list(params)
+        if args.get('cursor'):
+            valor, id_cursor = _decodificar_cursor(args['cursor'])
+            if valor is None:
+                # Cursor já na faixa de valores nulos (sempre no fim)
+                condicoes_pagina.append(f"({coluna_ordem} IS NULL AND id {comparador} %s)")
+                params_pagina.append(id_cursor)
+            else:
+                condicoes_pagina.append(
+                    f"({coluna_ordem} {comparador} %s OR ({coluna_ordem} = %s AND id {comparador} %s) OR {coluna_ordem} IS NULL)"
+                )
+                params_pagina.extend([valor, valor, id_cursor])
+
+        where = f"WHERE {' AND '.join(condicoes_pagina)}" if condicoes_pagina else ''
+        cur.execute(
+            f"SELECT {self.colunas}, {coluna_ordem} AS _chave_ordem FROM {self.tabela} {where} {ordem_sql} LIMIT %s",
+            params_pagina + [limite + 1]
+        )
+        linhas = [dict(row) for row in cur.fetchall()]
+        tem_mais = len(linhas) > limite
+        linhas = linhas[:limite]
+        proximo_cursor = _codificar_cursor(linhas[-1]['_chave_ordem'], linhas[-1]['id']) if tem_mais else None
+        for linha in linhas:
+            del linha['_chave_ordem']
+
+        paginacao = {
+            'limite': limite,
+            'ordenar': ordenar,
+            'direcao': direcao,
+            'tem_mais': tem_mais,
+            'proximo_cursor': proximo_cursor,
+        }
+        if total is not None:
+            paginacao['total'] = total
+        return linhas, paginacao
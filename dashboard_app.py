@@ -1,12 +1,12 @@
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, render_template, jsonify, request
 import psycopg2
 import psycopg2.extras
 import os
+import db_pool
 from dotenv import load_dotenv
-import time
-import pandas as pd
-import io
-from datetime import datetime
+import exportacao
+import snapshot
+import visoes_dashboard
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 ENV_PATH = os.path.join(BASE_DIR, '.env')
@@ -28,8 +28,16 @@ DB_CONFIG = {
     'database': os.getenv('DB_NAME')
 }
 
+db_pool.registrar_no_app(app, DB_CONFIG)
+
 def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    return db_pool.get_db_connection()
+
+def _env_float(nome, padrao):
+    try:
+        return float(os.getenv(nome, padrao))
+    except (TypeError, ValueError):
+        return padrao
 
 
 
@@ -37,234 +45,232 @@ def get_db_connection():
 def dashboard():
     return render_template('dashboard_standalone.html')
 
-@app.route('/api/dashboard-producao')
-def api_dashboard_producao():
-    try:
-        print(f"Connecting to database: {DB_CONFIG['host']}:{DB_CONFIG['port']}")
-        conn = get_db_connection()
-        print("Database connection successful")
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        # Get stock pieces grouped by PEÇA+OP
-        query_estoque = """
-        SELECT 
-            i.op,
-            i.peca,
-            i.projeto,
-            COALESCE(d.modelo, i.veiculo) as veiculo,
-            STRING_AGG(DISTINCT i.local, ', ' ORDER BY i.local) as locais,
-            COUNT(*) as quantidade,
-            COALESCE(UPPER(d.etapa), 'PEÇA NÃO ESTÁ NO PPLUG OU FOI APROVADA IF') as etapa,
-            COALESCE(UPPER(d.prioridade), 'NORMAL') as prioridade,
-            COALESCE(
-                NULLIF(STRING_AGG(DISTINCT NULLIF(i.sensor, ''), ', ' ORDER BY NULLIF(i.sensor, '')), ''),
-                (
-                    SELECT COALESCE(
-                        NULLIF(d2.sensor, ''),
-                        (
-                            SELECT NULLIF(p.sensor, '')
-                            FROM public.plano_controle_corte_vidro2 p
-                            WHERE p.op = i.op AND p.peca = 'PBS'
-                            AND p.sensor IS NOT NULL AND p.sensor != ''
-                            LIMIT 1
-                        )
-                    )
-                    FROM dados_uso_geral.dados_op d2
-                    WHERE d2.op::text = i.op::text AND d2.planta = 'Jarinu'
-                    LIMIT 1
-                ),
-                ''
-            ) as sensor
-        FROM pc_inventory i
-        LEFT JOIN dados_uso_geral.dados_op d ON i.op::text = d.op::text AND i.peca = d.item AND d.planta = 'Jarinu'
-        GROUP BY i.op, i.peca, i.projeto, COALESCE(d.modelo, i.veiculo), d.etapa, d.prioridade
-        ORDER BY MAX(i.id) DESC
-        """
-        
-        cursor.execute(query_estoque)
-        resultados_estoque = cursor.fetchall()
-        print(f"DEBUG: Found {len(resultados_estoque)} stock pieces")
-        
-        # Get pieces in production stages that are NOT in stock
-        # BLOCO PLANO: CORTE, LAPIDACAO, SERIGRAFIA, SINTERIZACAO, EMPOLVADO, BUFFER
-        # BLOCO CURVO: FORNO-S, RESFRIAMENTO, POS-FORNO, ACO, CORTE-CURVO
-        query_producao = """
-        SELECT DISTINCT
-            d.op,
-            d.item as peca,
-            d.codigo_veiculo as projeto,
-            COALESCE(CONCAT(f.marca, ' ', f.modelo), '') as veiculo,
-            UPPER(d.etapa) as etapa,
-            COALESCE(UPPER(d.prioridade), 'NORMAL') as prioridade,
-            CASE 
-                WHEN UPPER(d.etapa) IN ('CORTE', 'LAPIDACAO', 'SERIGRAFIA', 'SINTERIZACAO', 'EMPOLVADO', 'BUFFER') THEN 'BLOCO PLANO'
-                WHEN UPPER(d.etapa) IN ('FORNO-S', 'RESFRIAMENTO', 'POS-FORNO', 'ACO', 'CORTE-CURVO') THEN 'BLOCO CURVO'
-                ELSE 'OUTROS'
-            END as bloco
-        FROM dados_uso_geral.dados_op d
-        LEFT JOIN public.ficha_tecnica_veiculos f ON d.codigo_veiculo = f.codigo_veiculo
-        WHERE UPPER(d.etapa) IN ('CORTE', 'LAPIDACAO', 'SERIGRAFIA', 'SINTERIZACAO', 'EMPOLVADO', 'BUFFER', 'FORNO-S', 'RESFRIAMENTO', 'POS-FORNO', 'ACO', 'CORTE-CURVO')
-        AND d.planta = 'Jarinu'
-        AND NOT EXISTS (
-            SELECT 1 FROM pc_inventory i 
-            WHERE i.op::text = d.op::text AND i.peca = d.item
-        )
-        AND NOT EXISTS (
-            SELECT 1 FROM pc_otimizadas o 
-            WHERE o.op::text = d.op::text AND o.peca = d.item
-        )
-        AND d.op::text NOT IN (
-            SELECT DISTINCT e.op::text 
-            FROM pc_exit e 
-            WHERE e.peca = d.item
-            AND e.data >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
-        )
-        ORDER BY d.op, d.item
-        """
-        
-        cursor.execute(query_producao)
-        resultados_producao = cursor.fetchall()
-        print(f"DEBUG: Found {len(resultados_producao)} production pieces")
-        
-        # Debug: Check recent exits
-        cursor.execute("""
-        SELECT op, peca, data, 
-               EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - data))/3600 as hours_ago
-        FROM pc_exit 
-        WHERE data >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
-        ORDER BY data DESC
-        """)
-        recent_exits = cursor.fetchall()
-        print(f"DEBUG: Recent exits in last 24h: {len(recent_exits)}")
-        for exit_row in recent_exits:
-            print(f"  Exit: {exit_row[1]}+{exit_row[0]} at {exit_row[2]} ({exit_row[3]:.1f}h ago)")
-        
-        # Debug: Check if specific pieces in production have recent exits
-        for prod_row in resultados_producao:
-            cursor.execute("""
-            SELECT COUNT(*), MAX(data) as last_exit
-            FROM pc_exit 
-            WHERE op::text = %s AND peca = %s
-            AND data >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
-            """, (str(prod_row[0]), prod_row[1]))
-            exit_check = cursor.fetchone()
-            if exit_check[0] > 0:
-                print(f"  WARNING: {prod_row[1]}+{prod_row[0]} in production but has recent exit: {exit_check[1]}")
-        
-        # Get pieces that have passed assembly (critical stages) - ONLY those in stock
-        query_pos_montagem = """
-        SELECT 
-            i.op,
-            i.peca,
-            i.projeto,
-            COALESCE(d.modelo, i.veiculo) as veiculo,
-            STRING_AGG(DISTINCT i.local, ', ' ORDER BY i.local) as locais,
-            COUNT(*) as quantidade,
-            CASE 
-                WHEN (
-                    SELECT a.etapa 
-                    FROM apontamento_pplug_jarinu a 
-                    WHERE a.op = i.op AND a.item = i.peca 
-                    ORDER BY a.data DESC 
-                    LIMIT 1
-                ) = 'INSPECAO FINAL' THEN 'PEÇA APROVADA INSP FINAL'
-                ELSE UPPER(d.etapa)
-            END as etapa,
-            COALESCE(UPPER(d.prioridade), 'NORMAL') as prioridade
-        FROM pc_inventory i
-        INNER JOIN dados_uso_geral.dados_op d ON i.op::text = d.op::text AND i.peca = d.item AND d.planta = 'Jarinu'
-        WHERE UPPER(d.etapa) IN ('MONTAGEM', 'INSPECAO FINAL', 'BUFFER-AUTOCLAVE', 'AUTOCLAVE', 'EMBOLSADO')
-        GROUP BY i.op, i.peca, i.projeto, COALESCE(d.modelo, i.veiculo), d.etapa, d.prioridade
-        ORDER BY MAX(i.id) DESC
-        """
-        
-        cursor.execute(query_pos_montagem)
-        resultados_pos_montagem = cursor.fetchall()
-        print(f"DEBUG: Found {len(resultados_pos_montagem)} post-assembly pieces")
-        
-        dados = []
-        
-        # Process stock pieces
-        for row in resultados_estoque:
-            etapa = row[6]
-            prioridade = row[7]
-            status = 'normal'
-            if etapa == 'PEÇA NÃO ESTÁ NO PPLUG OU FOI APROVADA IF':
-                status = 'critico'
-            # Removed duplicate logic - post-assembly pieces are handled separately
-            elif etapa in ['PRE-MONTAGEM', 'PREMONTAGEM']:
-                status = 'aviso'
-            
-            if etapa == 'BUFFER-AUTOCLAVE':
-                etapa = 'BUFFER-ACV'
-            
-            dados.append({
-                'op': row[0] or '',
-                'peca': row[1] or '',
-                'projeto': row[2] or '',
-                'veiculo': row[3] or '',
-                'local': row[4] or '',
-                'quantidade': row[5],
-                'etapa': etapa,
-                'prioridade': prioridade,
-                'status': status,
-                'sensor': row[8] or ''
-            })
+def calcular_dashboard(conn):
+    """Dados do dashboard (estoque, produção fora do estoque e pós-montagem), como lista de dicts"""
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    
+    # Get stock pieces grouped by PEÇA+OP (visão materializada, atualizada em _calcular_snapshot)
+    cursor.execute(visoes_dashboard.CONSULTA_ESTOQUE)
+    resultados_estoque = cursor.fetchall()
+    print(f"DEBUG: Found {len(resultados_estoque)} stock pieces")
+    
+    # Get pieces in production stages that are NOT in stock
+    # BLOCO PLANO: CORTE, LAPIDACAO, SERIGRAFIA, SINTERIZACAO, EMPOLVADO, BUFFER
+    # BLOCO CURVO: FORNO-S, RESFRIAMENTO, POS-FORNO, ACO, CORTE-CURVO
+    query_producao = """
+    SELECT DISTINCT
+        d.op,
+        d.item as peca,
+        d.codigo_veiculo as projeto,
+        COALESCE(CONCAT(f.marca, ' ', f.modelo), '') as veiculo,
+        UPPER(d.etapa) as etapa,
+        COALESCE(UPPER(d.prioridade), 'NORMAL') as prioridade,
+        CASE 
+            WHEN UPPER(d.etapa) IN ('CORTE', 'LAPIDACAO', 'SERIGRAFIA', 'SINTERIZACAO', 'EMPOLVADO', 'BUFFER') THEN 'BLOCO PLANO'
+            WHEN UPPER(d.etapa) IN ('FORNO-S', 'RESFRIAMENTO', 'POS-FORNO', 'ACO', 'CORTE-CURVO') THEN 'BLOCO CURVO'
+            ELSE 'OUTROS'
+        END as bloco
+    FROM dados_uso_geral.dados_op d
+    LEFT JOIN public.ficha_tecnica_veiculos f ON d.codigo_veiculo = f.codigo_veiculo
+    WHERE UPPER(d.etapa) IN ('CORTE', 'LAPIDACAO', 'SERIGRAFIA', 'SINTERIZACAO', 'EMPOLVADO', 'BUFFER', 'FORNO-S', 'RESFRIAMENTO', 'POS-FORNO', 'ACO', 'CORTE-CURVO')
+    AND d.planta = 'Jarinu'
+    AND NOT EXISTS (
+        SELECT 1 FROM pc_inventory i 
+        WHERE i.op::text = d.op::text AND i.peca = d.item
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM pc_otimizadas o 
+        WHERE o.op::text = d.op::text AND o.peca = d.item
+    )
+    AND d.op::text NOT IN (
+        SELECT DISTINCT e.op::text 
+        FROM pc_exit e 
+        WHERE e.peca = d.item
+        AND e.data >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
+    )
+    ORDER BY d.op, d.item
+    """
+    
+    cursor.execute(query_producao)
+    resultados_producao = cursor.fetchall()
+    print(f"DEBUG: Found {len(resultados_producao)} production pieces")
+    
+    # Get pieces that have passed assembly (critical stages) - ONLY those in stock
+    cursor.execute(visoes_dashboard.CONSULTA_POS_MONTAGEM)
+    resultados_pos_montagem = cursor.fetchall()
+    print(f"DEBUG: Found {len(resultados_pos_montagem)} post-assembly pieces")
+    
+    dados = []
+    
+    # Process stock pieces
+    for row in resultados_estoque:
+        etapa = row[6]
+        prioridade = row[7]
+        status = 'normal'
+        if etapa == 'PEÇA NÃO ESTÁ NO PPLUG OU FOI APROVADA IF':
+            status = 'critico'
+        # Removed duplicate logic - post-assembly pieces are handled separately
+        elif etapa in ['PRE-MONTAGEM', 'PREMONTAGEM']:
+            status = 'aviso'
         
-        # Process production pieces not in stock
-        for row in resultados_producao:
-            etapa = row[4]
-            prioridade = row[5]
-            bloco = row[6]
-            
-            # Define status based on block
-            status = 'plano' if bloco == 'BLOCO PLANO' else 'curvo'
-            
-            dados.append({
-                'op': row[0] or '',
-                'peca': row[1] or '',
-                'projeto': row[2] or '',
-                'veiculo': row[3] or '',
-                'local': etapa,
-                'quantidade': 1,
-                'etapa': etapa,
-                'prioridade': prioridade,
-                'status': status,
-                'bloco': bloco
-            })
+        if etapa == 'BUFFER-AUTOCLAVE':
+            etapa = 'BUFFER-ACV'
         
-        # Process pieces that have passed assembly (in stock)
-        for row in resultados_pos_montagem:
-            etapa = row[6]
-            prioridade = row[7]
-            
-            dados.append({
-                'op': row[0] or '',
-                'peca': row[1] or '',
-                'projeto': row[2] or '',
-                'veiculo': row[3] or '',
-                'local': row[4] or '',
-                'quantidade': row[5],
-                'etapa': etapa,
-                'prioridade': prioridade,
-                'status': 'critico'
-            })
+        dados.append({
+            'op': row[0] or '',
+            'peca': row[1] or '',
+            'projeto': row[2] or '',
+            'veiculo': row[3] or '',
+            'local': row[4] or '',
+            'quantidade': row[5],
+            'etapa': etapa,
+            'prioridade': prioridade,
+            'status': status,
+            'sensor': row[8] or '',
+            'origem': 'estoque'
+        })
+    
+    # Process production pieces not in stock
+    for row in resultados_producao:
+        etapa = row[4]
+        prioridade = row[5]
+        bloco = row[6]
         
-        cursor.close()
-        conn.close()
+        # Define status based on block
+        status = 'plano' if bloco == 'BLOCO PLANO' else 'curvo'
         
-        print(f"DEBUG: Returning {len(dados)} total pieces (Stock: {len(resultados_estoque)}, Production: {len(resultados_producao)}, Post-Assembly in Stock: {len(resultados_pos_montagem)})")
-        return jsonify(dados)
+        dados.append({
+            'op': row[0] or '',
+            'peca': row[1] or '',
+            'projeto': row[2] or '',
+            'veiculo': row[3] or '',
+            'local': etapa,
+            'quantidade': 1,
+            'etapa': etapa,
+            'prioridade': prioridade,
+            'status': status,
+            'bloco': bloco,
+            'origem': 'producao'
+        })
+    
+    # Process pieces that have passed assembly (in stock)
+    for row in resultados_pos_montagem:
+        etapa = row[6]
+        prioridade = row[7]
         
+        dados.append({
+            'op': row[0] or '',
+            'peca': row[1] or '',
+            'projeto': row[2] or '',
+            'veiculo': row[3] or '',
+            'local': row[4] or '',
+            'quantidade': row[5],
+            'etapa': etapa,
+            'prioridade': prioridade,
+            'status': 'critico',
+            'origem': 'pos_montagem'
+        })
+    
+    cursor.close()
+    
+    print(f"DEBUG: Returning {len(dados)} total pieces (Stock: {len(resultados_estoque)}, Production: {len(resultados_producao)}, Post-Assembly in Stock: {len(resultados_pos_montagem)})")
+    return dados
+
+# Etapas de produção consideradas em query_producao (BLOCO PLANO + BLOCO CURVO)
+ETAPAS_PRODUCAO = [
+    'CORTE', 'LAPIDACAO', 'SERIGRAFIA', 'SINTERIZACAO', 'EMPOLVADO', 'BUFFER',
+    'FORNO-S', 'RESFRIAMENTO', 'POS-FORNO', 'ACO', 'CORTE-CURVO'
+]
+
+def diagnostico_saidas(conn):
+    """Saídas das últimas 24h, indicando as peças que ainda estão em etapa de produção
+    (e por isso ficam fora do dashboard). Uma consulta só, em vez de uma por peça."""
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cursor.execute("""
+    WITH saidas_recentes AS (
+        SELECT e.op::text AS op, e.peca, COUNT(*) AS saidas, MAX(e.data) AS ultima_saida
+        FROM pc_exit e
+        WHERE e.data >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
+        GROUP BY e.op::text, e.peca
+    )
+    SELECT s.op, s.peca, s.saidas, s.ultima_saida,
+           EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - s.ultima_saida))/3600 AS horas,
+           p.etapa AS etapa_producao
+    FROM saidas_recentes s
+    LEFT JOIN LATERAL (
+        SELECT UPPER(d.etapa) AS etapa
+        FROM dados_uso_geral.dados_op d
+        WHERE d.op::text = s.op AND d.item = s.peca AND d.planta = 'Jarinu'
+        AND UPPER(d.etapa) = ANY(%s)
+        LIMIT 1
+    ) p ON TRUE
+    ORDER BY s.ultima_saida DESC
+    """, (ETAPAS_PRODUCAO,))
+    saidas = [{
+        'op': row['op'],
+        'peca': row['peca'],
+        'saidas': row['saidas'],
+        'ultima_saida': row['ultima_saida'].isoformat() if row['ultima_saida'] else None,
+        'horas': round(float(row['horas']), 1),
+        'etapa_producao': row['etapa_producao']
+    } for row in cursor.fetchall()]
+    cursor.close()
+    return {
+        'saidas_24h': len(saidas),
+        'em_producao_com_saida': [s for s in saidas if s['etapa_producao']],
+        'saidas': saidas
+    }
+
+def _calcular_snapshot():
+    with db_pool.db_connection() as conn:
+        duracao = visoes_dashboard.atualizar(conn)
+        print(f"DEBUG: Visões do dashboard atualizadas em {duracao:.2f}s")
+        return calcular_dashboard(conn)
+
+def _chave_dashboard(linha):
+    return f"{linha['origem']}|{linha['op']}|{linha['peca']}|{linha['projeto']}|{linha['veiculo']}"
+
+# Calculado em segundo plano e servido igual para todas as telas abertas (snapshot.py).
+# Recalcula (com refresh das visões materializadas) no intervalo e logo após mudanças
+# em estoque/otimizadas/saídas (NOTIFY da migração 0008); as telas recebem só as
+# diferenças por /api/dashboard-producao/eventos.
+dashboard_snapshot = snapshot.Snapshot(
+    'dashboard-producao',
+    _calcular_snapshot,
+    intervalo=_env_float('DASHBOARD_INTERVALO', 60),
+    intervalo_minimo=_env_float('DASHBOARD_INTERVALO_MINIMO', 5),
+    chave=_chave_dashboard
+)
+
+@app.route('/api/dashboard-producao')
+def api_dashboard_producao():
+    return dashboard_snapshot.resposta(request)
+
+@app.route('/api/dashboard-producao/eventos')
+def eventos_dashboard_producao():
+    return dashboard_snapshot.eventos(request)
+
+@app.route('/api/dashboard-producao/estado')
+def estado_dashboard_producao():
+    return jsonify(dashboard_snapshot.estado())
+
+@app.route('/api/dashboard-producao/diagnostico')
+def diagnostico_dashboard_producao():
+    # Consultado sob demanda; não faz parte do ciclo do snapshot
+    try:
+        conn = get_db_connection()
+        try:
+            return jsonify(diagnostico_saidas(conn))
+        finally:
+            conn.close()
     except Exception as e:
-        print(f"Dashboard error: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"Dashboard diagnostic error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/gerar-excel-dashboard', methods=['POST'])
 def gerar_excel_dashboard():
     try:
+        formato = exportacao.formato_pedido(request)
         dados = request.get_json()
         dados_dashboard = dados.get('dados', [])
         aba_ativa = dados.get('aba_ativa', 'premontagem')
@@ -292,50 +298,18 @@ def gerar_excel_dashboard():
         if not dados_filtrados:
             return jsonify({'success': False, 'message': f'Nenhum dado encontrado para a aba {nome_aba}'})
         
-        # Preparar dados para Excel
-        dados_excel = []
-        for item in dados_filtrados:
-            # Mapear status para categoria descritiva
-            status_map = {
-                'aviso': 'Peças no Corte Curvo - Pré-Montagem',
-                'plano': 'Bloco Plano - Peças Sem PC',
-                'curvo': 'Bloco Curvo - Peças Sem PC', 
-                'critico': 'Peças que já passaram da Montagem'
-            }
-            
-            categoria = status_map.get(item.get('status', ''), item.get('status', '').upper())
-            
-            dados_excel.append({
-                'OP': item.get('op', ''),
-                'PEÇA': item.get('peca', ''),
-                'PROJETO': item.get('projeto', ''),
-                'VEÍCULO': item.get('veiculo', ''),
-                'LOCAL': item.get('local', ''),
-                'SENSOR': item.get('sensor', ''),
-                'ETAPA': item.get('etapa', ''),
-                'PRIORIDADE': item.get('prioridade', ''),
-                'CATEGORIA': categoria,
-                'QUANTIDADE': item.get('quantidade', 1)
-            })
-        
-        df = pd.DataFrame(dados_excel)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'dashboard_producao_{timestamp}.xlsx'
-        
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl', sheet_name=nome_aba)
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        # Categoria descritiva de cada status; colunas em exportacao.RELATORIO_DASHBOARD
+        linhas = exportacao.linhas_dashboard(dados_filtrados)
+        return exportacao.resposta(exportacao.RELATORIO_DASHBOARD, linhas, formato, aba=nome_aba)
     
+    except exportacao.FormatoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao gerar Excel: {str(e)}'}), 500
 
+dashboard_snapshot.iniciar()
+if os.getenv('DASHBOARD_NOTIFY', '1') != '0':
+    dashboard_snapshot.ouvir_notify(DB_CONFIG, 'dashboard_producao')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002, debug=False)
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""Pool de conexões PostgreSQL compartilhado por app.py e dashboard_app.py.
+
+Cada processo (worker do gunicorn ou dashboard) mantém um único pool
+thread-safe. As conexões entregues por ``get_db_connection`` continuam com a
+mesma interface do psycopg2: ``conn.close()`` apenas devolve a conexão ao pool.
+Dentro de uma requisição Flask, conexões esquecidas (ex.: exceção antes do
+``conn.close()``) são devolvidas automaticamente no teardown.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+
+class PoolEsgotadoError(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera configurado."""
+
+
+def _env_int(nome, padrao):
+    try:
+        return int(os.getenv(nome, padrao))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _env_float(nome, padrao):
+    try:
+        return float(os.getenv(nome, padrao))
+    except (TypeError, ValueError):
+        return padrao
+
+
+class ConexaoPool:
+    """Proxy de uma conexão psycopg2 emprestada do pool.
+
+    Delega tudo para a conexão real, exceto ``close()``, que devolve a conexão
+    ao pool. Pode ser fechada mais de uma vez sem efeito colateral.
+    """
+
+    __slots__ = ('_conn', '_pool', '_devolvida', '__weakref__')
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+        self._devolvida = False
+
+    def __getattr__(self, nome):
+        if self._devolvida:
+            raise psycopg2.InterfaceError('conexão já devolvida ao pool')
+        return getattr(self._conn, nome)
+
+    def __setattr__(self, nome, valor):
+        if nome in ConexaoPool.__slots__:
+            object.__setattr__(self, nome, valor)
+        else:
+            setattr(self._conn, nome, valor)
+
+    @property
+    def closed(self):
+        return 1 if self._devolvida else self._conn.closed
+
+    @property
+    def conexao_real(self):
+        return self._conn
+
+    def close(self):
+        if self._devolvida:
+            return
+        self._devolvida = True
+        self._pool.devolver(self._conn)
+
+
+class PoolConexoes:
+    """ThreadedConnectionPool com espera limitada e health check no checkout."""
+
+    def __init__(self, db_config, minimo=1, maximo=10, timeout=30.0, checar_apos=30.0):
+        self.db_config = dict(db_config)
+        self.minimo = max(0, minimo)
+        self.maximo = max(1, maximo, self.minimo)
+        self.timeout = timeout
+        self.checar_apos = checar_apos
+        self.pid = os.getpid()
+        self._pool = psycopg2.pool.ThreadedConnectionPool(self.minimo, self.maximo, **self.db_config)
+        self._vagas = threading.BoundedSemaphore(self.maximo)
+        self._ultimo_uso = {}
+        self._lock = threading.Lock()
+
+    def _conexao_saudavel(self, conn):
+        if conn.closed:
+            return False
+        with self._lock:
+            ultimo_uso = self._ultimo_uso.get(id(conn), 0)
+        if time.monotonic() - ultimo_uso < self.checar_apos:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def obter(self):
+        if not self._vagas.acquire(timeout=self.timeout):
+            raise PoolEsgotadoError(f'Nenhuma conexão livre após {self.timeout:.0f}s (máximo {self.maximo})')
+        try:
+            conn = self._pool.getconn()
+            if not self._conexao_saudavel(conn):
+                print("DEBUG POOL: Conexão inválida descartada, abrindo nova")
+                self._descartar(conn)
+                conn = self._pool.getconn()
+            return ConexaoPool(conn, self)
+        except Exception:
+            self._vagas.release()
+            raise
+
+    def _descartar(self, conn):
+        with self._lock:
+            self._ultimo_uso.pop(id(conn), None)
+        try:
+            self._pool.putconn(conn, close=True)
+        except Exception:
+            pass
+
+    def devolver(self, conn):
+        try:
+            if conn.closed:
+                self._descartar(conn)
+                return
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                self._descartar(conn)
+                return
+            with self._lock:
+                self._ultimo_uso[id(conn)] = time.monotonic()
+            self._pool.putconn(conn)
+        finally:
+            self._vagas.release()
+
+    def fechar(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_db_config = None
+
+
+def configurar_pool(db_config):
+    """Registra a configuração do banco. O pool é criado no primeiro uso."""
+    global _db_config
+    _db_config = dict(db_config)
+
+
+def obter_pool():
+    global _pool
+    if _db_config is None:
+        raise RuntimeError('configurar_pool() não foi chamado')
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        # Após fork (gunicorn), cada processo cria seu próprio pool
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = PoolConexoes(
+                _db_config,
+                minimo=_env_int('DB_POOL_MIN', 1),
+                maximo=_env_int('DB_POOL_MAX', 10),
+                timeout=_env_float('DB_POOL_TIMEOUT', 30),
+                checar_apos=_env_float('DB_POOL_CHECK_IDLE', 30),
+            )
+            print(f"DEBUG POOL: Pool criado (pid {_pool.pid}, min {_pool.minimo}, max {_pool.maximo})")
+        return _pool
+
+
+def _conexoes_da_requisicao():
+    try:
+        from flask import g, has_app_context
+    except ImportError:
+        return None
+    if not has_app_context():
+        return None
+    if '_conexoes_pool' not in g:
+        g._conexoes_pool = []
+    return g._conexoes_pool
+
+
+def get_db_connection():
+    """Empresta uma conexão do pool; ``conn.close()`` a devolve."""
+    conn = obter_pool().obter()
+    conexoes = _conexoes_da_requisicao()
+    if conexoes is not None:
+        conexoes.append(conn)
+    return conn
+
+
+@contextmanager
+def db_connection():
+    """Context manager que sempre devolve a conexão, inclusive em exceções.
+
+    Não faz commit automático: quem altera dados chama ``conn.commit()``.
+    """
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def devolver_conexoes_pendentes(exc=None):
+    """Teardown do Flask: devolve conexões que a rota não fechou."""
+    try:
+        from flask import g
+        conexoes = g.pop('_conexoes_pool', None)
+    except (ImportError, RuntimeError):
+        return
+    for conn in conexoes or ():
+        if not conn.closed:
+            conn.close()
+
+
+def registrar_no_app(app, db_config):
+    configurar_pool(db_config)
+    app.teardown_appcontext(devolver_conexoes_pendentes)
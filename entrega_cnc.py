@@ -0,0 +1,232 @@
+"""Entrega de arquivos na pasta da CNC sem travar as requisições.
+
+Quem gera o arquivo grava numa pasta local (spool) e segue em frente; uma
+thread por processo (o "expedidor") move os arquivos para a pasta da CNC:
+
+    spool/<nome>  ->  reservado em spool/.enviando/ (rename: um worker só)
+                  ->  <destino>/<nome>.tmp  ->  rename para <destino>/<nome>
+
+A pasta da rede só é tocada pelo expedidor. Quando ela falha ou some, as
+tentativas seguintes esperam cada vez mais (até ``CNC_ESPERA_MAXIMA``), os
+arquivos continuam no spool e são entregues quando ela voltar. ``estado()``
+devolve o resultado da última verificação, sem acessar a rede.
+
+Variáveis de ambiente:
+    CNC_DESTINO         pasta da CNC (UNC no Windows ou o ponto de montagem, ex. /mnt/cnc-policarbonato)
+    CNC_SPOOL           pasta local de saída (padrão: spool_cnc ao lado do app)
+    CNC_INTERVALO       segundos entre varreduras do spool (padrão 2)
+    CNC_ESPERA_MAXIMA   espera máxima entre tentativas com a pasta fora (padrão 60)
+"""
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import arquivos_temp
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DESTINO_PADRAO = r"\\10.150.16.39\cnc-policarbonato"
+
+# Reserva de outro worker que não terminou nesse tempo volta para o spool
+RESERVA_VENCIDA = 600
+# Com o spool vazio, a pasta da CNC ainda é verificada a cada tantos segundos
+INTERVALO_VERIFICACAO = 30
+
+
+def _env_float(nome, padrao):
+    try:
+        return float(os.getenv(nome, padrao))
+    except (TypeError, ValueError):
+        return padrao
+
+
+class EntregaCNC:
+    def __init__(self, destino, spool, intervalo=2.0, espera_maxima=60.0):
+        self.destino = destino
+        self.spool = spool
+        self.enviando = os.path.join(spool, '.enviando')
+        self.intervalo = intervalo
+        self.espera_maxima = espera_maxima
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._estado = {
+            'acessivel': None,  # None: ainda não verificada
+            'verificada_em': None,
+            'latencia_ms': None,
+            'ultimo_envio': None,
+            'ultimo_erro': None,
+            'falhas_seguidas': 0,
+        }
+
+    # --- lado de quem gera os arquivos ---
+
+    @contextmanager
+    def arquivo(self, nome_arquivo):
+        """Arquivo novo no spool; só fica visível para o expedidor depois de gravado por inteiro."""
+        os.makedirs(self.spool, exist_ok=True)
+        with arquivos_temp.escrever_atomico(os.path.join(self.spool, os.path.basename(nome_arquivo))) as f:
+            yield f
+        self._acordar.set()
+
+    def enviar(self, nome_arquivo, conteudo):
+        with self.arquivo(nome_arquivo) as f:
+            f.write(conteudo)
+
+    def estado(self):
+        with self._lock:
+            estado = dict(self._estado)
+        estado['destino'] = self.destino
+        estado['pendentes'] = len(self.pendentes())
+        return estado
+
+    def disponivel(self):
+        """Pasta da CNC acessível na última verificação (desconhecido conta como sim)"""
+        with self._lock:
+            return self._estado['acessivel'] is not False
+
+    def pendentes(self):
+        try:
+            return sorted(
+                entrada.name for entrada in os.scandir(self.spool)
+                if entrada.is_file() and not entrada.name.endswith('.tmp')
+            )
+        except FileNotFoundError:
+            return []
+
+    # --- expedidor ---
+
+    def iniciar(self):
+        """Sobe a thread do expedidor uma vez por processo."""
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._laco, name='entrega-cnc', daemon=True)
+            self._thread.start()
+        print(f"DEBUG CNC: Expedidor iniciado (spool {self.spool} -> {self.destino})")
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def verificar(self):
+        """Testa a pasta da CNC e registra o resultado em ``estado()``."""
+        inicio = time.monotonic()
+        try:
+            acessivel = os.path.isdir(self.destino)
+            erro = None if acessivel else 'pasta da CNC inacessível'
+        except OSError as e:
+            acessivel, erro = False, str(e)
+        self._registrar(acessivel, erro, latencia=time.monotonic() - inicio)
+        return acessivel
+
+    def _registrar(self, sucesso, erro=None, latencia=None, enviado=False):
+        with self._lock:
+            self._estado['acessivel'] = sucesso
+            self._estado['verificada_em'] = time.time()
+            if latencia is not None:
+                self._estado['latencia_ms'] = round(latencia * 1000, 1)
+            if sucesso:
+                self._estado['falhas_seguidas'] = 0
+                if enviado:
+                    self._estado['ultimo_envio'] = time.time()
+            else:
+                self._estado['falhas_seguidas'] += 1
+                self._estado['ultimo_erro'] = erro
+
+    def _reservar(self, nome):
+        os.makedirs(self.enviando, exist_ok=True)
+        reservado = os.path.join(self.enviando, f"{nome}.{os.getpid()}")
+        try:
+            os.rename(os.path.join(self.spool, nome), reservado)
+        except OSError:
+            # Outro worker pegou primeiro
+            return None
+        # rename mantém o mtime antigo; a reserva vence contando a partir de agora
+        os.utime(reservado, None)
+        return reservado
+
+    def _devolver(self, reservado, nome):
+        try:
+            os.rename(reservado, os.path.join(self.spool, nome))
+        except OSError as e:
+            print(f"DEBUG CNC: Não foi possível devolver {nome} ao spool: {e}")
+
+    def _recuperar_reservas(self):
+        """Reservas vencidas (worker que morreu no meio do envio) voltam para o spool"""
+        try:
+            entradas = list(os.scandir(self.enviando))
+        except FileNotFoundError:
+            return
+        limite = time.time() - RESERVA_VENCIDA
+        for entrada in entradas:
+            try:
+                if entrada.stat().st_mtime < limite:
+                    self._devolver(entrada.path, entrada.name.rsplit('.', 1)[0])
+            except OSError:
+                continue
+
+    def _entregar(self, nome, reservado):
+        final = os.path.join(self.destino, nome)
+        with open(reservado, 'rb') as origem, arquivos_temp.escrever_atomico(final) as f:
+            shutil.copyfileobj(origem, f, 1024 * 1024)
+        os.remove(reservado)
+
+    def processar(self):
+        """Uma varredura do spool. Retorna (entregues, houve_falha)."""
+        self._recuperar_reservas()
+        pendentes = self.pendentes()
+        if not pendentes:
+            with self._lock:
+                verificada_em = self._estado['verificada_em']
+            if verificada_em is None or time.time() - verificada_em > INTERVALO_VERIFICACAO:
+                self.verificar()
+            return 0, False
+        if not self.verificar():
+            return 0, True
+        entregues = 0
+        for nome in pendentes:
+            reservado = self._reservar(nome)
+            if reservado is None:
+                continue
+            inicio = time.monotonic()
+            try:
+                self._entregar(nome, reservado)
+            except OSError as e:
+                self._devolver(reservado, nome)
+                self._registrar(False, f"{nome}: {e}")
+                print(f"DEBUG CNC: Falha ao entregar {nome}: {e}")
+                return entregues, True
+            entregues += 1
+            self._registrar(True, latencia=time.monotonic() - inicio, enviado=True)
+            print(f"DEBUG CNC: {nome} entregue em {self.destino}")
+        return entregues, False
+
+    def _laco(self):
+        espera = self.intervalo
+        while not self._parar.is_set():
+            try:
+                _, falhou = self.processar()
+            except Exception as e:
+                print(f"DEBUG CNC: Erro no expedidor: {e}")
+                falhou = True
+            if falhou:
+                # Pasta fora: esperar cada vez mais, sem acordar a cada arquivo novo
+                espera = min(espera * 2, self.espera_maxima)
+                self._parar.wait(espera)
+            else:
+                espera = self.intervalo
+                self._acordar.wait(espera)
+            self._acordar.clear()
+
+
+entrega = EntregaCNC(
+    destino=os.getenv('CNC_DESTINO', DESTINO_PADRAO),
+    spool=os.getenv('CNC_SPOOL', os.path.join(BASE_DIR, 'spool_cnc')),
+    intervalo=_env_float('CNC_INTERVALO', 2),
+    espera_maxima=_env_float('CNC_ESPERA_MAXIMA', 60),
+)
@@ -0,0 +1,449 @@
+"""PDF de etiquetas (100 x 50 mm, uma etiqueta por página).
+
+O código de barras Code128 (peça + OP) é desenhado como vetor pelo próprio
+reportlab, sem gerar PNG nem arquivo temporário. Cada código é montado uma
+vez por documento como um Form XObject do PDF e reaproveitado em todas as
+cópias (``quantidade_etiquetas``) e etiquetas com o mesmo texto.
+
+As barras ocupam a mesma área da imagem que o python-barcode gerava antes
+(zona de silêncio de 2,54 mm em módulos de 0,2 mm, margem de 1 mm acima e
+abaixo de barras de 15 mm, tudo esticado para a faixa de 10 mm da etiqueta).
+
+Lotes grandes (``gerar_pdf_paralelo``) são divididos em blocos de
+``ETIQUETAS_LOTE`` páginas, desenhados em paralelo por processos separados
+(cada um com o mesmo ``desenhar_etiqueta``) e juntados em um único PDF na
+ordem original, à medida que ficam prontos (``JuncaoPDF``). A junção só copia
+e renumera os objetos dos blocos, sem reinterpretar as páginas: com pypdf ela
+custava quase o mesmo que desenhar, e o ganho dos processos sumia.
+
+Variáveis de ambiente:
+    ETIQUETAS_PROCESSOS   processos para lotes grandes (padrão: núcleos disponíveis no container)
+    ETIQUETAS_LOTE        páginas por bloco (padrão 250)
+    ETIQUETAS_LIMITE      acima de tantas páginas o PDF é gerado em segundo plano (padrão 1000)
+
+``python etiquetas.py`` mede etiquetas/s do desenho vetorial contra o PNG antigo
+e do modo paralelo.
+"""
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+from reportlab.graphics.barcode.code128 import Code128
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+LARGURA = 100 * mm
+ALTURA = 50 * mm
+
+
+def _env_int(nome, padrao):
+    try:
+        return int(os.getenv(nome, padrao))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _nucleos():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+PROCESSOS = _env_int('ETIQUETAS_PROCESSOS', _nucleos())
+TAMANHO_LOTE = max(_env_int('ETIQUETAS_LOTE', 250), 1)
+LIMITE_SINCRONO = _env_int('ETIQUETAS_LIMITE', 1000)
+
+# Geometria da imagem do python-barcode (em mm), para manter as proporções
+_MODULO = 0.2
+_ZONA_SILENCIO = 2.54
+_ALTURA_BARRAS = 15.0
+_MARGEM_BARRAS = 1.0
+
+
+@lru_cache(maxsize=4096)
+def _modulos(texto):
+    """Largura do código em módulos (sem zona de silêncio); ValueError se não dá para codificar."""
+    if not texto or not texto.isascii():
+        raise ValueError(f"Texto inválido para Code128: {texto!r}")
+    return Code128(texto, barWidth=1, quiet=0, humanReadable=0).width
+
+
+class CodigosDeBarras:
+    """Códigos de barras de um documento: cada texto vira um Form XObject desenhado uma vez."""
+
+    def __init__(self, c, largura, altura):
+        self.c = c
+        self.largura = largura
+        self.altura = altura
+        self._formularios = {}
+
+    def _codigo(self, texto):
+        """(Code128, x, y) dentro da faixa, ou None se o texto não pode ser codificado"""
+        try:
+            modulos = _modulos(texto)
+        except Exception:
+            return None
+        altura_total = _ALTURA_BARRAS + 2 * _MARGEM_BARRAS
+        codigo = Code128(
+            texto,
+            barWidth=self.largura / (modulos + 2 * _ZONA_SILENCIO / _MODULO),
+            barHeight=self.altura * _ALTURA_BARRAS / altura_total,
+            quiet=0,
+            humanReadable=0,
+        )
+        x = self.largura * _ZONA_SILENCIO / (modulos * _MODULO + 2 * _ZONA_SILENCIO)
+        return codigo, x, self.altura * _MARGEM_BARRAS / altura_total
+
+    def preparar(self, textos):
+        """Define os formulários dos ``textos`` ainda não definidos.
+
+        O reportlab monta o formulário com o que foi desenhado na página atual,
+        então isso precisa acontecer com a página vazia (antes de cada etiqueta).
+        """
+        for texto in textos:
+            if texto in self._formularios:
+                continue
+            codigo = self._codigo(texto)
+            if codigo is None:
+                self._formularios[texto] = None
+                continue
+            codigo, x, y = codigo
+            nome = f"cb{len(self._formularios)}"
+            self.c.beginForm(nome, 0, 0, self.largura, self.altura)
+            codigo.drawOn(self.c, x, y)
+            self.c.endForm()
+            self._formularios[texto] = nome
+
+    def desenhar(self, texto, x, y):
+        """Desenha o código em (x, y). Retorna False se o texto não pode ser codificado.
+
+        Texto sem ``preparar`` é desenhado direto, sem formulário.
+        """
+        if texto not in self._formularios:
+            codigo = self._codigo(texto)
+            if codigo is None:
+                return False
+            codigo, dx, dy = codigo
+            codigo.drawOn(self.c, x + dx, y + dy)
+            return True
+        nome = self._formularios[texto]
+        if nome is None:
+            return False
+        self.c.saveState()
+        self.c.translate(x, y)
+        self.c.doForm(nome)
+        self.c.restoreState()
+        return True
+
+
+def desenhar_etiqueta(c, x, y, width, height, dados, codigos, data_atual=None):
+    # Desenhar borda externa
+    c.setStrokeColorRGB(0, 0, 0)
+    c.setLineWidth(1)
+    c.rect(x + 1*mm, y + 1*mm, width - 2*mm, height - 2*mm)
+
+    # Título PU no canto superior esquerdo
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(x + 3*mm, y + height - 6*mm, "PU")
+
+    # Data atual no canto superior direito
+    data_atual = data_atual or datetime.now().strftime("%d/%m/%Y")
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(x + width - 25*mm, y + height - 6*mm, data_atual)
+
+    # OP na linha principal (maior)
+    y_pos = y + height - 15*mm
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x + 3*mm, y_pos, "OP:")
+    c.setFont("Helvetica-Bold", 24)
+    c.drawString(x + 15*mm, y_pos, f"{dados['OP']}")
+
+    # CARRO (mais acima)
+    y_pos -= 6*mm
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(x + 3*mm, y_pos, "CARRO:")
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(x + 20*mm, y_pos, f"{dados['Veiculo']}")
+
+    # ID na linha abaixo do carro (maior)
+    y_pos -= 6*mm
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(x + 3*mm, y_pos, "ID:")
+    c.setFont("Helvetica-Bold", 18)
+    c.drawString(x + 15*mm, y_pos, f"{dados['ID']}")
+
+    # DESCRIÇÃO abaixo da camada (grande)
+    y_pos -= 8*mm
+    c.setFont("Helvetica-Bold", 22)
+    descricao = dados.get('Descricao', '')
+    if len(descricao) > 30:
+        descricao = descricao[:30] + '...'
+    c.drawString(x + 3*mm, y_pos, descricao)
+
+    # Código de barras Code128 na parte inferior ocupando toda a largura
+    codigo_barras_texto = texto_codigo_barras(dados)
+    if not codigos.desenhar(codigo_barras_texto, x + 2*mm, y + 1*mm):
+        # Fallback: texto simples se código de barras falhar
+        c.setFont("Courier", 8)
+        c.drawString(x + 3*mm, y + 3*mm, codigo_barras_texto)
+
+
+def texto_codigo_barras(dados):
+    return f"{dados['Peca']}{dados['OP']}"
+
+
+def paginas(itens):
+    """Dados de cada página (uma por cópia), a partir dos itens da tela"""
+    for item in itens:
+        dados = {
+            'OP': item['op'],
+            'Peca': item['peca'],
+            'Veiculo': item['veiculo'],
+            'Descricao': item.get('descricao', ''),
+            'ID': item['id']
+        }
+        for _ in range(item['quantidade_etiquetas']):
+            yield dados
+
+
+def total_paginas(itens):
+    return sum(int(item['quantidade_etiquetas']) for item in itens)
+
+
+def lotes(itens, tamanho):
+    """Divide os itens em blocos de até ``tamanho`` páginas (um item com muitas cópias é repartido)."""
+    lote = []
+    paginas_lote = 0
+    for item in itens:
+        restantes = int(item['quantidade_etiquetas'])
+        while restantes > 0:
+            copias = min(restantes, tamanho - paginas_lote)
+            lote.append(dict(item, quantidade_etiquetas=copias))
+            paginas_lote += copias
+            restantes -= copias
+            if paginas_lote == tamanho:
+                yield lote
+                lote = []
+                paginas_lote = 0
+    if lote:
+        yield lote
+
+
+def gerar_pdf(itens, destino, data_atual=None):
+    """Grava o PDF das etiquetas em ``destino`` (arquivo aberto ou caminho). Retorna o número de páginas."""
+    c = canvas.Canvas(destino, pagesize=(LARGURA, ALTURA))
+    codigos = CodigosDeBarras(c, LARGURA - 4*mm, 10*mm)
+    data_atual = data_atual or datetime.now().strftime("%d/%m/%Y")
+    total = 0
+    for dados in paginas(itens):
+        # Nova página para cada etiqueta (exceto a primeira)
+        if total:
+            c.showPage()
+        codigos.preparar((texto_codigo_barras(dados),))
+        desenhar_etiqueta(c, 0, 0, LARGURA, ALTURA, dados, codigos, data_atual)
+        total += 1
+    c.save()
+    return total
+
+
+_ENTRADA_XREF = re.compile(rb'(\d{10}) \d{5} ([nf])')
+_REFERENCIA = re.compile(rb'(\d+) 0 R\b')
+_INICIO_STREAM = re.compile(rb'\bstream\r?\n')
+
+
+class JuncaoPDF:
+    """Junta PDFs gerados por ``gerar_pdf`` (reportlab) em um só, gravando em ``destino`` bloco a bloco.
+
+    Os objetos de cada bloco são copiados com números novos; catálogo, árvore de
+    páginas e Info de cada bloco são descartados e uma árvore única é gravada em
+    ``fechar``. Depende do formato do reportlab (tabela xref clássica, sem object
+    streams); não serve para PDFs quaisquer.
+    """
+
+    def __init__(self, destino):
+        self.destino = destino
+        self.posicao = 0
+        # posições dos objetos 1 (catálogo) e 2 (páginas) são preenchidas no fechamento
+        self.posicoes = [None, None]
+        self.paginas = []
+        self._escrever(b'%PDF-1.3\n%\x93\x8c\x8b\x9e\n')
+
+    def _escrever(self, dados):
+        self.destino.write(dados)
+        self.posicao += len(dados)
+
+    def _gravar_objeto(self, numero, corpo):
+        self.posicoes[numero - 1] = self.posicao
+        self._escrever(b'%d 0 obj\n' % numero + corpo + b'endobj\n')
+
+    def adicionar(self, pdf):
+        inicio_xref = int(pdf[pdf.rindex(b'startxref') + 9:].split()[0])
+        trailer = pdf.index(b'trailer', inicio_xref)
+        raiz = int(re.search(rb'/Root (\d+) 0 R', pdf[trailer:]).group(1))
+        info = re.search(rb'/Info (\d+) 0 R', pdf[trailer:])
+
+        # Objeto n começa na posição da n-ésima entrada da xref e vai até o próximo
+        entradas = _ENTRADA_XREF.findall(pdf, inicio_xref, trailer)
+        posicoes = {numero: int(posicao) for numero, (posicao, uso) in enumerate(entradas) if uso == b'n'}
+        limites = sorted(posicoes.values()) + [inicio_xref]
+        fim = {inicio: limites[i + 1] for i, inicio in enumerate(limites[:-1])}
+
+        def corpo(numero):
+            inicio = posicoes[numero]
+            objeto = pdf[inicio:fim[inicio]]
+            return objeto[objeto.index(b'obj') + 3:objeto.rindex(b'endobj')].lstrip(b'\r\n')
+
+        arvore = int(re.search(rb'/Pages (\d+) 0 R', corpo(raiz)).group(1))
+        kids = [int(n) for n in _REFERENCIA.findall(re.search(rb'/Kids \[([^\]]*)\]', corpo(arvore)).group(1))]
+        descartados = {raiz, arvore, int(info.group(1)) if info else None}
+
+        mapa = {arvore: 2}
+        for numero in posicoes:
+            if numero not in descartados:
+                self.posicoes.append(None)
+                mapa[numero] = len(self.posicoes)
+
+        def renumerar(m):
+            return b'%d 0 R' % mapa[int(m.group(1))]
+
+        for numero in posicoes:
+            if numero in descartados:
+                continue
+            dados = corpo(numero)
+            # Só o dicionário é renumerado; o conteúdo do stream é copiado como está
+            stream = _INICIO_STREAM.search(dados)
+            dicionario, resto = (dados[:stream.start()], dados[stream.start():]) if stream else (dados, b'')
+            self._gravar_objeto(mapa[numero], _REFERENCIA.sub(renumerar, dicionario) + resto)
+        self.paginas.extend(mapa[numero] for numero in kids)
+
+    def fechar(self):
+        kids = b' '.join(b'%d 0 R' % numero for numero in self.paginas)
+        self._gravar_objeto(2, b'<<\n/Count %d /Kids [ %s ] /Type /Pages\n>>\n' % (len(self.paginas), kids))
+        self._gravar_objeto(1, b'<<\n/PageMode /UseNone /Pages 2 0 R /Type /Catalog\n>>\n')
+        inicio_xref = self.posicao
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % (len(self.posicoes) + 1)]
+        xref.extend(b'%010d 00000 n \n' % posicao for posicao in self.posicoes)
+        self._escrever(b''.join(xref))
+        self._escrever(b'trailer\n<<\n/Root 1 0 R /Size %d\n>>\nstartxref\n%d\n%%%%EOF\n'
+                       % (len(self.posicoes) + 1, inicio_xref))
+
+
+def _desenhar_lote(argumentos):
+    """Executado nos processos do pool: PDF de um bloco, em bytes."""
+    itens, data_atual = argumentos
+    buffer = io.BytesIO()
+    gerar_pdf(itens, buffer, data_atual)
+    return buffer.getvalue()
+
+
+def gerar_pdf_paralelo(itens, destino, processos=None, tamanho_lote=None, progresso=None):
+    """Como ``gerar_pdf``, com os blocos desenhados em paralelo e juntados na ordem.
+
+    ``progresso(feito, total)`` é chamado a cada bloco pronto, em páginas.
+    """
+    processos = PROCESSOS if processos is None else processos
+    tamanho_lote = tamanho_lote or TAMANHO_LOTE
+    total = total_paginas(itens)
+    data_atual = datetime.now().strftime("%d/%m/%Y")
+    blocos = list(lotes(itens, tamanho_lote))
+
+    if processos <= 1 or len(blocos) <= 1:
+        gerar_pdf(itens, destino, data_atual)
+        if progresso:
+            progresso(total, total)
+        return total
+
+    # spawn: o processo do app tem threads (gunicorn, jobs, entrega) e fork com threads não é seguro
+    contexto = multiprocessing.get_context('spawn')
+    juncao = JuncaoPDF(destino)
+    feito = 0
+    with ProcessPoolExecutor(max_workers=min(processos, len(blocos)), mp_context=contexto) as pool:
+        for bloco, pdf in zip(blocos, pool.map(_desenhar_lote, [(bloco, data_atual) for bloco in blocos])):
+            juncao.adicionar(pdf)
+            feito += total_paginas(bloco)
+            if progresso:
+                progresso(feito, total)
+    juncao.fechar()
+    return total
+
+
+def _desenhar_etiqueta_png(c, x, y, width, height, dados):
+    """Desenho antigo (PNG do python-barcode por etiqueta), só para comparação em ``_medir``"""
+    import os
+    import tempfile
+
+    import barcode
+    from barcode.writer import ImageWriter
+
+    class _SemCodigo:
+        def desenhar(self, texto, x, y):
+            return True
+
+    desenhar_etiqueta(c, x, y, width, height, dados, _SemCodigo())
+    writer = ImageWriter()
+    writer.quiet_zone = 3
+    writer.font_size = 0
+    writer.text_distance = 0
+    writer.write_text = False
+    codigo_barras_obj = barcode.get('code128', texto_codigo_barras(dados), writer=writer)
+    codigo_barras_obj.default_writer_options['write_text'] = False
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_barcode:
+        img_barcode = codigo_barras_obj.render()
+        img_barcode.save(tmp_barcode.name, 'PNG')
+        tmp_barcode.close()
+        c.drawImage(tmp_barcode.name, x + 2*mm, y + 1*mm, width=width-4*mm, height=10*mm)
+        os.remove(tmp_barcode.name)
+
+
+def _medir(quantidade=500, copias=2):
+    import time
+
+    itens = [
+        {'op': f'{100000 + i}', 'peca': f'TSP{i % 40:02d}', 'veiculo': 'COROLLA', 'descricao': f'PARA-BRISA {i}',
+         'id': str(i), 'quantidade_etiquetas': copias}
+        for i in range(quantidade // copias)
+    ]
+
+    def png():
+        c = canvas.Canvas(io.BytesIO(), pagesize=(LARGURA, ALTURA))
+        for n, dados in enumerate(paginas(itens)):
+            if n:
+                c.showPage()
+            _desenhar_etiqueta_png(c, 0, 0, LARGURA, ALTURA, dados)
+        c.save()
+        return n + 1
+
+    for nome, funcao in (('vetorial', lambda: gerar_pdf(itens, io.BytesIO())), ('PNG', png)):
+        try:
+            inicio = time.perf_counter()
+            total = funcao()
+        except ImportError as e:
+            print(f"{nome:>10}: indisponível ({e})")
+            continue
+        duracao = time.perf_counter() - inicio
+        print(f"{nome:>10}: {total} etiquetas em {duracao:.3f}s ({total / duracao:,.0f} etiquetas/s)")
+
+
+def _medir_paralelo(quantidade=10000):
+    import time
+
+    itens = [
+        {'op': f'{100000 + i}', 'peca': f'TSP{i % 40:02d}', 'veiculo': 'COROLLA', 'descricao': f'PARA-BRISA {i}',
+         'id': str(i), 'quantidade_etiquetas': 1}
+        for i in range(quantidade)
+    ]
+    for processos in sorted({1, 2, PROCESSOS}):
+        inicio = time.perf_counter()
+        total = gerar_pdf_paralelo(itens, io.BytesIO(), processos=processos)
+        duracao = time.perf_counter() - inicio
+        print(f"{processos:>2} processo(s): {total} etiquetas em {duracao:.3f}s ({total / duracao:,.0f} etiquetas/s)")
+
+
+if __name__ == '__main__':
+    _medir()
+    _medir_paralelo()
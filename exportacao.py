@@ -0,0 +1,310 @@
+"""Exportação de relatórios (Excel, CSV, CSV gzip e Parquet) sem carregar tudo na memória.
+
+As linhas vêm do banco por um cursor nomeado (lotes de ``TAMANHO_LOTE``) e
+vão direto para o arquivo de saída:
+
+    xlsx     planilha openpyxl em modo write-only, num ``SpooledTemporaryFile``
+             (fica na memória até ``MEMORIA_MAXIMA`` bytes e passa para o disco acima disso)
+    csv      enviado em pedaços enquanto as linhas chegam; UTF-8 com BOM e ``;``
+             como separador, para o Excel em português abrir direto
+    csv.gz   o mesmo CSV, comprimido em gzip durante o envio
+    parquet  via pyarrow, quando instalado; colunas com as chaves do relatório
+             e os valores sem formatação (datas continuam datas)
+
+O formato vem do parâmetro ``formato`` (query string, form ou JSON) ou do
+cabeçalho ``Accept``; sem nenhum dos dois, xlsx.
+
+Cada relatório define suas colunas uma vez (``Relatorio``): chave da linha,
+título no arquivo e, opcionalmente, uma função de formatação do valor.
+"""
+import csv
+import io
+import re
+import tempfile
+import uuid
+import zlib
+from datetime import datetime
+
+from flask import Response, send_file
+from openpyxl import Workbook
+
+import db_pool
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+TAMANHO_LOTE = 2000
+MEMORIA_MAXIMA = 8 * 1024 * 1024
+# Tamanho aproximado de cada pedaço enviado do CSV
+TAMANHO_PEDACO = 64 * 1024
+SEPARADOR_CSV = ';'
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# formato: (extensão, mimetype)
+FORMATOS = {
+    'xlsx': ('xlsx', MIMETYPE_XLSX),
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+_FORMATO_POR_MIMETYPE = {
+    MIMETYPE_XLSX: 'xlsx',
+    'text/csv': 'csv',
+    'application/gzip': 'csv.gz',
+    'application/x-gzip': 'csv.gz',
+    'application/vnd.apache.parquet': 'parquet',
+    'application/x-parquet': 'parquet',
+}
+
+# Caracteres de controle que o openpyxl recusa em células
+_ILEGAIS = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+
+
+class FormatoInvalido(ValueError):
+    pass
+
+
+def data_br(valor):
+    return valor.strftime('%d/%m/%Y') if hasattr(valor, 'strftime') else valor
+
+
+def data_hora_br(valor):
+    return valor.strftime('%d/%m/%Y %H:%M') if hasattr(valor, 'strftime') else valor
+
+
+class Relatorio:
+    def __init__(self, nome, colunas, aba=None):
+        """colunas: [(chave, título)] ou [(chave, título, formatar)]"""
+        self.nome = nome
+        self.colunas = [tuple(coluna) + (None,) * (3 - len(coluna)) for coluna in colunas]
+        self.aba = aba
+
+    @property
+    def chaves(self):
+        return [chave for chave, _, _ in self.colunas]
+
+    @property
+    def titulos(self):
+        return [titulo for _, titulo, _ in self.colunas]
+
+    def valores(self, linha):
+        valores = []
+        for chave, _, formatar in self.colunas:
+            valor = linha.get(chave)
+            if formatar is not None and valor is not None:
+                valor = formatar(valor)
+            if isinstance(valor, str):
+                valor = _ILEGAIS.sub('', valor)
+            valores.append(valor)
+        return valores
+
+    def registro(self, linha):
+        """Valores sem formatação, por chave (Parquet)"""
+        return {chave: linha.get(chave) for chave, _, _ in self.colunas}
+
+    def nome_arquivo(self, extensao):
+        return f"{self.nome}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extensao}"
+
+
+def formato_pedido(req, padrao='xlsx'):
+    """Formato pedido na requisição Flask ``req``; FormatoInvalido se não existe ou não está disponível."""
+    formato = req.values.get('formato')
+    if not formato and req.is_json:
+        formato = (req.get_json(silent=True) or {}).get('formato')
+    if formato:
+        formato = str(formato).strip().lower()
+    else:
+        # Só tipos pedidos explicitamente; o */* dos navegadores cai no padrão
+        formato = next(
+            (_FORMATO_POR_MIMETYPE[valor] for valor, qualidade in req.accept_mimetypes
+             if qualidade > 0 and valor in _FORMATO_POR_MIMETYPE),
+            padrao
+        )
+    if formato not in FORMATOS:
+        raise FormatoInvalido(f"Formato inválido: {formato} (use {', '.join(FORMATOS)})")
+    if formato == 'parquet' and pyarrow is None:
+        raise FormatoInvalido('Formato parquet indisponível: pyarrow não está instalado no servidor')
+    return formato
+
+
+def linhas_do_cursor(conn, sql, params=None, cursor_factory=None):
+    """Executa ``sql`` num cursor nomeado (no servidor) e entrega as linhas como dicts, em lotes."""
+    cur = conn.cursor(name=f'exportacao_{uuid.uuid4().hex}', cursor_factory=cursor_factory)
+    cur.itersize = TAMANHO_LOTE
+    try:
+        cur.execute(sql, params)
+        for row in cur:
+            yield dict(row)
+    finally:
+        cur.close()
+
+
+def linhas_da_consulta(sql, params=None, cursor_factory=None):
+    """Como ``linhas_do_cursor``, numa conexão própria devolvida quando as linhas acabam.
+
+    A conexão não é registrada na requisição: o CSV continua sendo enviado
+    depois que a rota retorna, e o teardown do Flask a fecharia no meio.
+    """
+    conn = db_pool.obter_pool().obter()
+    try:
+        yield from linhas_do_cursor(conn, sql, params, cursor_factory)
+    finally:
+        conn.close()
+
+
+def escrever_xlsx(relatorio, linhas, destino, aba=None):
+    """Grava as linhas no arquivo aberto ``destino``. Retorna quantas linhas foram escritas."""
+    workbook = Workbook(write_only=True)
+    planilha = workbook.create_sheet(aba or relatorio.aba or 'Sheet1')
+    planilha.append(relatorio.titulos)
+    total = 0
+    for linha in linhas:
+        planilha.append(relatorio.valores(linha))
+        total += 1
+    workbook.save(destino)
+    return total
+
+
+def escrever_parquet(relatorio, linhas, destino):
+    """Grava as linhas em Parquet, um row group por lote. Retorna quantas linhas foram escritas."""
+    escritor = None
+    esquema = None
+    total = 0
+    lote = []
+
+    def gravar():
+        nonlocal escritor, esquema
+        if esquema is None:
+            tabela = pyarrow.Table.from_pylist(lote) if lote else None
+            # Colunas só com nulos no primeiro lote (ou relatório vazio) ficam como texto
+            esquema = pyarrow.schema([
+                pyarrow.field(chave, pyarrow.string())
+                if tabela is None or pyarrow.types.is_null(tabela.schema.field(chave).type)
+                else tabela.schema.field(chave)
+                for chave in relatorio.chaves
+            ])
+            escritor = pyarrow.parquet.ParquetWriter(destino, esquema)
+        escritor.write_table(pyarrow.Table.from_pylist(lote, schema=esquema))
+        lote.clear()
+
+    try:
+        for linha in linhas:
+            lote.append(relatorio.registro(linha))
+            total += 1
+            if len(lote) >= TAMANHO_LOTE:
+                gravar()
+        if lote or escritor is None:
+            gravar()
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return total
+
+
+def pedacos_csv(relatorio, linhas):
+    """CSV em pedaços de bytes (UTF-8 com BOM), gerados conforme as linhas chegam."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=SEPARADOR_CSV, lineterminator='\r\n')
+    buffer.write('\ufeff')
+    escritor.writerow(relatorio.titulos)
+    try:
+        for linha in linhas:
+            escritor.writerow(relatorio.valores(linha))
+            if buffer.tell() >= TAMANHO_PEDACO:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+    finally:
+        # Cliente desconectou no meio: encerra a consulta e devolve a conexão já
+        fechar = getattr(linhas, 'close', None)
+        if fechar is not None:
+            fechar()
+
+
+def comprimir_gzip(pedacos):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for pedaco in pedacos:
+        comprimido = compressor.compress(pedaco)
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
+
+
+def _antecipar(linhas):
+    """Lê a primeira linha já na rota: erro na consulta vira resposta de erro, não um arquivo cortado."""
+    linhas = iter(linhas)
+    try:
+        primeira = next(linhas)
+    except StopIteration:
+        return []
+
+    def todas():
+        try:
+            yield primeira
+            yield from linhas
+        finally:
+            fechar = getattr(linhas, 'close', None)
+            if fechar is not None:
+                fechar()
+    return todas()
+
+
+def _resposta_arquivo(relatorio, formato, escrever):
+    extensao, mimetype = FORMATOS[formato]
+    arquivo = tempfile.SpooledTemporaryFile(max_size=MEMORIA_MAXIMA)
+    escrever(arquivo)
+    arquivo.seek(0)
+    return send_file(
+        arquivo,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=relatorio.nome_arquivo(extensao)
+    )
+
+
+def resposta(relatorio, linhas, formato='xlsx', aba=None):
+    """Resposta Flask com as linhas (iterável de dicts) no ``formato`` pedido."""
+    if formato == 'xlsx':
+        return _resposta_arquivo(relatorio, formato, lambda f: escrever_xlsx(relatorio, linhas, f, aba))
+    if formato == 'parquet':
+        return _resposta_arquivo(relatorio, formato, lambda f: escrever_parquet(relatorio, linhas, f))
+    if formato not in ('csv', 'csv.gz'):
+        raise FormatoInvalido(f"Formato inválido: {formato}")
+    extensao, mimetype = FORMATOS[formato]
+    pedacos = pedacos_csv(relatorio, _antecipar(linhas))
+    if formato == 'csv.gz':
+        pedacos = comprimir_gzip(pedacos)
+    return Response(
+        pedacos,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{relatorio.nome_arquivo(extensao)}"'}
+    )
+
+
+# Dashboard de produção: exportado pelo app principal e pelo dashboard_app, com as mesmas colunas
+CATEGORIAS_DASHBOARD = {
+    'aviso': 'Peças no Corte Curvo - Pré-Montagem',
+    'plano': 'Bloco Plano - Peças Sem PC',
+    'curvo': 'Bloco Curvo - Peças Sem PC',
+    'critico': 'Peças que já passaram da Montagem',
+}
+
+RELATORIO_DASHBOARD = Relatorio('dashboard_producao', [
+    ('op', 'OP'), ('peca', 'PEÇA'), ('projeto', 'PROJETO'), ('veiculo', 'VEÍCULO'), ('local', 'LOCAL'),
+    ('sensor', 'SENSOR'), ('etapa', 'ETAPA'), ('prioridade', 'PRIORIDADE'), ('categoria', 'CATEGORIA'),
+    ('quantidade', 'QUANTIDADE'),
+])
+
+
+def linhas_dashboard(itens):
+    """Itens do dashboard com a categoria descritiva do status (linhas de RELATORIO_DASHBOARD)"""
+    for item in itens:
+        linha = dict(item)
+        status = item.get('status', '')
+        linha['categoria'] = CATEGORIAS_DASHBOARD.get(status, status.upper())
+        linha.setdefault('quantidade', 1)
+        yield linha
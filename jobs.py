@@ -0,0 +1,308 @@
+"""Fila de tarefas em segundo plano guardada no Postgres (public.pc_jobs).
+
+As rotas enfileiram (``enfileirar``) e respondem na hora com o id do job; cada
+worker do gunicorn roda threads executoras que pegam o próximo job pendente
+com ``FOR UPDATE SKIP LOCKED``, então dois workers nunca executam o mesmo job.
+
+O job fica em EXECUTANDO enquanto roda; uma thread de batimento atualiza
+``atualizado_em`` a intervalos bem menores que ``JOBS_TEMPO_MORTO``, mesmo
+quando a tarefa passa muito tempo sem informar progresso. Se o worker morrer
+no meio (deploy, timeout, OOM), o job para de ser atualizado e, passado
+``JOBS_TEMPO_MORTO``, qualquer executor o devolve para PENDENTE (até
+``JOBS_TENTATIVAS`` vezes). Cada execução é identificada pelo número da
+tentativa: progresso, batimento e resultado de uma execução que foi dada como
+abandonada não sobrescrevem os da execução seguinte. O resultado (JSON e arquivo,
+ou o caminho do arquivo no disco do servidor) fica na própria tabela, então
+qualquer worker atende status e download.
+
+Variáveis de ambiente:
+    JOBS_THREADS        threads executoras por processo (padrão 1, 0 desliga)
+    JOBS_INTERVALO      segundos entre consultas à fila quando vazia (padrão 2)
+    JOBS_TEMPO_MORTO    segundos sem atualização para considerar o job abandonado (padrão 300)
+    JOBS_TENTATIVAS     execuções por job antes de marcar ERRO (padrão 3)
+"""
+import os
+import threading
+import time
+import traceback
+
+import psycopg2
+import psycopg2.extras
+
+import db_pool
+
+PENDENTE = 'PENDENTE'
+EXECUTANDO = 'EXECUTANDO'
+CONCLUIDO = 'CONCLUIDO'
+ERRO = 'ERRO'
+
+# Progresso é gravado no máximo uma vez por este intervalo (segundos)
+INTERVALO_PROGRESSO = 1.0
+# Batimento do job em execução: a cada tantos segundos, no máximo (e ao menos 3 por JOBS_TEMPO_MORTO)
+INTERVALO_BATIMENTO = 30.0
+
+_tarefas = {}
+
+
+def _env_int(nome, padrao):
+    try:
+        return int(os.getenv(nome, padrao))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def tarefa(tipo):
+    """Registra a função que executa os jobs de ``tipo``.
+
+    A função recebe (job, conn) e retorna um dict com ``resultado`` (JSON) e,
+    opcionalmente, ``nome_arquivo`` com ``arquivo`` (bytes, guardados na tabela)
+    ou ``caminho_arquivo`` (arquivo já gravado no disco do servidor). ``conn`` é do pool;
+    o commit das alterações feitas nela é responsabilidade da função.
+    """
+    def registrar(funcao):
+        _tarefas[tipo] = funcao
+        return funcao
+    return registrar
+
+
+def enfileirar(cur, tipo, parametros, usuario=None, total=0):
+    """Insere o job na transação de ``cur``; fica visível para os executores no commit."""
+    cur.execute("""
+        INSERT INTO public.pc_jobs (tipo, usuario, parametros, total)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+    """, (tipo, usuario, psycopg2.extras.Json(parametros), total))
+    return cur.fetchone()[0]
+
+
+def obter(cur, job_id):
+    """Situação do job (sem o arquivo), ou None"""
+    cur.execute("""
+        SELECT id, tipo, status, usuario, progresso, total, resultado, erro, tentativas,
+               nome_arquivo, (arquivo IS NOT NULL OR caminho_arquivo IS NOT NULL) AS tem_arquivo,
+               criado_em, iniciado_em, atualizado_em, concluido_em
+        FROM public.pc_jobs WHERE id = %s
+    """, (job_id,))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def obter_arquivo(cur, job_id):
+    """(nome_arquivo, bytes, caminho) do resultado; bytes ou caminho é None conforme onde ele foi guardado"""
+    cur.execute("SELECT nome_arquivo, arquivo, caminho_arquivo FROM public.pc_jobs WHERE id = %s", (job_id,))
+    row = cur.fetchone()
+    if not row:
+        return None, None, None
+    return row[0], bytes(row[1]) if row[1] is not None else None, row[2]
+
+
+class Job:
+    def __init__(self, id, tipo, parametros, usuario, total, tentativas=0):
+        self.id = id
+        self.tipo = tipo
+        self.parametros = parametros or {}
+        self.usuario = usuario
+        self.total = total
+        self.tentativas = tentativas
+        self._ultimo_progresso = 0.0
+
+    def progresso(self, feito, total=None, forcar=False):
+        """Grava o progresso (e o sinal de vida do job) em conexão própria, fora da transação da tarefa."""
+        agora = time.monotonic()
+        if not forcar and agora - self._ultimo_progresso < INTERVALO_PROGRESSO:
+            return
+        self._ultimo_progresso = agora
+        if total is not None:
+            self.total = total
+        with db_pool.db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE public.pc_jobs SET progresso = %s, total = %s, atualizado_em = NOW()
+                WHERE id = %s AND status = %s AND tentativas = %s
+            """, (feito, self.total, self.id, EXECUTANDO, self.tentativas))
+            conn.commit()
+
+    def bater(self):
+        """Sinal de vida sem progresso. False se esta execução já não é a do job (foi dada como abandonada)."""
+        with db_pool.db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE public.pc_jobs SET atualizado_em = NOW()
+                WHERE id = %s AND status = %s AND tentativas = %s
+            """, (self.id, EXECUTANDO, self.tentativas))
+            conn.commit()
+            return cur.rowcount == 1
+
+
+class _Batimento:
+    """Thread que mantém o job vivo enquanto a tarefa roda (with _Batimento(job, intervalo): ...)."""
+
+    def __init__(self, job, intervalo):
+        self.job = job
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _laco(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                if not self.job.bater():
+                    print(f"DEBUG JOBS: Job {self.job.id} (tentativa {self.job.tentativas}) não pertence mais a esta execução")
+                    return
+            except (psycopg2.Error, db_pool.PoolEsgotadoError) as e:
+                print(f"DEBUG JOBS: Falha no batimento do job {self.job.id}: {e}")
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._laco, name=f'jobs-batimento-{self.job.id}', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._parar.set()
+        self._thread.join()
+        return False
+
+
+def _recuperar_abandonados(cur, tempo_morto, tentativas):
+    cur.execute("""
+        UPDATE public.pc_jobs
+        SET status = CASE WHEN tentativas < %s THEN %s ELSE %s END,
+            erro = CASE WHEN tentativas < %s THEN erro ELSE 'Execução interrompida' END,
+            atualizado_em = NOW()
+        WHERE status = %s AND atualizado_em < NOW() - make_interval(secs => %s)
+        RETURNING id, status
+    """, (tentativas, PENDENTE, ERRO, tentativas, EXECUTANDO, tempo_morto))
+    for job_id, status in cur.fetchall():
+        print(f"DEBUG JOBS: Job {job_id} abandonado -> {status}")
+
+
+def _reservar_proximo(cur):
+    cur.execute("""
+        UPDATE public.pc_jobs
+        SET status = %s, tentativas = tentativas + 1, progresso = 0,
+            iniciado_em = NOW(), atualizado_em = NOW()
+        WHERE id = (
+            SELECT id FROM public.pc_jobs
+            WHERE status = %s
+            ORDER BY id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, tipo, parametros, usuario, total, tentativas
+    """, (EXECUTANDO, PENDENTE))
+    row = cur.fetchone()
+    return Job(*row) if row else None
+
+
+def _finalizar(job, status, resultado=None, arquivo=None, nome_arquivo=None, caminho_arquivo=None, erro=None):
+    """Grava o fim da execução; ignorado se o job já foi devolvido à fila e pego de novo (outra tentativa)."""
+    with db_pool.db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE public.pc_jobs
+            SET status = %s, resultado = %s, arquivo = %s, nome_arquivo = %s, caminho_arquivo = %s, erro = %s,
+                progresso = CASE WHEN %s = %s THEN total ELSE progresso END,
+                atualizado_em = NOW(), concluido_em = NOW()
+            WHERE id = %s AND tentativas = %s
+        """, (
+            status,
+            psycopg2.extras.Json(resultado) if resultado is not None else None,
+            psycopg2.Binary(arquivo) if arquivo is not None else None,
+            nome_arquivo,
+            caminho_arquivo,
+            erro,
+            status, CONCLUIDO,
+            job.id, job.tentativas
+        ))
+        finalizado = cur.rowcount == 1
+        conn.commit()
+    if not finalizado:
+        print(f"DEBUG JOBS: Resultado da tentativa {job.tentativas} do job {job.id} descartado (job reexecutado)")
+    return finalizado
+
+
+def executar(job, batimento=INTERVALO_BATIMENTO):
+    funcao = _tarefas.get(job.tipo)
+    if funcao is None:
+        _finalizar(job, ERRO, erro=f'Tipo de job desconhecido: {job.tipo}')
+        return
+    print(f"DEBUG JOBS: Executando job {job.id} ({job.tipo})")
+    try:
+        with _Batimento(job, batimento), db_pool.db_connection() as conn:
+            saida = funcao(job, conn) or {}
+    except Exception as e:
+        print(f"Erro no job {job.id}:", traceback.format_exc())
+        _finalizar(job, ERRO, erro=str(e))
+        return
+    if _finalizar(job, CONCLUIDO, saida.get('resultado'), saida.get('arquivo'), saida.get('nome_arquivo'),
+                  saida.get('caminho_arquivo')):
+        print(f"DEBUG JOBS: Job {job.id} concluído")
+
+
+class Executor:
+    """Threads que consomem a fila neste processo."""
+
+    def __init__(self, threads=1, intervalo=2.0, tempo_morto=300, tentativas=3):
+        self.threads = threads
+        self.intervalo = intervalo
+        self.tempo_morto = tempo_morto
+        self.tentativas = tentativas
+        self._parar = threading.Event()
+
+    def iniciar(self):
+        for i in range(self.threads):
+            threading.Thread(target=self._laco, name=f'jobs-{i + 1}', daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
+
+    def proximo(self):
+        """Recupera jobs abandonados e reserva o próximo pendente (None se a fila está vazia)"""
+        with db_pool.db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                _recuperar_abandonados(cur, self.tempo_morto, self.tentativas)
+                job = _reservar_proximo(cur)
+                conn.commit()
+                return job
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _laco(self):
+        while not self._parar.is_set():
+            try:
+                job = self.proximo()
+            except (psycopg2.Error, db_pool.PoolEsgotadoError) as e:
+                print(f"DEBUG JOBS: Fila indisponível: {e}")
+                job = None
+            if job is None:
+                self._parar.wait(self.intervalo)
+                continue
+            executar(job, batimento=min(INTERVALO_BATIMENTO, self.tempo_morto / 3))
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def iniciar_executor():
+    """Sobe as threads executoras uma vez por processo (cada worker do gunicorn tem as suas)."""
+    global _executor, _executor_pid
+    threads = _env_int('JOBS_THREADS', 1)
+    if threads <= 0:
+        return None
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            return _executor
+        _executor = Executor(
+            threads=threads,
+            intervalo=_env_int('JOBS_INTERVALO', 2),
+            tempo_morto=_env_int('JOBS_TEMPO_MORTO', 300),
+            tentativas=_env_int('JOBS_TENTATIVAS', 3),
+        )
+        _executor_pid = os.getpid()
+        _executor.iniciar()
+        print(f"DEBUG JOBS: {threads} executor(es) iniciado(s) (pid {_executor_pid})")
+        return _executor
@@ -0,0 +1,149 @@
+"""Migrações de schema versionadas.
+
+Os arquivos ``migracoes/NNNN_descricao.sql`` são aplicados em ordem, cada um
+na sua transação, e registrados em ``public.pc_schema_version``. Roda uma vez
+no deploy (start.sh), antes de subir o app; as rotas só fazem DML.
+
+Uso:
+    python migracoes.py            aplica as migrações pendentes
+    python migracoes.py --status   lista aplicadas e pendentes
+"""
+import hashlib
+import os
+import re
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DIRETORIO_MIGRACOES = os.path.join(BASE_DIR, 'migracoes')
+
+# Trava de sessão para dois deploys simultâneos não aplicarem a mesma migração
+CHAVE_TRAVA_MIGRACOES = 7002
+_PADRAO_ARQUIVO = re.compile(r'(\d{4})_(\w+)\.sql')
+
+
+class Migracao:
+    def __init__(self, versao, nome, caminho):
+        self.versao = versao
+        self.nome = nome
+        self.caminho = caminho
+
+    def sql(self):
+        with open(self.caminho, encoding='utf-8') as f:
+            return f.read()
+
+    def checksum(self):
+        return hashlib.md5(self.sql().encode('utf-8')).hexdigest()
+
+
+def listar_migracoes(diretorio=DIRETORIO_MIGRACOES):
+    migracoes = []
+    for arquivo in os.listdir(diretorio):
+        match = _PADRAO_ARQUIVO.fullmatch(arquivo)
+        if match:
+            migracoes.append(Migracao(int(match.group(1)), match.group(2), os.path.join(diretorio, arquivo)))
+    migracoes.sort(key=lambda m: m.versao)
+    versoes = [m.versao for m in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise RuntimeError(f'Versões de migração repetidas em {diretorio}')
+    return migracoes
+
+
+def versoes_aplicadas(cur):
+    """{versao: checksum} das migrações já aplicadas (vazio se a tabela ainda não existe)"""
+    cur.execute("SELECT to_regclass('public.pc_schema_version')")
+    if cur.fetchone()[0] is None:
+        return {}
+    cur.execute("SELECT versao, checksum FROM public.pc_schema_version")
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+
+def pendentes(conn):
+    cur = conn.cursor()
+    aplicadas = versoes_aplicadas(cur)
+    conn.rollback()
+    return [m for m in listar_migracoes() if m.versao not in aplicadas]
+
+
+def aplicar(conn):
+    """Aplica as migrações pendentes em ordem. Retorna as que foram aplicadas."""
+    conn.autocommit = False
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (CHAVE_TRAVA_MIGRACOES,))
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS public.pc_schema_version (
+                versao INTEGER PRIMARY KEY,
+                nome TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                aplicada_em TIMESTAMP DEFAULT NOW()
+            )
+        """)
+        conn.commit()
+
+        aplicadas = versoes_aplicadas(cur)
+        executadas = []
+        for migracao in listar_migracoes():
+            if migracao.versao in aplicadas:
+                if aplicadas[migracao.versao] != migracao.checksum():
+                    print(f"AVISO MIGRAÇÕES: {migracao.versao:04d}_{migracao.nome} foi alterada depois de aplicada")
+                continue
+            print(f"Aplicando migração {migracao.versao:04d}_{migracao.nome}...")
+            try:
+                cur.execute(migracao.sql())
+                cur.execute("""
+                    INSERT INTO public.pc_schema_version (versao, nome, checksum)
+                    VALUES (%s, %s, %s)
+                """, (migracao.versao, migracao.nome, migracao.checksum()))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            executadas.append(migracao)
+        return executadas
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (CHAVE_TRAVA_MIGRACOES,))
+        conn.commit()
+
+
+def _db_config():
+    load_dotenv(os.path.join(BASE_DIR, '.env'))
+    return {
+        'host': os.getenv('DB_HOST'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PSW'),
+        'port': os.getenv('DB_PORT'),
+        'database': os.getenv('DB_NAME')
+    }
+
+
+def main(argv):
+    db_config = _db_config()
+    if not all(db_config.values()):
+        print("ERRO: Variáveis de ambiente do banco não configuradas!")
+        return 1
+
+    conn = psycopg2.connect(**db_config)
+    try:
+        if '--status' in argv:
+            aplicadas = versoes_aplicadas(conn.cursor())
+            for migracao in listar_migracoes():
+                situacao = 'aplicada' if migracao.versao in aplicadas else 'PENDENTE'
+                print(f"{migracao.versao:04d}_{migracao.nome}: {situacao}")
+            return 0
+
+        executadas = aplicar(conn)
+        print(f"Migrações: {len(executadas)} aplicada(s), schema atualizado")
+        return 0
+    except Exception as e:
+        print(f"ERRO ao aplicar migrações: {e}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
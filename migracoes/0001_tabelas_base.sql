@@ -0,0 +1,132 @@
+-- Tabelas e colunas que antes eram criadas em popular_locais_iniciais() e nas rotas
+
+CREATE TABLE IF NOT EXISTS public.pc_locais (
+    id SERIAL PRIMARY KEY,
+    local TEXT,
+    status TEXT DEFAULT 'Ativo',
+    limite TEXT
+);
+
+ALTER TABLE public.users_pc ADD COLUMN IF NOT EXISTS email TEXT;
+
+CREATE TABLE IF NOT EXISTS public.pc_inventory (
+    id SERIAL PRIMARY KEY,
+    op_pai TEXT,
+    op TEXT,
+    peca TEXT,
+    projeto TEXT,
+    veiculo TEXT,
+    local TEXT,
+    data TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    usuario TEXT
+);
+
+ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS data TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS usuario TEXT;
+ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS sensor TEXT;
+ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS camada TEXT;
+ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS lote_vd TEXT;
+ALTER TABLE public.pc_inventory ADD COLUMN IF NOT EXISTS lote_pc TEXT;
+
+CREATE TABLE IF NOT EXISTS public.pc_exit (
+    id SERIAL PRIMARY KEY,
+    op_pai TEXT,
+    op TEXT,
+    peca TEXT,
+    projeto TEXT,
+    veiculo TEXT,
+    local TEXT,
+    usuario TEXT,
+    data TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    motivo TEXT
+);
+
+CREATE TABLE IF NOT EXISTS public.pc_baixas (
+    id SERIAL PRIMARY KEY,
+    op TEXT,
+    peca TEXT,
+    projeto TEXT,
+    veiculo TEXT,
+    sensor TEXT,
+    motivo_baixa TEXT,
+    data_baixa DATE,
+    status TEXT DEFAULT 'PENDENTE',
+    usuario_apontamento TEXT,
+    processado_por TEXT,
+    data_processamento TIMESTAMP,
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS veiculo TEXT;
+ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS sensor TEXT;
+ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'PENDENTE';
+ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS processado_por TEXT;
+ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS data_processamento TIMESTAMP;
+ALTER TABLE public.pc_baixas ADD COLUMN IF NOT EXISTS data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS public.pc_camadas (
+    id SERIAL PRIMARY KEY,
+    projeto TEXT,
+    peca TEXT,
+    l3 TEXT,
+    l3_b TEXT,
+    l4 TEXT,
+    l5 TEXT,
+    l6 TEXT,
+    l7 TEXT,
+    l8 TEXT,
+    pecas_especiais TEXT
+);
+
+ALTER TABLE public.pc_camadas ADD COLUMN IF NOT EXISTS pecas_especiais TEXT;
+
+CREATE TABLE IF NOT EXISTS public.pc_controle (
+    id SERIAL PRIMARY KEY,
+    op_pai TEXT,
+    op TEXT,
+    peca TEXT,
+    projeto TEXT,
+    veiculo TEXT,
+    local TEXT,
+    rack TEXT,
+    cortada BOOLEAN DEFAULT FALSE,
+    user_otimizacao TEXT,
+    data_otimizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    tipo TEXT DEFAULT 'PC',
+    camada TEXT
+);
+
+-- Antes criada a cada chamada de /api/otimizar-pecas
+CREATE TABLE IF NOT EXISTS public.pc_otimizadas (
+    id SERIAL PRIMARY KEY,
+    op_pai TEXT,
+    op TEXT,
+    peca TEXT,
+    projeto TEXT,
+    veiculo TEXT,
+    local TEXT,
+    rack TEXT,
+    cortada BOOLEAN DEFAULT FALSE,
+    user_otimizacao TEXT,
+    data_otimizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    tipo TEXT DEFAULT 'PC',
+    camada TEXT
+);
+
+ALTER TABLE public.pc_otimizadas ADD COLUMN IF NOT EXISTS tipo TEXT DEFAULT 'PC';
+ALTER TABLE public.pc_otimizadas ADD COLUMN IF NOT EXISTS camada TEXT;
+ALTER TABLE public.pc_otimizadas ADD COLUMN IF NOT EXISTS sensor TEXT;
+
+-- Antes criada em /api/limpar-pecas-manuais
+CREATE TABLE IF NOT EXISTS public.pc_manuais (
+    id SERIAL PRIMARY KEY,
+    op TEXT,
+    peca TEXT,
+    projeto TEXT,
+    veiculo TEXT,
+    sensor TEXT,
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Antes alterada a cada requisição de /api/arquivos
+ALTER TABLE public.arquivos_pc ADD COLUMN IF NOT EXISTS sensor TEXT;
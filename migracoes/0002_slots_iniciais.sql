@@ -0,0 +1,5 @@
+-- Slots iniciais (SLOT 1 até SLOT 169), só em banco sem nenhum slot cadastrado
+INSERT INTO public.pc_locais (local, status, limite)
+SELECT 'SLOT ' || i, 'Ativo', '6'
+FROM generate_series(1, 169) AS i
+WHERE NOT EXISTS (SELECT 1 FROM public.pc_locais WHERE local LIKE 'SLOT%');
@@ -0,0 +1,12 @@
+-- Retenções temporárias de slots entre workers (reservas_slots.py)
+CREATE TABLE IF NOT EXISTS public.pc_reservas_slots (
+    id SERIAL PRIMARY KEY,
+    token TEXT NOT NULL,
+    local TEXT NOT NULL,
+    op TEXT,
+    peca TEXT,
+    expira_em TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_pc_reservas_slots_local ON public.pc_reservas_slots (local, expira_em);
+CREATE INDEX IF NOT EXISTS idx_pc_reservas_slots_op_peca ON public.pc_reservas_slots (op, peca);
@@ -0,0 +1,10 @@
+-- Contador de versão de arquivos_pc: os workers recarregam o cache de arquivos de corte
+-- (arquivos_corte.py) quando ele muda
+CREATE TABLE IF NOT EXISTS public.pc_arquivos_versao (
+    id INTEGER PRIMARY KEY,
+    versao BIGINT NOT NULL,
+    atualizado_em TIMESTAMP DEFAULT NOW()
+);
+
+INSERT INTO public.pc_arquivos_versao (id, versao) VALUES (1, 0)
+ON CONFLICT (id) DO NOTHING;
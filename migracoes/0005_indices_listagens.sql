@@ -0,0 +1,3 @@
+-- Paginação por cursor das listagens (consultas.py): ORDER BY <data> DESC NULLS LAST, id DESC
+CREATE INDEX IF NOT EXISTS idx_pc_exit_data_id ON public.pc_exit (data DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS idx_pc_baixas_data_criacao_id ON public.pc_baixas (data_criacao DESC NULLS LAST, id DESC);
@@ -0,0 +1,22 @@
+-- Fila de tarefas em segundo plano (jobs.py): gerar_xml e outras rotinas longas
+CREATE TABLE IF NOT EXISTS public.pc_jobs (
+    id SERIAL PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'PENDENTE',
+    usuario TEXT,
+    parametros JSONB NOT NULL DEFAULT '{}',
+    progresso INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    resultado JSONB,
+    arquivo BYTEA,
+    nome_arquivo TEXT,
+    erro TEXT,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    criado_em TIMESTAMP DEFAULT NOW(),
+    iniciado_em TIMESTAMP,
+    atualizado_em TIMESTAMP DEFAULT NOW(),
+    concluido_em TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_pc_jobs_pendentes ON public.pc_jobs (id) WHERE status = 'PENDENTE';
+CREATE INDEX IF NOT EXISTS idx_pc_jobs_executando ON public.pc_jobs (atualizado_em) WHERE status = 'EXECUTANDO';
@@ -0,0 +1,2 @@
+-- Resultado de job gravado em disco (ZIPs de XML escritos direto no arquivo, sem passar pela memória)
+ALTER TABLE public.pc_jobs ADD COLUMN IF NOT EXISTS caminho_arquivo TEXT;
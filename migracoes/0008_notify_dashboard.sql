@@ -0,0 +1,24 @@
+-- Avisa o dashboard de produção (dashboard_app.py, LISTEN dashboard_producao) quando
+-- estoque, otimizadas ou saídas mudam. Trigger por comando, não por linha: uma
+-- importação de mil peças gera um aviso só (NOTIFY repetido na mesma transação é único).
+CREATE OR REPLACE FUNCTION public.pc_notificar_dashboard() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('dashboard_producao', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_pc_inventory_dashboard ON public.pc_inventory;
+CREATE TRIGGER trg_pc_inventory_dashboard
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.pc_inventory
+    FOR EACH STATEMENT EXECUTE FUNCTION public.pc_notificar_dashboard();
+
+DROP TRIGGER IF EXISTS trg_pc_otimizadas_dashboard ON public.pc_otimizadas;
+CREATE TRIGGER trg_pc_otimizadas_dashboard
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.pc_otimizadas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.pc_notificar_dashboard();
+
+DROP TRIGGER IF EXISTS trg_pc_exit_dashboard ON public.pc_exit;
+CREATE TRIGGER trg_pc_exit_dashboard
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.pc_exit
+    FOR EACH STATEMENT EXECUTE FUNCTION public.pc_notificar_dashboard();
@@ -0,0 +1,96 @@
+-- Visões materializadas das consultas de estoque e pós-montagem do dashboard de produção
+-- (dashboard_app.py). O dashboard faz REFRESH ... CONCURRENTLY a cada recálculo do snapshot:
+-- no intervalo e logo após mudanças no estoque (NOTIFY da migração 0008). O refresh
+-- concorrente exige um índice único só com colunas, sem WHERE.
+--
+-- Mesmo resultado das consultas diretas, mas com junções em vez de subconsultas por linha:
+-- o sensor de reserva (dados_op / PBS do plano) e a última etapa apontada no PPLUG são
+-- calculados uma vez por OP/peça do estoque. Diferenças: o agrupamento usa a etapa e a
+-- prioridade já em maiúsculas (a chave do índice único) e o sensor de reserva vem da
+-- linha de dados_op que tem sensor, em vez de uma linha qualquer da OP.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.mv_dashboard_estoque AS
+WITH estoque AS (
+    SELECT
+        i.op,
+        i.peca,
+        i.projeto,
+        COALESCE(d.modelo, i.veiculo) AS veiculo,
+        COALESCE(UPPER(d.etapa), 'PEÇA NÃO ESTÁ NO PPLUG OU FOI APROVADA IF') AS etapa,
+        COALESCE(UPPER(d.prioridade), 'NORMAL') AS prioridade,
+        STRING_AGG(DISTINCT i.local, ', ' ORDER BY i.local) AS locais,
+        COUNT(*) AS quantidade,
+        NULLIF(STRING_AGG(DISTINCT NULLIF(i.sensor, ''), ', ' ORDER BY NULLIF(i.sensor, '')), '') AS sensor,
+        MAX(i.id) AS ultimo_id
+    FROM public.pc_inventory i
+    LEFT JOIN dados_uso_geral.dados_op d ON d.op::text = i.op AND d.item = i.peca AND d.planta = 'Jarinu'
+    GROUP BY 1, 2, 3, 4, 5, 6
+),
+-- Sensor de reserva por OP: uma linha de dados_op (preferindo a que tem sensor)...
+sensor_op AS (
+    SELECT DISTINCT ON (d.op::text) d.op::text AS op, NULLIF(d.sensor, '') AS sensor
+    FROM dados_uso_geral.dados_op d
+    WHERE d.planta = 'Jarinu'
+    AND d.op::text IN (SELECT op FROM public.pc_inventory)
+    ORDER BY d.op::text, NULLIF(d.sensor, '') IS NULL
+),
+-- ...e, se ela não tem, o sensor da peça PBS da OP no plano de corte
+sensor_pbs AS (
+    SELECT DISTINCT ON (p.op) p.op, NULLIF(p.sensor, '') AS sensor
+    FROM public.plano_controle_corte_vidro2 p
+    WHERE p.peca = 'PBS' AND p.sensor IS NOT NULL AND p.sensor != ''
+    AND p.op IN (SELECT op FROM public.pc_inventory)
+    ORDER BY p.op
+)
+SELECT
+    e.op,
+    e.peca,
+    e.projeto,
+    e.veiculo,
+    e.locais,
+    e.quantidade,
+    e.etapa,
+    e.prioridade,
+    COALESCE(
+        e.sensor,
+        CASE WHEN so.op IS NOT NULL THEN COALESCE(so.sensor, sp.sensor) END,
+        ''
+    ) AS sensor,
+    e.ultimo_id
+FROM estoque e
+LEFT JOIN sensor_op so ON so.op = e.op
+LEFT JOIN sensor_pbs sp ON sp.op = e.op;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_dashboard_estoque_chave
+    ON public.mv_dashboard_estoque (op, peca, projeto, veiculo, etapa, prioridade);
+
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.mv_dashboard_pos_montagem AS
+WITH ultimo_apontamento AS (
+    -- op::text: a sincronização do PPLUG (apontamentos_pplug_jarinu.py) grava a OP como número
+    SELECT DISTINCT ON (a.op::text, a.item) a.op::text AS op, a.item, a.etapa
+    FROM apontamento_pplug_jarinu a
+    WHERE (a.op::text, a.item) IN (SELECT op, peca FROM public.pc_inventory)
+    ORDER BY a.op::text, a.item, a.data DESC
+)
+SELECT
+    i.op,
+    i.peca,
+    i.projeto,
+    COALESCE(d.modelo, i.veiculo) AS veiculo,
+    STRING_AGG(DISTINCT i.local, ', ' ORDER BY i.local) AS locais,
+    COUNT(*) AS quantidade,
+    CASE
+        WHEN u.etapa = 'INSPECAO FINAL' THEN 'PEÇA APROVADA INSP FINAL'
+        ELSE UPPER(d.etapa)
+    END AS etapa,
+    COALESCE(UPPER(d.prioridade), 'NORMAL') AS prioridade,
+    MAX(i.id) AS ultimo_id
+FROM public.pc_inventory i
+INNER JOIN dados_uso_geral.dados_op d ON d.op::text = i.op AND d.item = i.peca AND d.planta = 'Jarinu'
+LEFT JOIN ultimo_apontamento u ON u.op = i.op AND u.item = i.peca
+WHERE UPPER(d.etapa) IN ('MONTAGEM', 'INSPECAO FINAL', 'BUFFER-AUTOCLAVE', 'AUTOCLAVE', 'EMBOLSADO')
+GROUP BY 1, 2, 3, 4, 7, 8;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_dashboard_pos_montagem_chave
+    ON public.mv_dashboard_pos_montagem (op, peca, projeto, veiculo, etapa, prioridade);
@@ -0,0 +1,9 @@
+-- Sincronização incremental do PPLUG (apontamentos_pplug_jarinu.py): a marca d'água é o
+-- maior id gravado e a deduplicação é INSERT ... ON CONFLICT (id) DO NOTHING, os dois
+-- pelo índice único de id. Linhas repetidas de sincronizações antigas (mesmo id) ficam
+-- uma só antes de criar o índice.
+DELETE FROM public.apontamento_pplug_jarinu a
+USING public.apontamento_pplug_jarinu b
+WHERE a.id = b.id AND a.ctid > b.ctid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_apontamento_pplug_jarinu_id ON public.apontamento_pplug_jarinu (id);
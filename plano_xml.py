@@ -0,0 +1,237 @@
+"""Planejamento das ordens XML da CNC (gerar_xml e reprocessar_baixa).
+
+Cada peça vira um ou mais XMLs:
+
+    peça -> peças especiais de pc_camadas ("TSA - TSB" substitui a original)
+         -> camadas com quantidade (l3, l3_b, l4 ... l8; sem camada válida: GENERICO)
+         -> arquivo de corte (L3 prefere o arquivo _A, L3_B o _B, as demais pela posição)
+
+e recebe a OP diferenciada ``<op>-<letra>`` (A, B, C... por camada, +10 letras
+por peça especial). As camadas do lote vêm de uma consulta (``carregar_camadas``)
+e os arquivos do índice em memória de arquivos_corte, então ``planejar`` é uma
+função pura: não acessa o banco e pode ser conferida e medida isoladamente.
+
+Medição:
+    python plano_xml.py
+"""
+import xml_cnc
+
+COLUNAS_CAMADAS = ('l3', 'l3_b', 'l4', 'l5', 'l6', 'l7', 'l8')
+VALORES_VAZIOS = ('-', '', 'None', 'NULL', 'null')
+SENSOR_PADRAO = '1'
+
+
+def valor_vazio(valor):
+    return not valor or str(valor).strip() in VALORES_VAZIOS
+
+
+def carregar_camadas(cur, pares):
+    """Linha de pc_camadas de cada (projeto, peca), em uma consulta"""
+    pares = sorted({(str(projeto), str(peca)) for projeto, peca in pares})
+    if not pares:
+        return {}
+    cur.execute("""
+        SELECT c.* FROM public.pc_camadas c
+        JOIN unnest(%s::text[], %s::text[]) AS v(projeto, peca)
+          ON c.projeto = v.projeto AND c.peca = v.peca
+        ORDER BY c.id
+    """, ([projeto for projeto, _ in pares], [peca for _, peca in pares]))
+    camadas = {}
+    for row in cur.fetchall():
+        camadas.setdefault((row['projeto'], row['peca']), row)
+    return camadas
+
+
+def camadas_da_peca(camadas_por_peca, projeto, peca):
+    return camadas_por_peca.get((str(projeto), str(peca)))
+
+
+def pecas_especiais(peca, camadas_result):
+    """Peças a gerar no lugar de ``peca``: "TSA - TSB" -> ['TSA', 'TSB']; sem especiais, [peca]"""
+    if camadas_result and camadas_result.get('pecas_especiais'):
+        pecas_especiais_str = camadas_result['pecas_especiais'].strip()
+        if pecas_especiais_str and pecas_especiais_str != '-':
+            return [p.strip() for p in pecas_especiais_str.split('-') if p.strip()]
+    return [peca]
+
+
+def quantidades_camadas(camadas_result):
+    """[(CAMADA, quantidade)] das camadas preenchidas, na ordem das colunas da tabela.
+
+    Valor que não é número conta como 1; zero ou negativo é ignorado.
+    """
+    if not camadas_result:
+        return []
+    quantidades = []
+    for coluna in [col for col in camadas_result.keys() if col in COLUNAS_CAMADAS]:
+        valor_camada = camadas_result[coluna]
+        if valor_vazio(valor_camada):
+            continue
+        try:
+            quantidade = int(float(str(valor_camada)))
+            if quantidade <= 0:
+                continue
+        except (ValueError, TypeError):
+            quantidade = 1
+        quantidades.append((coluna.upper(), quantidade))
+    return quantidades
+
+
+def selecionar_arquivo(arquivos, camada, idx):
+    """Arquivo de corte da camada entre os arquivos da peça (na ordem do índice)"""
+    if camada in ('L3', 'L3_B'):
+        marcador = '_A' if camada == 'L3' else '_B'
+        for arq in arquivos:
+            if marcador in (arq['nome_peca'] or ''):
+                return arq
+        if camada == 'L3_B' and len(arquivos) > 1:
+            # Sem _B: o segundo arquivo, se existir
+            return arquivos[1]
+        return arquivos[0]
+    return arquivos[idx] if idx < len(arquivos) else arquivos[0]
+
+
+class Ordem:
+    """Um XML do plano: peça, camada e arquivo de corte escolhido."""
+
+    def __init__(self, op, op_diferenciada, projeto, peca, camada, item, itens, quantidade,
+                 arquivo, local, veiculo):
+        self.op = op
+        self.op_diferenciada = op_diferenciada
+        self.projeto = projeto
+        self.peca = peca
+        self.camada = camada
+        self.item = item  # None quando a camada gera um XML só
+        self.itens = itens
+        self.quantidade = quantidade
+        self.arquivo = arquivo
+        self.local = local
+        self.veiculo = veiculo
+
+    @property
+    def nome_peca(self):
+        return self.arquivo['nome_peca']
+
+    def nome_arquivo(self, sufixo=''):
+        nome = f"{self.op}_{self.projeto}_{self.peca}_{self.camada}"
+        if self.item is not None and self.itens > 1:
+            nome += f"_{self.item:02d}"
+        return f"{nome}{sufixo}.xml"
+
+    def xml(self, data_entrega):
+        # PartCode e FilePart são o nome completo do arquivo de corte
+        return xml_cnc.xml_ordem(
+            part_code=self.nome_peca,
+            customer_code=self.veiculo,
+            customer_description=f"{self.local} | {self.projeto} | {self.peca} | {self.camada}",
+            thickness=str(self.arquivo.get('espessura', '1.0')),
+            order=self.op_diferenciada,
+            qty_required=self.quantidade,
+            delivery_date=data_entrega,
+            file_part=self.nome_peca
+        )
+
+
+class Plano:
+    def __init__(self):
+        self.ordens = []
+        self.faltando = []  # descrições das peças sem XML
+
+
+def planejar(pecas, camadas_por_peca, indice_arquivos, um_xml_por_unidade=False):
+    """Plano de XMLs de um lote.
+
+    pecas: dicts com op, projeto, peca, sensor, local, veiculo.
+    camadas_por_peca: resultado de ``carregar_camadas``.
+    indice_arquivos: ``arquivos_corte.IndiceArquivos``.
+    um_xml_por_unidade: camada com quantidade N gera N XMLs de QtyRequired 1
+        (reprocessamento) em vez de um XML com QtyRequired N.
+    """
+    plano = Plano()
+    for peca_data in pecas:
+        projeto = peca_data.get('projeto', '')
+        op = peca_data['op']
+        sensor = peca_data.get('sensor', '') or ''
+        if sensor in VALORES_VAZIOS:
+            sensor = SENSOR_PADRAO
+        camadas_result = camadas_da_peca(camadas_por_peca, projeto, peca_data['peca'])
+
+        for peca_index, peca_atual in enumerate(pecas_especiais(peca_data['peca'], camadas_result)):
+            camadas = []
+            for camada, quantidade in quantidades_camadas(camadas_result):
+                if um_xml_por_unidade:
+                    camadas.extend((camada, i + 1, quantidade, 1) for i in range(quantidade))
+                else:
+                    camadas.append((camada, None, quantidade, quantidade))
+
+            if not camadas:
+                # Sem camadas válidas: um XML genérico, se a peça tiver algum arquivo
+                if indice_arquivos.todos(projeto, peca_atual):
+                    camadas.append(('GENERICO', None, 1, 1))
+                elif camadas_result:
+                    camadas_info = ', '.join(f"{col}: {camadas_result.get(col, 'N/A')}" for col in ('l3', 'l3_b'))
+                    plano.faltando.append(f"{projeto} {peca_atual} - Sem camadas válidas ({camadas_info})")
+                    continue
+                else:
+                    plano.faltando.append(f"{projeto} {peca_atual} - Não encontrado na tabela pc_camadas nem arquivos_pc")
+                    continue
+
+            arquivos = indice_arquivos.por_sensor(projeto, peca_atual, sensor)
+            if not arquivos:
+                arquivos = indice_arquivos.por_nome_sensor(projeto, peca_atual, sensor)
+            if not arquivos:
+                plano.faltando.append(f"{projeto} {peca_atual} - Nenhum arquivo encontrado na tabela arquivos_pc")
+                continue
+
+            for idx, (camada, item, itens, quantidade) in enumerate(camadas):
+                plano.ordens.append(Ordem(
+                    op=op,
+                    op_diferenciada=f"{op}-{chr(65 + (peca_index * 10) + idx)}",
+                    projeto=projeto,
+                    peca=peca_atual,
+                    camada=camada,
+                    item=item,
+                    itens=itens,
+                    quantidade=quantidade,
+                    arquivo=selecionar_arquivo(arquivos, camada, idx),
+                    local=peca_data.get('local', ''),
+                    veiculo=peca_data.get('veiculo', '')
+                ))
+    return plano
+
+
+def _medir(quantidade=2000):
+    import time
+    from arquivos_corte import IndiceArquivos
+
+    linhas = []
+    camadas_por_peca = {}
+    pecas = []
+    for i in range(quantidade):
+        projeto, peca = str(1000 + i % 50), f'{i:04d}'
+        for j, sufixo in enumerate(('A', 'B', 'C')):
+            linhas.append({
+                'id': i * 3 + j, 'projeto': projeto, 'peca': peca, 'sensor': '1',
+                'nome_peca': f'PC_{projeto}_{peca}_{sufixo}', 'espessura': '1.5',
+                'camada': None, 'tamanho_peca': None,
+            })
+        camadas_por_peca[(projeto, peca)] = {
+            'projeto': projeto, 'peca': peca, 'l3': '1', 'l3_b': '1', 'l4': '2',
+            'l5': '-', 'l6': None, 'l7': None, 'l8': None, 'pecas_especiais': '-',
+        }
+        pecas.append({'op': str(200000 + i), 'projeto': projeto, 'peca': peca, 'sensor': '1',
+                      'local': f'SLOT {i % 169 + 1}', 'veiculo': 'COROLLA'})
+    indice = IndiceArquivos(1, linhas)
+
+    inicio = time.perf_counter()
+    plano = planejar(pecas, camadas_por_peca, indice)
+    meio = time.perf_counter()
+    for ordem in plano.ordens:
+        ordem.xml('17/10/2026')
+    fim = time.perf_counter()
+    print(f"Plano: {quantidade} peças -> {len(plano.ordens)} ordens em {meio - inicio:.3f}s")
+    print(f"XML:   {len(plano.ordens)} ordens em {fim - meio:.3f}s ({len(plano.ordens) / (fim - meio):,.0f} ordens/s)")
+
+
+if __name__ == '__main__':
+    _medir()
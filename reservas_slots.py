@@ -0,0 +1,210 @@
+"""Reservas de slots por requisição, com retenção opcional entre processos.
+
+Cada requisição usa o seu próprio ``ReservaSlots``: o motor de ocupação e as
+reservas provisórias ficam no objeto, nunca em estado global, então threads do
+mesmo worker não interferem umas nas outras.
+
+Com ``SLOT_RESERVA_TTL`` > 0 (segundos), as sugestões também viram retenções
+na tabela ``pc_reservas_slots`` com validade curta. Antes de alocar, a reserva
+trava os grupos de slots das categorias com ``pg_advisory_xact_lock`` numa
+conexão própria, relê a ocupação + retenções dos outros workers para aqueles
+slots e só libera as travas ao gravar as próprias retenções. Grupos diferentes
+(GG, G, M, P) não bloqueiam uns aos outros.
+
+Quem aloca várias peças chama ``travar`` antes com todas as categorias: os
+grupos são travados de uma vez, sempre na mesma ordem, então duas requisições
+nunca esperam uma pela outra em ordem inversa. Cada trava espera no máximo
+``SLOT_TRAVA_TIMEOUT`` segundos; se não sair (ou o Postgres acusar deadlock),
+as travas são soltas e a tentativa é refeita algumas vezes antes de
+``TravaSlotsError``, que a requisição devolve como erro.
+"""
+import os
+import time
+import uuid
+
+import psycopg2.errors
+import psycopg2.extras
+
+import db_pool
+from slots import GRUPO_CATEGORIA, MotorSlots, categoria_peca, locais_da_categoria
+
+# Primeiro argumento de pg_advisory_xact_lock(int, int) reservado para os slots
+CHAVE_TRAVA_SLOTS = 7001
+_INDICE_GRUPO = {'GG': 1, 'G': 2, 'M': 3, 'P': 4}
+# Tentativas de travar os grupos antes de desistir da requisição
+TENTATIVAS_TRAVA = 3
+
+
+class TravaSlotsError(Exception):
+    """Os grupos de slots continuaram travados por outras requisições."""
+
+
+def ttl_reserva():
+    try:
+        return max(0, int(os.getenv('SLOT_RESERVA_TTL', '0')))
+    except ValueError:
+        return 0
+
+
+def tempo_trava():
+    try:
+        return max(1, int(os.getenv('SLOT_TRAVA_TIMEOUT', '10')))
+    except ValueError:
+        return 10
+
+
+def liberar_reservas(cur, pares_op_peca):
+    """Remove retenções das peças (op, peca) que já foram gravadas em pc_otimizadas/pc_inventory"""
+    pares = [(str(op), str(peca)) for op, peca in pares_op_peca]
+    if not pares or not ttl_reserva():
+        return
+    psycopg2.extras.execute_values(cur, """
+        DELETE FROM public.pc_reservas_slots r
+        USING (VALUES %s) AS v(op, peca)
+        WHERE r.op = v.op AND r.peca = v.peca
+    """, pares)
+
+
+class ReservaSlots:
+    """Contexto de reserva de uma requisição."""
+
+    def __init__(self, conn, ttl=None):
+        self.conn = conn
+        self.ttl = ttl_reserva() if ttl is None else ttl
+        self.token = uuid.uuid4().hex
+        self.motor = None
+        self._conn_retencao = None
+        self._grupos_travados = set()
+        self._alocados = {}
+        self._retencoes = []
+
+    @property
+    def retencao_ativa(self):
+        return self.ttl > 0
+
+    def _carregar_motor(self):
+        if self.motor is not None:
+            return self.motor
+        cur = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        self.motor = MotorSlots.carregar(cur)
+        if self.retencao_ativa:
+            cur.execute("""
+                SELECT local, COUNT(*) AS total FROM public.pc_reservas_slots
+                WHERE expira_em > NOW()
+                GROUP BY local
+            """)
+            self.motor.adicionar_ocupacao({row['local']: row['total'] for row in cur.fetchall()})
+        return self.motor
+
+    def travar(self, categorias):
+        """Trava de uma vez os grupos de slots das categorias, em ordem fixa.
+
+        Sem retenção não há trava. Se faltar um grupo que vem antes de um já
+        travado, tudo é solto e travado de novo na ordem.
+        """
+        if not self.retencao_ativa:
+            return
+        grupos = {GRUPO_CATEGORIA[categoria] for categoria in categorias} - self._grupos_travados
+        if not grupos:
+            return
+        self._carregar_motor()
+        if self._grupos_travados and min(map(_INDICE_GRUPO.get, grupos)) < max(map(_INDICE_GRUPO.get, self._grupos_travados)):
+            grupos |= self._grupos_travados
+            self._soltar()
+
+        for tentativa in range(1, TENTATIVAS_TRAVA + 1):
+            try:
+                self._travar_grupos(sorted(grupos, key=_INDICE_GRUPO.get))
+                return
+            except (psycopg2.errors.LockNotAvailable, psycopg2.errors.DeadlockDetected) as e:
+                print(f"DEBUG RESERVA: Slots {', '.join(sorted(grupos))} ocupados por outra requisição "
+                      f"(tentativa {tentativa}/{TENTATIVAS_TRAVA}): {e}")
+                self._soltar()
+                if tentativa < TENTATIVAS_TRAVA:
+                    time.sleep(0.2 * tentativa)
+            except Exception:
+                self.finalizar(sucesso=False)
+                raise
+        self.finalizar(sucesso=False)
+        raise TravaSlotsError('Slots em uso por outra requisição, tente novamente')
+
+    def _soltar(self):
+        """Desfaz a transação de retenção: as travas saem, as retenções ainda não gravadas ficam."""
+        if self._conn_retencao is not None:
+            self._conn_retencao.rollback()
+        self._grupos_travados = set()
+
+    def _travar_grupos(self, grupos):
+        if self._conn_retencao is None:
+            self._conn_retencao = db_pool.get_db_connection()
+        cur = self._conn_retencao.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT set_config('lock_timeout', %s, true)", (f'{tempo_trava()}s',))
+        for grupo in grupos:
+            cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (CHAVE_TRAVA_SLOTS, _INDICE_GRUPO[grupo]))
+
+        # Com as travas, reler a ocupação dos grupos (outros workers podem ter gravado retenções)
+        locais = [local for grupo in grupos for local in locais_da_categoria(grupo)]
+        locais_grupos = set(locais)
+        cur.execute("""
+            SELECT local, SUM(total) AS total FROM (
+                SELECT local, COUNT(*) AS total FROM public.pc_inventory
+                WHERE local = ANY(%s) GROUP BY local
+                UNION ALL
+                SELECT local, COUNT(*) FROM public.pc_otimizadas
+                WHERE local = ANY(%s) AND tipo = 'PC' GROUP BY local
+                UNION ALL
+                SELECT local, COUNT(*) FROM public.pc_reservas_slots
+                WHERE local = ANY(%s) AND expira_em > NOW() AND token != %s GROUP BY local
+            ) AS ocupacao
+            GROUP BY local
+        """, (locais, locais, locais, self.token))
+        ocupacao = {row['local']: int(row['total']) for row in cur.fetchall()}
+        for local, quantidade in self._alocados.items():
+            if local in locais_grupos:
+                ocupacao[local] = ocupacao.get(local, 0) + quantidade
+        self.motor.definir_ocupacao(locais, ocupacao)
+        self._grupos_travados.update(grupos)
+
+    def sugerir(self, tipo_peca, tem_tamanho_gg=False, op=None, peca=None, reter=True):
+        """Aloca um slot para a peça. reter=False para quem grava a peça na mesma requisição."""
+        motor = self._carregar_motor()
+        self.travar([categoria_peca(tipo_peca, tem_tamanho_gg)])
+        slot = motor.alocar(tipo_peca, tem_tamanho_gg)
+        if slot is None:
+            return None
+        self._alocados[slot] = self._alocados.get(slot, 0) + 1
+        if self.retencao_ativa and reter:
+            self._retencoes.append((self.token, slot, str(op or ''), str(peca or tipo_peca)))
+        return slot
+
+    def finalizar(self, sucesso=True):
+        """Grava as retenções (se houver) e solta as travas. Pode ser chamado mais de uma vez."""
+        conn = self._conn_retencao
+        self._conn_retencao = None
+        if conn is None:
+            return
+        try:
+            if sucesso and self._retencoes:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM public.pc_reservas_slots WHERE expira_em <= NOW()")
+                psycopg2.extras.execute_values(cur, """
+                    INSERT INTO public.pc_reservas_slots (token, local, op, peca, expira_em)
+                    VALUES %s
+                """, self._retencoes, template=f"(%s, %s, %s, %s, NOW() + INTERVAL '{int(self.ttl)} seconds')")
+                conn.commit()
+            else:
+                conn.rollback()
+        except Exception as e:
+            print(f"DEBUG RESERVA: Erro ao gravar retenções de slots: {e}")
+            conn.rollback()
+        finally:
+            self._retencoes = []
+            self._grupos_travados = set()
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finalizar(sucesso=exc_type is None)
+        return False
@@ -0,0 +1,195 @@
+"""Motor de ocupação de slots usado na sugestão de local de armazenamento.
+
+Carrega limites (pc_locais) e ocupação (pc_inventory + pc_otimizadas) uma vez
+e depois distribui slots em memória. Limite e ocupação ficam em arrays
+indexados pelo número do slot; cada categoria de peça tem sua lista ordenada
+de slots com um cursor, então cada alocação custa O(1) amortizado.
+
+Regras de categoria (mesmas de sugerir_local_armazenamento):
+    GG                               -> SLOT 1-3
+    TSP, TSA, TSC, TSB, PBS, VGA     -> SLOT 4-40 e 81-117 (também peças não categorizadas)
+    PDE, PDD, PTE, PTD, TME, TMD     -> SLOT 41-80 e 118-157
+    FTE, FTD, QTD, QTE, QDD, QDE,
+    FDD, FDE, CBE, CBD               -> SLOT 158-273
+    CBD, CBE (4 camadas)             -> primeiro slot vazio; senão slot com apenas 1 peça
+"""
+import re
+from array import array
+
+LIMITE_PADRAO = 6
+SLOT_MAXIMO = 273
+_INATIVO = -1
+_PADRAO_SLOT = re.compile(r'SLOT (\d+)')
+
+CATEGORIA_GG = 'GG'
+CATEGORIA_G = 'G'
+CATEGORIA_M = 'M'
+CATEGORIA_P = 'P'
+CATEGORIA_CB = 'CB'
+CATEGORIA_CB_GG = 'CB_GG'
+
+FAIXAS_CATEGORIA = {
+    CATEGORIA_GG: [range(1, 4)],
+    CATEGORIA_G: [range(4, 41), range(81, 118)],
+    CATEGORIA_M: [range(41, 81), range(118, 158)],
+    CATEGORIA_P: [range(158, 274)],
+    CATEGORIA_CB: [range(158, 274)],
+    # CBD/CBE com tamanho GG seguem a regra de 4 camadas nos slots GG
+    CATEGORIA_CB_GG: [range(1, 4)],
+}
+
+# Categorias que disputam os mesmos slots (usado para travas entre processos)
+GRUPO_CATEGORIA = {
+    CATEGORIA_GG: CATEGORIA_GG,
+    CATEGORIA_CB_GG: CATEGORIA_GG,
+    CATEGORIA_G: CATEGORIA_G,
+    CATEGORIA_M: CATEGORIA_M,
+    CATEGORIA_P: CATEGORIA_P,
+    CATEGORIA_CB: CATEGORIA_P,
+}
+
+PECAS_G = {'TSP', 'TSA', 'TSC', 'TSB', 'PBS', 'VGA'}
+PECAS_M = {'PDE', 'PDD', 'PTE', 'PTD', 'TME', 'TMD'}
+PECAS_P = {'FTE', 'FTD', 'QTD', 'QTE', 'QDD', 'QDE', 'FDD', 'FDE'}
+PECAS_CB = {'CBE', 'CBD'}
+
+
+def categoria_peca(tipo_peca, tem_tamanho_gg=False):
+    if tipo_peca in PECAS_CB:
+        return CATEGORIA_CB_GG if tem_tamanho_gg else CATEGORIA_CB
+    if tem_tamanho_gg:
+        return CATEGORIA_GG
+    if tipo_peca in PECAS_G:
+        return CATEGORIA_G
+    if tipo_peca in PECAS_M:
+        return CATEGORIA_M
+    if tipo_peca in PECAS_P:
+        return CATEGORIA_P
+    return CATEGORIA_G
+
+
+def numero_slot(local):
+    """'SLOT 12' -> 12; None para locais fora do padrão"""
+    if not local:
+        return None
+    match = _PADRAO_SLOT.fullmatch(str(local))
+    if not match:
+        return None
+    numero = int(match.group(1))
+    return numero if numero <= SLOT_MAXIMO else None
+
+
+def nome_slot(numero):
+    return f'SLOT {numero}'
+
+
+def locais_da_categoria(categoria):
+    return [nome_slot(n) for faixa in FAIXAS_CATEGORIA[categoria] for n in faixa]
+
+
+class MotorSlots:
+    """Ocupação dos slots em memória para uma requisição (ou lote de requisições)."""
+
+    def __init__(self, limites, ocupacao):
+        """limites: {local: limite} dos slots ativos; ocupacao: {local: quantidade}"""
+        self.limite = array('i', [_INATIVO]) * (SLOT_MAXIMO + 1)
+        self.ocupado = array('i', [0]) * (SLOT_MAXIMO + 1)
+        for local, limite in limites.items():
+            numero = numero_slot(local)
+            if numero is not None:
+                self.limite[numero] = int(limite)
+        for local, quantidade in ocupacao.items():
+            numero = numero_slot(local)
+            if numero is not None:
+                self.ocupado[numero] += int(quantidade)
+        self._reiniciar_cursores()
+
+    @classmethod
+    def carregar(cls, cur):
+        """Lê limites e ocupação atual do banco (2 consultas). Espera DictCursor."""
+        cur.execute("SELECT local, limite FROM public.pc_locais WHERE status = 'Ativo' ORDER BY local")
+        limites = {row['local']: int(row['limite']) if row['limite'] else LIMITE_PADRAO for row in cur.fetchall()}
+
+        cur.execute("""
+            SELECT local, COUNT(*) as total
+            FROM (
+                SELECT local FROM public.pc_inventory WHERE local IS NOT NULL AND local != ''
+                UNION ALL
+                SELECT local FROM public.pc_otimizadas WHERE local IS NOT NULL AND local != '' AND tipo = 'PC'
+            ) as todos_locais
+            GROUP BY local
+        """)
+        ocupacao = {row['local']: row['total'] for row in cur.fetchall()}
+        return cls(limites, ocupacao)
+
+    def adicionar_ocupacao(self, ocupacao):
+        """Soma quantidades {local: n} à ocupação (n negativo libera espaço)"""
+        liberou = False
+        for local, quantidade in ocupacao.items():
+            numero = numero_slot(local)
+            if numero is None or not quantidade:
+                continue
+            self.ocupado[numero] += int(quantidade)
+            liberou = liberou or quantidade < 0
+        if liberou:
+            self._reiniciar_cursores()
+
+    def definir_ocupacao(self, locais, ocupacao):
+        """Substitui a ocupação dos locais informados por ocupacao.get(local, 0)"""
+        for local in locais:
+            numero = numero_slot(local)
+            if numero is not None:
+                self.ocupado[numero] = int(ocupacao.get(local, 0))
+        self._reiniciar_cursores()
+
+    def _reiniciar_cursores(self):
+        self._listas = {}
+        self._cursores = {}
+        for categoria, faixas in FAIXAS_CATEGORIA.items():
+            # Listas livres só com slots ativos, na ordem de preferência
+            self._listas[categoria] = array('i', [n for faixa in faixas for n in faixa if self.limite[n] != _INATIVO])
+            self._cursores[categoria] = 0
+            self._cursores[categoria + '_UM'] = 0
+
+    def _proximo(self, categoria, chave_cursor, aceita):
+        lista = self._listas[categoria]
+        cursor = self._cursores[chave_cursor]
+        while cursor < len(lista) and not aceita(lista[cursor]):
+            cursor += 1
+        self._cursores[chave_cursor] = cursor
+        return lista[cursor] if cursor < len(lista) else None
+
+    def _tem_espaco(self, numero):
+        return self.limite[numero] - self.ocupado[numero] > 0
+
+    def _vazio(self, numero):
+        return self.ocupado[numero] == 0
+
+    def _com_uma_peca(self, numero):
+        return self.ocupado[numero] == 1
+
+    def alocar(self, tipo_peca, tem_tamanho_gg=False):
+        """Reserva um slot para a peça e retorna o nome ('SLOT n') ou None se não houver espaço"""
+        categoria = categoria_peca(tipo_peca, tem_tamanho_gg)
+        if categoria in (CATEGORIA_CB, CATEGORIA_CB_GG):
+            # Ocupação só cresce durante a alocação: um slot que deixou de estar vazio
+            # não volta a ficar, e só se busca slot com 1 peça quando acabam os vazios
+            numero = self._proximo(categoria, categoria, self._vazio)
+            if numero is None:
+                numero = self._proximo(categoria, categoria + '_UM', self._com_uma_peca)
+        else:
+            numero = self._proximo(categoria, categoria, self._tem_espaco)
+        if numero is None:
+            return None
+        self.ocupado[numero] += 1
+        return nome_slot(numero)
+
+    def limite_de(self, local):
+        numero = numero_slot(local)
+        if numero is None or self.limite[numero] == _INATIVO:
+            return None
+        return self.limite[numero]
+
+    def ocupacao_de(self, local):
+        numero = numero_slot(local)
+        return self.ocupado[numero] if numero is not None else 0
@@ -0,0 +1,282 @@
+"""Resultado pré-calculado em segundo plano e servido igual para todos os clientes.
+
+Uma thread por processo recalcula os dados (``calcular``) a cada ``intervalo``
+segundos, ou logo após ``atualizar_agora()``, e guarda o JSON já serializado
+(e comprimido em gzip) com uma versão e um ETag. As requisições só leem esse
+resultado: N telas abertas custam um ciclo de consultas, não N, e quem já tem
+a versão atual recebe 304 sem corpo (``If-None-Match``).
+
+A versão só muda quando o conteúdo muda; recálculos com o mesmo resultado
+mantêm o ETag. Se um recálculo falha, o resultado anterior continua sendo
+servido e a próxima tentativa acontece no intervalo normal.
+
+Com ``chave`` (função que identifica cada linha), cada versão nova também
+gera a diferença para a anterior (linhas adicionadas, alteradas e removidas),
+e ``eventos`` entrega essas diferenças por Server-Sent Events: o cliente
+carrega tudo uma vez e depois só recebe o que mudou. ``ouvir_notify`` recalcula
+logo após um NOTIFY do Postgres, em vez de esperar o intervalo.
+
+As versões são identificadas por ``<época>:<número>``; a época muda quando o
+processo reinicia, e o cliente com versão de outra época recarrega tudo.
+"""
+import gzip
+import hashlib
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from flask import Response
+
+# Intervalo de comentários "ping" no stream de eventos (mantém proxies e o navegador conectados)
+INTERVALO_PING = 20
+
+
+class Snapshot:
+    def __init__(self, nome, calcular, intervalo=60.0, intervalo_minimo=0.0, chave=None, historico=50):
+        """calcular() retorna os dados (lista de dicts com ``chave``); intervalo_minimo limita recálculos pedidos"""
+        self.nome = nome
+        self.calcular = calcular
+        self.intervalo = intervalo
+        self.intervalo_minimo = intervalo_minimo
+        self.chave = chave
+        self.epoca = f"{int(time.time()):x}{os.getpid():x}"
+        self._lock = threading.Lock()
+        self._mudou = threading.Condition(self._lock)
+        self._pronto = threading.Event()
+        self._acordar = threading.Event()
+        self._thread = None
+        self._atual = None
+        self._versao = 0
+        self._linhas = {}
+        self._mudancas = deque(maxlen=historico)
+        self._ultimo_erro = None
+
+    def iniciar(self):
+        """Sobe a thread de atualização (uma vez)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._laco, name=f'snapshot-{self.nome}', daemon=True)
+            self._thread.start()
+        print(f"DEBUG SNAPSHOT: {self.nome} atualizado a cada {self.intervalo:g}s")
+
+    def atualizar_agora(self):
+        self._acordar.set()
+
+    def versao_id(self, versao):
+        return f"{self.epoca}:{versao}"
+
+    def _numero_versao(self, versao_id):
+        """Número da versão do cliente nesta época, ou None (sem versão, outra época ou inválida)"""
+        epoca, _, numero = (versao_id or '').partition(':')
+        if epoca != self.epoca or not numero.isdigit():
+            return None
+        return int(numero)
+
+    def _indexar(self, dados):
+        """{chave: linha}; cada linha recebe ``_chave`` (repetidas ganham #2, #3...)"""
+        linhas = {}
+        for linha in dados:
+            base = chave = str(self.chave(linha))
+            repeticao = 1
+            while chave in linhas:
+                repeticao += 1
+                chave = f"{base}#{repeticao}"
+            linha['_chave'] = chave
+            linhas[chave] = linha
+        return linhas
+
+    def _diferenca(self, anteriores, linhas):
+        return {
+            'adicionados': [linha for chave, linha in linhas.items() if chave not in anteriores],
+            'alterados': [linha for chave, linha in linhas.items()
+                          if chave in anteriores and anteriores[chave] != linha],
+            'removidos': [chave for chave in anteriores if chave not in linhas],
+        }
+
+    def atualizar(self):
+        """Recalcula e publica. Retorna True se o conteúdo mudou."""
+        inicio = time.monotonic()
+        dados = self.calcular()
+        linhas = self._indexar(dados) if self.chave else None
+        corpo = json.dumps(dados, ensure_ascii=False, default=str, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha1(corpo).hexdigest()[:20]
+        with self._lock:
+            if self._atual is not None and self._atual['etag'] == etag:
+                self._atual['gerado_em'] = time.time()
+                return False
+            self._versao += 1
+            if linhas is not None:
+                if self._atual is not None:
+                    diferenca = dict(self._diferenca(self._linhas, linhas),
+                                     versao=self.versao_id(self._versao), base=self.versao_id(self._versao - 1))
+                    self._mudancas.append((self._versao, json.dumps(
+                        diferenca, ensure_ascii=False, default=str, separators=(',', ':'))))
+                self._linhas = linhas
+            self._atual = {
+                'versao': self._versao,
+                'etag': etag,
+                'corpo': corpo,
+                'corpo_gzip': gzip.compress(corpo, 6),
+                'gerado_em': time.time(),
+                'duracao': round(time.monotonic() - inicio, 3),
+            }
+            self._mudou.notify_all()
+        print(f"DEBUG SNAPSHOT: {self.nome} versão {self._versao} ({len(corpo)} bytes em {time.monotonic() - inicio:.2f}s)")
+        return True
+
+    def mudancas_desde(self, versao):
+        """[(versão, JSON da diferença)] depois de ``versao``, ou None se o histórico não cobre (recarregar tudo)"""
+        with self._lock:
+            if versao is None or versao > self._versao:
+                return None
+            if versao == self._versao:
+                return []
+            mudancas = [(numero, corpo) for numero, corpo in self._mudancas if numero > versao]
+            if not mudancas or mudancas[0][0] != versao + 1:
+                return None
+            return mudancas
+
+    def esperar(self, versao, timeout):
+        """Espera uma versão mais nova que ``versao``. Retorna False se o tempo acabou."""
+        with self._mudou:
+            return self._mudou.wait_for(lambda: self._versao > (versao or 0), timeout)
+
+    def atual(self, espera=None):
+        """Último resultado publicado (dict com versao, etag, corpo...), esperando o primeiro por até ``espera`` s."""
+        self._pronto.wait(espera)
+        with self._lock:
+            return self._atual
+
+    def estado(self):
+        with self._lock:
+            atual = self._atual
+            return {
+                'epoca': self.epoca,
+                'versao': atual['versao'] if atual else None,
+                'etag': atual['etag'] if atual else None,
+                'gerado_em': atual['gerado_em'] if atual else None,
+                'duracao': atual['duracao'] if atual else None,
+                'ultimo_erro': self._ultimo_erro,
+            }
+
+    def resposta(self, req, espera=30.0):
+        """Resposta Flask para a requisição ``req``: 304 se o cliente já tem a versão, senão o JSON."""
+        atual = self.atual(espera)
+        if atual is None:
+            return Response(
+                json.dumps({'error': self._ultimo_erro or 'Dados ainda não disponíveis'}),
+                status=503, mimetype='application/json'
+            )
+        cabecalhos = {
+            'ETag': f'"{atual["etag"]}"',
+            'Cache-Control': 'no-cache',
+            'X-Snapshot-Versao': self.versao_id(atual['versao']),
+            'X-Snapshot-Gerado-Em': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(atual['gerado_em'])),
+            'Vary': 'Accept-Encoding',
+        }
+        if req.if_none_match.contains(atual['etag']):
+            return Response(status=304, headers=cabecalhos)
+        if 'gzip' in req.headers.get('Accept-Encoding', ''):
+            cabecalhos['Content-Encoding'] = 'gzip'
+            return Response(atual['corpo_gzip'], mimetype='application/json', headers=cabecalhos)
+        return Response(atual['corpo'], mimetype='application/json', headers=cabecalhos)
+
+    def eventos(self, req, duracao=300.0):
+        """Stream SSE com as diferenças a partir da versão do cliente (``Last-Event-ID`` ou ``?versao=``).
+
+        Cada evento ``mudancas`` traz uma versão; ``recarregar`` pede que o cliente
+        busque tudo de novo (versão desconhecida ou mais antiga que o histórico).
+        A conexão termina depois de ``duracao`` s e o navegador reconecta sozinho.
+        """
+        versao = self._numero_versao(req.headers.get('Last-Event-ID') or req.args.get('versao'))
+
+        def gerar():
+            nonlocal versao
+            fim = time.monotonic() + duracao
+            yield 'retry: 5000\n\n'
+            while True:
+                restante = fim - time.monotonic()
+                if restante <= 0:
+                    return
+                atual = self.atual(0)
+                if atual is None or atual['versao'] == versao:
+                    if not self.esperar(versao, min(INTERVALO_PING, restante)):
+                        yield ': ping\n\n'
+                    continue
+                mudancas = self.mudancas_desde(versao)
+                if mudancas is None:
+                    versao = atual['versao']
+                    dados = json.dumps({'versao': self.versao_id(versao)})
+                    yield f"id: {self.versao_id(versao)}\nevent: recarregar\ndata: {dados}\n\n"
+                    continue
+                for numero, corpo in mudancas:
+                    versao = numero
+                    yield f"id: {self.versao_id(numero)}\nevent: mudancas\ndata: {corpo}\n\n"
+
+        return Response(gerar(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # nginx: não segurar o stream em buffer
+            'X-Accel-Buffering': 'no',
+        })
+
+    def ouvir_notify(self, db_config, canal, agrupar=2.0):
+        """Thread que recalcula após cada NOTIFY em ``canal``; avisos dentro de ``agrupar`` s viram um só.
+
+        Usa conexão própria (fora do pool), parada em LISTEN; reconecta se cair.
+        """
+        def laco():
+            espera = 1.0
+            while True:
+                conn = None
+                try:
+                    conn = psycopg2.connect(**db_config)
+                    conn.autocommit = True
+                    conn.cursor().execute(f'LISTEN "{canal}"')
+                    print(f"DEBUG SNAPSHOT: {self.nome} ouvindo NOTIFY {canal}")
+                    espera = 1.0
+                    while True:
+                        if select.select([conn], [], [], 60) == ([], [], []):
+                            conn.poll()
+                            continue
+                        conn.poll()
+                        if not conn.notifies:
+                            continue
+                        time.sleep(agrupar)
+                        conn.poll()
+                        conn.notifies.clear()
+                        self.atualizar_agora()
+                except Exception as e:
+                    print(f"DEBUG SNAPSHOT: LISTEN {canal} indisponível: {e}")
+                finally:
+                    if conn is not None:
+                        try:
+                            conn.close()
+                        except Exception:
+                            pass
+                time.sleep(espera)
+                espera = min(espera * 2, 60)
+
+        threading.Thread(target=laco, name=f'notify-{self.nome}', daemon=True).start()
+
+    def _laco(self):
+        while True:
+            inicio = time.monotonic()
+            try:
+                self.atualizar()
+                self._ultimo_erro = None
+            except Exception as e:
+                self._ultimo_erro = str(e)
+                print(f"DEBUG SNAPSHOT: Erro ao atualizar {self.nome}: {e}")
+            finally:
+                self._pronto.set()
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            # Avisos em sequência (NOTIFY) não recalculam mais que uma vez por intervalo_minimo
+            restante = self.intervalo_minimo - (time.monotonic() - inicio)
+            if restante > 0:
+                time.sleep(restante)
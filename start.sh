@@ -12,6 +12,9 @@ cleanup() {
 # Capturar sinais para cleanup
 trap cleanup SIGTERM SIGINT
 
+echo "Aplicando migrações do banco..."
+python migracoes.py || exit 1
+
 echo "Iniciando Dashboard na porta 5002..."
 python dashboard_app.py &
 DASHBOARD_PID=$!
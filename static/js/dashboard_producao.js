@@ -1,5 +1,8 @@
 let dadosOriginais = [];
 let abaAtiva = 'premontagem';
+let etagDashboard = null;
+let versaoDashboard = null;
+let eventosDashboard = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     // Restaurar aba ativa do localStorage
@@ -12,7 +15,7 @@ document.addEventListener('DOMContentLoaded', function() {
     carregarDados();
     configurarPesquisa();
     
-    // Auto-refresh a cada 5 minutos
+    // Auto-refresh a cada 5 minutos (reserva: as mudanças chegam por /api/dashboard-producao/eventos)
     setInterval(carregarDados, 300000);
 });
 
@@ -120,13 +123,22 @@ async function carregarDados() {
     refreshIcon.classList.add('fa-spin');
     
     try {
+        // Dados pré-calculados no servidor: com a versão que já temos, a resposta é 304 sem corpo
+        const headers = { 'Cache-Control': 'no-cache' };
+        if (etagDashboard && dadosOriginais.length) {
+            headers['If-None-Match'] = etagDashboard;
+        }
         const response = await fetch('/api/dashboard-producao', {
             method: 'GET',
-            headers: {
-                'Cache-Control': 'no-cache'
-            }
+            cache: 'no-store',
+            headers
         });
         
+        if (response.status === 304) {
+            atualizarUltimaAtualizacao();
+            return;
+        }
+        
         if (!response.ok) {
             throw new Error(`HTTP ${response.status}`);
         }
@@ -137,16 +149,10 @@ async function carregarDados() {
             throw new Error(dados.error);
         }
         
-        dadosOriginais = dados;
-        renderizarDashboard(dados);
-        atualizarContadores(dados);
-        atualizarUltimaAtualizacao();
-        
-        // Reaplicar filtro se existir
-        const campoPesquisa = document.getElementById('campoPesquisa');
-        if (campoPesquisa?.value.trim()) {
-            filtrarPecas(campoPesquisa.value.trim());
-        }
+        etagDashboard = response.headers.get('ETag');
+        versaoDashboard = response.headers.get('X-Snapshot-Versao');
+        aplicarDados(dados);
+        conectarEventos();
         
     } catch (error) {
         console.error('Erro ao carregar dados:', error);
@@ -157,6 +163,60 @@ async function carregarDados() {
     }
 }
 
+function aplicarDados(dados) {
+    dadosOriginais = dados;
+    renderizarDashboard(dados);
+    atualizarContadores(dados);
+    atualizarUltimaAtualizacao();
+    
+    // Reaplicar filtro se existir
+    const campoPesquisa = document.getElementById('campoPesquisa');
+    if (campoPesquisa?.value.trim()) {
+        filtrarPecas(campoPesquisa.value.trim());
+    }
+}
+
+// Atualizações em tempo real: o servidor envia só as linhas que mudaram desde a nossa versão
+function conectarEventos() {
+    if (eventosDashboard || !window.EventSource || !versaoDashboard) {
+        return;
+    }
+    eventosDashboard = new EventSource(`/api/dashboard-producao/eventos?versao=${encodeURIComponent(versaoDashboard)}`);
+    
+    eventosDashboard.addEventListener('mudancas', event => {
+        const diferenca = JSON.parse(event.data);
+        if (diferenca.base !== versaoDashboard) {
+            // Perdemos alguma versão no caminho: buscar tudo de novo
+            recarregarDados();
+            return;
+        }
+        aplicarMudancas(diferenca);
+        versaoDashboard = diferenca.versao;
+    });
+    
+    eventosDashboard.addEventListener('recarregar', () => recarregarDados());
+}
+
+function recarregarDados() {
+    eventosDashboard?.close();
+    eventosDashboard = null;
+    etagDashboard = null;
+    carregarDados();
+}
+
+function aplicarMudancas(diferenca) {
+    const removidos = new Set(diferenca.removidos);
+    const alterados = new Map(diferenca.alterados.map(linha => [linha._chave, linha]));
+    
+    // Novas linhas no topo (as consultas ordenam da mais recente para a mais antiga)
+    const dados = diferenca.adicionados.concat(
+        dadosOriginais
+            .filter(linha => !removidos.has(linha._chave))
+            .map(linha => alterados.get(linha._chave) || linha)
+    );
+    aplicarDados(dados);
+}
+
 function renderizarDashboard(dados) {
     const pecasAviso1 = document.getElementById('pecasAviso1');
     const pecasAviso2 = document.getElementById('pecasAviso2');
@@ -184,39 +184,11 @@ async function gerarExcel() {
             return;
         }
         
-        const dados = [];
-        rows.forEach(row => {
-            if (row.style.display !== 'none') {
-                const cells = row.cells;
-                dados.push({
-                    op: cells[1].textContent.trim(),
-                    peca: cells[2].textContent.trim(),
-                    projeto: cells[3].textContent.trim(),
-                    veiculo: cells[4].textContent.trim(),
-                    local: cells[5].textContent.trim(),
-                    sensor: cells[6].textContent.trim()
-                });
-            }
-        });
-        
-        if (dados.length === 0) {
-            showPopup('Nenhum dado filtrado para exportar', true);
-            return;
-        }
-        
-        const form = document.createElement('form');
-        form.method = 'POST';
-        form.action = '/api/gerar-excel-estoque';
-        
-        const input = document.createElement('input');
-        input.type = 'hidden';
-        input.name = 'dados';
-        input.value = JSON.stringify(dados);
-        
-        form.appendChild(input);
-        document.body.appendChild(form);
-        form.submit();
-        document.body.removeChild(form);
+        // O servidor consulta o estoque com o mesmo filtro da pesquisa
+        const params = new URLSearchParams();
+        const busca = document.getElementById('campoPesquisaEstoque').value.trim();
+        if (busca) params.append('busca', busca);
+        window.location.href = `/api/gerar-excel-estoque?${params}`;
         
     } catch (error) {
         showPopup('Erro ao gerar Excel: ' + error.message, true);
@@ -322,6 +294,7 @@ function fecharModalEntradaManual() {
 }
 
 async function buscarVeiculo() {
+    const op = document.getElementById('entradaOP').value.trim();
     const projeto = document.getElementById('entradaProjeto').value.trim();
     const peca = document.getElementById('entradaPeca').value.trim();
     
@@ -332,7 +305,7 @@ async function buscarVeiculo() {
     }
     
     try {
-        const response = await fetch(`/api/buscar-veiculo-local?projeto=${encodeURIComponent(projeto)}&peca=${encodeURIComponent(peca)}`);
+        const response = await fetch(`/api/buscar-veiculo-local?projeto=${encodeURIComponent(projeto)}&peca=${encodeURIComponent(peca)}&op=${encodeURIComponent(op)}`);
         const result = await response.json();
         
         if (result.success) {
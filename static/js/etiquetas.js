@@ -177,14 +177,19 @@ function gerarEtiquetas() {
         },
         body: JSON.stringify({ dados: dadosImportados })
     })
-    .then(response => {
+    .then(async response => {
+        // Lote grande: gerado em segundo plano, acompanhar o job até o PDF ficar pronto
+        if (response.status === 202) {
+            const result = await response.json();
+            await acompanharJobEtiquetas(result.job_id);
+            return;
+        }
         hideLoadingPopup();
-        if (response.ok) {
-            return response.blob();
+        if (!response.ok) {
+            const erro = await response.json().catch(() => ({}));
+            throw new Error(erro.message || 'Erro ao gerar PDF');
         }
-        throw new Error('Erro ao gerar PDF');
-    })
-    .then(blob => {
+        const blob = await response.blob();
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
@@ -198,6 +203,40 @@ function gerarEtiquetas() {
     .catch(error => {
         hideLoadingPopup();
         console.error('Erro ao gerar etiquetas:', error);
-        showPopup('Erro ao gerar etiquetas. Tente novamente.', true);
+        showPopup(`Erro ao gerar etiquetas: ${error.message}`, true);
     });
+}
+
+function atualizarLoadingPopup(message) {
+    const texto = document.querySelector('#loadingPopup p');
+    if (texto) {
+        texto.textContent = message;
+    }
+}
+
+async function acompanharJobEtiquetas(jobId) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        
+        const response = await fetch(`/api/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+        const { job } = await response.json();
+        
+        if (job.status === 'PENDENTE') {
+            atualizarLoadingPopup('Aguardando na fila de geração de etiquetas...');
+        } else if (job.status === 'EXECUTANDO') {
+            atualizarLoadingPopup(job.total ? `Gerando etiquetas PDF... ${job.progresso}/${job.total}` : 'Gerando etiquetas PDF...');
+        } else if (job.status === 'CONCLUIDO') {
+            hideLoadingPopup();
+            if (job.download) {
+                window.location.href = `/api/jobs/${jobId}/download`;
+            }
+            showPopup(job.message || 'Etiquetas geradas com sucesso!');
+            return;
+        } else {
+            throw new Error(job.message || job.status);
+        }
+    }
 }
\ No newline at end of file
@@ -384,21 +384,46 @@ async function gerarXML() {
         
         const result = await response.json();
         
-        if (result.success) {
-            updateLoading(result.message, false, true);
+        if (result.success && result.job_id) {
+            await acompanharJobXML(result.job_id);
+        } else {
+            updateLoading(result.message, true, true);
+        }
+    } catch (error) {
+        console.error('Erro detalhado:', error);
+        updateLoading('Erro ao gerar XMLs: ' + error.message, true, true);
+    }
+}
+
+// A geração roda em segundo plano no servidor: consultar o job até terminar
+async function acompanharJobXML(jobId) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        
+        const response = await fetch(`/api/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+        const { job } = await response.json();
+        
+        if (job.status === 'PENDENTE') {
+            updateLoading('Aguardando na fila de geração de XMLs...');
+        } else if (job.status === 'EXECUTANDO') {
+            updateLoading(job.total ? `Gerando XMLs... ${job.progresso}/${job.total}` : 'Gerando XMLs...');
+        } else if (job.status === 'CONCLUIDO') {
+            updateLoading(job.message, !job.sucesso_resultado, true);
             
             // Se tem download, iniciar download
-            if (result.download && result.filename) {
+            if (job.download) {
                 setTimeout(() => {
-                    window.location.href = `/download-xml/${result.filename}`;
+                    window.location.href = `/api/jobs/${jobId}/download`;
                 }, 1000);
             }
+            return;
         } else {
-            updateLoading(result.message, true, true);
+            updateLoading('Erro ao gerar XMLs: ' + (job.message || job.status), true, true);
+            return;
         }
-    } catch (error) {
-        console.error('Erro detalhado:', error);
-        updateLoading('Erro ao gerar XMLs: ' + error.message, true, true);
     }
 }
 
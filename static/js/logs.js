@@ -129,34 +129,9 @@ function sortTable(columnIndex) {
 }
 
 async function gerarExcel() {
-    try {
-        const busca = document.getElementById('campoBusca').value;
-        const params = new URLSearchParams({ page: 1, limit: 10000 });
-        if (busca) params.append('busca', busca);
-        
-        const response = await fetch(`/api/logs?${params}`);
-        const data = await response.json();
-        
-        if (data.error) {
-            alert('Erro ao buscar dados: ' + data.error);
-            return;
-        }
-        
-        const form = document.createElement('form');
-        form.method = 'POST';
-        form.action = '/api/gerar-excel-logs';
-        
-        const input = document.createElement('input');
-        input.type = 'hidden';
-        input.name = 'dados';
-        input.value = JSON.stringify(data.dados);
-        
-        form.appendChild(input);
-        document.body.appendChild(form);
-        form.submit();
-        document.body.removeChild(form);
-        
-    } catch (error) {
-        alert('Erro ao gerar Excel: ' + error.message);
-    }
+    // O servidor consulta os logs com a mesma busca da tela
+    const busca = document.getElementById('campoBusca').value;
+    const params = new URLSearchParams();
+    if (busca) params.append('busca', busca);
+    window.location.href = `/api/gerar-excel-logs?${params}`;
 }
\ No newline at end of file
@@ -1,29 +1,55 @@
+// Paginação, busca e ordenação no servidor (/api/saidas com limite/cursor)
 let paginaAtual = 1;
 let totalPaginas = 1;
 const itensPorPagina = 50;
-let dadosCompletos = [];
-let dadosFiltrados = [];
+let dadosPagina = [];
+let cursoresPaginas = [null];  // cursor de início de cada página já visitada
+let ordenacao = { ordenar: 'data', direcao: 'desc' };
+let timeoutBusca;
 
 document.addEventListener('DOMContentLoaded', function() {
     carregarSaidas();
 });
 
-async function carregarSaidas() {
+async function carregarSaidas(pagina = 1) {
     try {
-        const response = await fetch('/api/saidas');
-        const dados = await response.json();
+        if (pagina === 1) {
+            cursoresPaginas = [null];
+        }
+        
+        const params = new URLSearchParams({
+            limite: itensPorPagina,
+            ordenar: ordenacao.ordenar,
+            direcao: ordenacao.direcao
+        });
+        const cursor = cursoresPaginas[pagina - 1];
+        if (cursor) params.append('cursor', cursor);
+        if (pagina === 1) params.append('total', '1');
+        
+        const busca = document.getElementById('campoPesquisaSaidas').value.trim();
+        if (busca) params.append('busca', busca);
         
-        dadosCompletos = dados;
-        dadosFiltrados = dados;
+        const response = await fetch(`/api/saidas?${params}`);
+        const resposta = await response.json();
+        
+        if (resposta.error) {
+            throw new Error(resposta.error);
+        }
+        
+        paginaAtual = pagina;
+        dadosPagina = resposta.dados || [];
+        cursoresPaginas[pagina] = resposta.paginacao.proximo_cursor;
+        if (resposta.paginacao.total !== undefined) {
+            totalPaginas = Math.max(1, Math.ceil(resposta.paginacao.total / itensPorPagina));
+        }
         
-        if (!dados || dados.length === 0) {
+        if (dadosPagina.length === 0) {
             const tbody = document.getElementById('saidas-tbody');
             tbody.innerHTML = '<tr><td colspan="8" class="border border-gray-200 px-4 py-6 text-center text-gray-500">Nenhuma saída registrada</td></tr>';
             document.getElementById('paginacao').style.display = 'none';
             return;
         }
         
-        totalPaginas = Math.ceil(dadosFiltrados.length / itensPorPagina);
         renderizarPagina();
         atualizarPaginacao();
         
@@ -39,10 +65,6 @@ function renderizarPagina() {
     const tbody = document.getElementById('saidas-tbody');
     tbody.innerHTML = '';
     
-    const inicio = (paginaAtual - 1) * itensPorPagina;
-    const fim = inicio + itensPorPagina;
-    const dadosPagina = dadosFiltrados.slice(inicio, fim);
-    
     dadosPagina.forEach(item => {
         const row = tbody.insertRow();
         row.className = 'hover:bg-gray-50';
@@ -83,17 +105,15 @@ function atualizarPaginacao() {
     
     paginacao.style.display = 'flex';
     btnAnterior.disabled = paginaAtual === 1;
-    btnProximo.disabled = paginaAtual === totalPaginas;
+    btnProximo.disabled = !cursoresPaginas[paginaAtual];
     infoPagina.textContent = `Página ${paginaAtual} de ${totalPaginas}`;
 }
 
 function mudarPagina(direcao) {
     const novaPagina = paginaAtual + direcao;
-    if (novaPagina >= 1 && novaPagina <= totalPaginas) {
-        paginaAtual = novaPagina;
-        renderizarPagina();
-        atualizarPaginacao();
-    }
+    if (novaPagina < 1) return;
+    if (direcao > 0 && !cursoresPaginas[paginaAtual]) return;
+    carregarSaidas(novaPagina);
 }
 
 async function voltarEstoque(id) {
@@ -120,37 +140,8 @@ async function voltarEstoque(id) {
 }
 
 const filtrarTabelaSaidas = () => {
-    const filtro = document.getElementById('campoPesquisaSaidas').value.toLowerCase();
-    
-    if (!filtro) {
-        dadosFiltrados = dadosCompletos;
-    } else {
-        dadosFiltrados = dadosCompletos.filter(item => {
-            const op = (item.op || '').toLowerCase();
-            const peca = (item.peca || '').toLowerCase();
-            const projeto = (item.projeto || '').toLowerCase();
-            const veiculo = (item.veiculo || '').toLowerCase();
-            const local = (item.local || '').toLowerCase();
-            const usuario = (item.usuario || '').toLowerCase();
-            const data = (item.data || '').toLowerCase();
-            
-            const pecaOpCamada = `${peca}${op}pc`;
-            
-            return op.includes(filtro) ||
-                   peca.includes(filtro) ||
-                   projeto.includes(filtro) ||
-                   veiculo.includes(filtro) ||
-                   local.includes(filtro) ||
-                   usuario.includes(filtro) ||
-                   data.includes(filtro) ||
-                   pecaOpCamada.includes(filtro);
-        });
-    }
-    
-    paginaAtual = 1;
-    totalPaginas = Math.ceil(dadosFiltrados.length / itensPorPagina);
-    renderizarPagina();
-    atualizarPaginacao();
+    clearTimeout(timeoutBusca);
+    timeoutBusca = setTimeout(() => carregarSaidas(1), 300);
 };
 
 function showPopup(message, isError = false) {
@@ -200,34 +191,14 @@ async function gerarExcel() {
             return;
         }
         
-        const dados = dadosFiltrados.map(item => ({
-            op: item.op || '',
-            peca: item.peca || '',
-            projeto: item.projeto || '',
-            veiculo: item.veiculo || '',
-            local: item.local || '',
-            usuario: item.usuario || '',
-            data: item.data ? item.data.split(' ')[0] : ''
-        }));
-        
-        if (dados.length === 0) {
-            showPopup('Nenhum dado filtrado para exportar', true);
-            return;
-        }
-        
-        const form = document.createElement('form');
-        form.method = 'POST';
-        form.action = '/api/gerar-excel-saidas';
-        
-        const input = document.createElement('input');
-        input.type = 'hidden';
-        input.name = 'dados';
-        input.value = JSON.stringify(dados);
-        
-        form.appendChild(input);
-        document.body.appendChild(form);
-        form.submit();
-        document.body.removeChild(form);
+        // O servidor exporta todas as saídas com a busca e a ordenação da tela
+        const params = new URLSearchParams({
+            ordenar: ordenacao.ordenar,
+            direcao: ordenacao.direcao
+        });
+        const busca = document.getElementById('campoPesquisaSaidas').value.trim();
+        if (busca) params.append('busca', busca);
+        window.location.href = `/api/gerar-excel-saidas?${params}`;
         
     } catch (error) {
         showPopup('Erro ao gerar Excel: ' + error.message, true);
@@ -241,7 +212,7 @@ const sortTable = (columnIndex) => {
     if (!column) return;
     
     const isAsc = !window.sortDirection || !window.sortDirection[columnIndex];
-    window.sortDirection = window.sortDirection || {};
+    window.sortDirection = {};
     window.sortDirection[columnIndex] = isAsc;
     
     document.querySelectorAll('th.sortable').forEach(th => {
@@ -251,21 +222,8 @@ const sortTable = (columnIndex) => {
     const currentHeader = document.querySelectorAll('th.sortable')[columnIndex];
     currentHeader.classList.add(isAsc ? 'sort-asc' : 'sort-desc');
     
-    dadosFiltrados.sort((a, b) => {
-        const aValue = (a[column] || '').toString();
-        const bValue = (b[column] || '').toString();
-        
-        const aNum = parseFloat(aValue);
-        const bNum = parseFloat(bValue);
-        
-        if (!isNaN(aNum) && !isNaN(bNum)) {
-            return isAsc ? aNum - bNum : bNum - aNum;
-        }
-        
-        return isAsc ? aValue.localeCompare(bValue) : bValue.localeCompare(aValue);
-    });
-    
-    renderizarPagina();
+    ordenacao = { ordenar: column, direcao: isAsc ? 'asc' : 'desc' };
+    carregarSaidas(1);
 };
 
 // Funções para modal de baixa
@@ -0,0 +1,113 @@
+"""Núcleo puro do planejamento de ordens XML (plano_xml.py), sem banco."""
+import plano_xml
+from arquivos_corte import IndiceArquivos
+
+
+def _camadas(especiais='-', **quantidades):
+    linha = {'projeto': '1001', 'peca': 'TS', 'pecas_especiais': especiais}
+    linha.update({coluna: quantidades.get(coluna) for coluna in plano_xml.COLUNAS_CAMADAS})
+    return linha
+
+
+def _indice(*nomes, peca='PBS', sensor='1'):
+    return IndiceArquivos(1, [
+        {'id': i, 'projeto': '1001', 'peca': peca, 'sensor': sensor, 'nome_peca': nome,
+         'espessura': '1.5', 'camada': None, 'tamanho_peca': None}
+        for i, nome in enumerate(nomes, 1)
+    ])
+
+
+def _peca(peca='PBS', op='300001', sensor='1'):
+    return {'op': op, 'projeto': '1001', 'peca': peca, 'sensor': sensor, 'local': 'SLOT 3', 'veiculo': 'COROLLA'}
+
+
+def test_pecas_especiais_substituem_a_peca():
+    assert plano_xml.pecas_especiais('TS', _camadas(especiais='TSA - TSB')) == ['TSA', 'TSB']
+    assert plano_xml.pecas_especiais('TS', _camadas(especiais=' TSA -  - TSB ')) == ['TSA', 'TSB']
+
+
+def test_sem_pecas_especiais_fica_a_peca():
+    assert plano_xml.pecas_especiais('TS', _camadas(especiais='-')) == ['TS']
+    assert plano_xml.pecas_especiais('TS', _camadas(especiais='  ')) == ['TS']
+    assert plano_xml.pecas_especiais('TS', _camadas(especiais=None)) == ['TS']
+    assert plano_xml.pecas_especiais('TS', None) == ['TS']
+
+
+def test_quantidades_camadas_na_ordem_das_colunas():
+    camadas = _camadas(l3='2', l3_b='1.0', l4='-', l5='', l6='0', l7='-3', l8='x')
+    assert plano_xml.quantidades_camadas(camadas) == [('L3', 2), ('L3_B', 1), ('L8', 1)]
+    assert plano_xml.quantidades_camadas(_camadas(l4='NULL', l5='None')) == []
+    assert plano_xml.quantidades_camadas(None) == []
+
+
+def test_selecionar_arquivo_por_camada():
+    arquivos = [{'nome_peca': 'PC_B'}, {'nome_peca': 'PC_A'}, {'nome_peca': 'PC_X'}]
+    assert plano_xml.selecionar_arquivo(arquivos, 'L3', 0)['nome_peca'] == 'PC_A'
+    assert plano_xml.selecionar_arquivo(arquivos, 'L3_B', 1)['nome_peca'] == 'PC_B'
+    assert plano_xml.selecionar_arquivo(arquivos, 'L4', 2)['nome_peca'] == 'PC_X'
+    # Posição além dos arquivos: o primeiro
+    assert plano_xml.selecionar_arquivo(arquivos, 'L5', 7)['nome_peca'] == 'PC_B'
+    # L3_B sem _B: o segundo arquivo; com um arquivo só, ele mesmo
+    sem_b = [{'nome_peca': 'PC_1'}, {'nome_peca': 'PC_2'}]
+    assert plano_xml.selecionar_arquivo(sem_b, 'L3_B', 0)['nome_peca'] == 'PC_2'
+    assert plano_xml.selecionar_arquivo(sem_b[:1], 'L3_B', 0)['nome_peca'] == 'PC_1'
+
+
+def test_planejar_peca_especial_recebe_letras_por_peca():
+    indice = IndiceArquivos(1, [
+        {'id': 1, 'projeto': '1001', 'peca': 'TSA', 'sensor': '1', 'nome_peca': 'PC_TSA',
+         'espessura': '1.5', 'camada': None, 'tamanho_peca': None},
+        {'id': 2, 'projeto': '1001', 'peca': 'TSB', 'sensor': '1', 'nome_peca': 'PC_TSB',
+         'espessura': '1.5', 'camada': None, 'tamanho_peca': None},
+    ])
+    camadas = {('1001', 'TS'): _camadas(especiais='TSA - TSB', l3='1', l4='2')}
+    plano = plano_xml.planejar([_peca('TS')], camadas, indice)
+    assert [(o.peca, o.camada, o.op_diferenciada, o.quantidade, o.nome_peca) for o in plano.ordens] == [
+        ('TSA', 'L3', '300001-A', 1, 'PC_TSA'),
+        ('TSA', 'L4', '300001-B', 2, 'PC_TSA'),
+        ('TSB', 'L3', '300001-K', 1, 'PC_TSB'),
+        ('TSB', 'L4', '300001-L', 2, 'PC_TSB'),
+    ]
+    assert plano.faltando == []
+
+
+def test_planejar_um_xml_por_camada():
+    camadas = {('1001', 'PBS'): _camadas(l3='1', l4='3')}
+    plano = plano_xml.planejar([_peca()], camadas, _indice('PC_PBS_A', 'PC_PBS_C'))
+    assert [(o.camada, o.quantidade, o.op_diferenciada, o.nome_arquivo()) for o in plano.ordens] == [
+        ('L3', 1, '300001-A', '300001_1001_PBS_L3.xml'),
+        ('L4', 3, '300001-B', '300001_1001_PBS_L4.xml'),
+    ]
+
+
+def test_planejar_um_xml_por_unidade():
+    camadas = {('1001', 'PBS'): _camadas(l3='1', l4='3')}
+    plano = plano_xml.planejar([_peca()], camadas, _indice('PC_PBS_A', 'PC_PBS_C'), um_xml_por_unidade=True)
+    assert [(o.camada, o.quantidade, o.op_diferenciada, o.nome_arquivo()) for o in plano.ordens] == [
+        ('L3', 1, '300001-A', '300001_1001_PBS_L3.xml'),
+        ('L4', 1, '300001-B', '300001_1001_PBS_L4_01.xml'),
+        ('L4', 1, '300001-C', '300001_1001_PBS_L4_02.xml'),
+        ('L4', 1, '300001-D', '300001_1001_PBS_L4_03.xml'),
+    ]
+
+
+def test_planejar_sem_camadas_gera_generico_ou_falta():
+    camadas = {('1001', 'PBS'): _camadas(l3='-', l3_b='0')}
+    plano = plano_xml.planejar([_peca()], camadas, _indice('PC_PBS'))
+    assert [(o.camada, o.quantidade) for o in plano.ordens] == [('GENERICO', 1)]
+
+    plano = plano_xml.planejar([_peca()], camadas, _indice())
+    assert plano.ordens == []
+    assert plano.faltando == ['1001 PBS - Sem camadas válidas (l3: -, l3_b: 0)']
+
+    plano = plano_xml.planejar([_peca()], {}, _indice())
+    assert plano.faltando == ['1001 PBS - Não encontrado na tabela pc_camadas nem arquivos_pc']
+
+
+def test_planejar_sensor_vazio_usa_o_padrao():
+    camadas = {('1001', 'PBS'): _camadas(l4='1')}
+    plano = plano_xml.planejar([_peca(sensor='-')], camadas, _indice('PC_PBS_S1', sensor='1'))
+    assert [o.nome_peca for o in plano.ordens] == ['PC_PBS_S1']
+
+    plano = plano_xml.planejar([_peca(sensor='2')], camadas, _indice('PC_PBS_S1', sensor='1'))
+    assert plano.faltando == ['1001 PBS - Nenhum arquivo encontrado na tabela arquivos_pc']
@@ -0,0 +1,113 @@
+"""XML de ordem da CNC (xml_cnc.py) contra arquivos de referência.
+
+Os arquivos em tests/golden/xml_cnc foram gerados pelo caminho antigo
+(ElementTree + minidom, ``xml_cnc._xml_ordem_minidom``); o modelo tem que
+produzir exatamente os mesmos bytes. Para gerar de novo:
+    python tests/test_xml_cnc.py
+"""
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import plano_xml  # noqa: E402
+import xml_cnc  # noqa: E402
+from arquivos_corte import IndiceArquivos  # noqa: E402
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden', 'xml_cnc')
+DATA_ENTREGA = '17/10/2026'
+
+# nome -> argumentos de xml_ordem
+ORDENS = {
+    'simples': ('PC_001_FRONTAL_S1', 'COROLLA', 'SLOT 12 | 1001 | 001 | FRONTAL', '1.5',
+                '123456-A', '2', '17/10/2026', 'PC_001_FRONTAL_S1'),
+    'caracteres_especiais': ('PC&<>"\'', 'Ação & Cia', 'a | b | c | d', 1.0, 'X-B', 1,
+                             '01/01/2026', 'Ç é ã ü €'),
+    'marcacao_no_texto': ('&amp;', '&#10;', '<![CDATA[x]]>', '-', '--', '"', '\'', 'a]]>b'),
+    'campos_vazios': ('', None, '', '', '', '', '', ''),
+    'espacos_e_quebras': ('  ', '\t', 'linha1\r\nlinha2\rlinha3\nlinha4', '0', '<op>', '10',
+                          '31/12/2026', '0.0'),
+}
+
+
+def _arquivo(projeto, peca, sufixo, id):
+    return {'id': id, 'projeto': projeto, 'peca': peca, 'sensor': '1',
+            'nome_peca': f'PC_{projeto}_{peca}{sufixo}', 'espessura': '1.5',
+            'camada': None, 'tamanho_peca': None}
+
+
+def _camadas(projeto, peca, especiais='-', **quantidades):
+    linha = {'projeto': projeto, 'peca': peca, 'pecas_especiais': especiais}
+    linha.update({coluna: quantidades.get(coluna) for coluna in plano_xml.COLUNAS_CAMADAS})
+    return linha
+
+
+def plano_lote():
+    """Lote com várias peças: camadas L3/L3_B/L4, peça especial e peça sem camadas (GENERICO)"""
+    arquivos = [
+        _arquivo('1001', 'PBS', '_A', 1), _arquivo('1001', 'PBS', '_B', 2), _arquivo('1001', 'PBS', '_C', 3),
+        _arquivo('1001', 'TSA', '', 4), _arquivo('1001', 'TSB', '', 5),
+        _arquivo('2002', 'VGD', '', 6),
+    ]
+    camadas = {
+        ('1001', 'PBS'): _camadas('1001', 'PBS', l3='1', l3_b='1', l4='2'),
+        ('1001', 'TS'): _camadas('1001', 'TS', especiais='TSA - TSB', l4='1'),
+        ('2002', 'VGD'): _camadas('2002', 'VGD', l3='-', l3_b='', l4='0'),
+    }
+    pecas = [
+        {'op': '300001', 'projeto': '1001', 'peca': 'PBS', 'sensor': '1', 'local': 'SLOT 3', 'veiculo': 'COROLLA'},
+        {'op': '300002', 'projeto': '1001', 'peca': 'TS', 'sensor': '', 'local': 'SLOT 40', 'veiculo': 'HILUX'},
+        {'op': '300003', 'projeto': '2002', 'peca': 'VGD', 'sensor': '-', 'local': 'SLOT <7>',
+         'veiculo': 'Ação "especial"'},
+    ]
+    return plano_xml.planejar(pecas, camadas, IndiceArquivos(1, arquivos))
+
+
+def _ler(*caminho):
+    with open(os.path.join(GOLDEN, *caminho), 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('nome', sorted(ORDENS))
+def test_ordem_igual_ao_golden(nome):
+    assert xml_cnc.xml_ordem(*ORDENS[nome]) == _ler(f'{nome}.xml')
+
+
+@pytest.mark.parametrize('nome', sorted(ORDENS))
+def test_golden_e_a_saida_do_minidom(nome):
+    assert xml_cnc._xml_ordem_minidom(*ORDENS[nome]) == _ler(f'{nome}.xml')
+
+
+def test_lote_com_varias_pecas_igual_ao_golden():
+    plano = plano_lote()
+    assert plano.faltando == []
+    nomes = [ordem.nome_arquivo() for ordem in plano.ordens]
+    assert sorted(nomes) == sorted(os.listdir(os.path.join(GOLDEN, 'lote')))
+    for ordem, nome in zip(plano.ordens, nomes):
+        assert ordem.xml(DATA_ENTREGA) == _ler('lote', nome), nome
+
+
+@pytest.mark.parametrize('invalido', ['\x00', 'a\x1fb', '\ufffe', '\ud800'])
+def test_caractere_invalido_para_xml(invalido):
+    with pytest.raises(ValueError):
+        xml_cnc.xml_ordem(invalido, '', '', '', '', '', '', '')
+
+
+def gerar():
+    """Grava os arquivos de referência com o caminho antigo (minidom)"""
+    os.makedirs(os.path.join(GOLDEN, 'lote'), exist_ok=True)
+    for nome, argumentos in ORDENS.items():
+        with open(os.path.join(GOLDEN, f'{nome}.xml'), 'wb') as f:
+            f.write(xml_cnc._xml_ordem_minidom(*argumentos))
+    with mock.patch.object(xml_cnc, 'xml_ordem', xml_cnc._xml_ordem_minidom):
+        for ordem in plano_lote().ordens:
+            with open(os.path.join(GOLDEN, 'lote', ordem.nome_arquivo()), 'wb') as f:
+                f.write(ordem.xml(DATA_ENTREGA))
+    print(f"Arquivos de referência gravados em {GOLDEN}")
+
+
+if __name__ == '__main__':
+    gerar()
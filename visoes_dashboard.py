@@ -0,0 +1,231 @@
+"""Visões materializadas do dashboard de produção (migracoes/0009_visoes_dashboard.sql).
+
+``mv_dashboard_estoque`` e ``mv_dashboard_pos_montagem`` guardam o resultado das
+consultas de estoque e pós-montagem (agrupamento por OP/peça, sensor de reserva
+e última etapa apontada no PPLUG). O dashboard chama ``atualizar`` antes de ler:
+o REFRESH ... CONCURRENTLY recalcula só o que mudou e não bloqueia quem está
+lendo a visão no momento.
+
+Uso:
+    python visoes_dashboard.py --medir DSN   compara com as consultas diretas em dados
+                                             sintéticos (DSN de um banco vazio, ex. um
+                                             Postgres local; cria as tabelas e as migrações)
+"""
+import sys
+import time
+
+VISOES = ('public.mv_dashboard_estoque', 'public.mv_dashboard_pos_montagem')
+
+CONSULTA_ESTOQUE = """
+SELECT op, peca, projeto, veiculo, locais, quantidade, etapa, prioridade, sensor
+FROM public.mv_dashboard_estoque
+ORDER BY ultimo_id DESC
+"""
+
+CONSULTA_POS_MONTAGEM = """
+SELECT op, peca, projeto, veiculo, locais, quantidade, etapa, prioridade
+FROM public.mv_dashboard_pos_montagem
+ORDER BY ultimo_id DESC
+"""
+
+
+def atualizar(conn):
+    """REFRESH CONCURRENTLY das visões, numa transação. Retorna a duração em segundos."""
+    inicio = time.monotonic()
+    cursor = conn.cursor()
+    try:
+        for visao in VISOES:
+            cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {visao}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return time.monotonic() - inicio
+
+
+# Consultas diretas que as visões substituíram (referência do _medir)
+_ESTOQUE_DIRETO = """
+SELECT
+    i.op,
+    i.peca,
+    i.projeto,
+    COALESCE(d.modelo, i.veiculo) as veiculo,
+    STRING_AGG(DISTINCT i.local, ', ' ORDER BY i.local) as locais,
+    COUNT(*) as quantidade,
+    COALESCE(UPPER(d.etapa), 'PEÇA NÃO ESTÁ NO PPLUG OU FOI APROVADA IF') as etapa,
+    COALESCE(UPPER(d.prioridade), 'NORMAL') as prioridade,
+    COALESCE(
+        NULLIF(STRING_AGG(DISTINCT NULLIF(i.sensor, ''), ', ' ORDER BY NULLIF(i.sensor, '')), ''),
+        (
+            SELECT COALESCE(
+                NULLIF(d2.sensor, ''),
+                (
+                    SELECT NULLIF(p.sensor, '')
+                    FROM public.plano_controle_corte_vidro2 p
+                    WHERE p.op = i.op AND p.peca = 'PBS'
+                    AND p.sensor IS NOT NULL AND p.sensor != ''
+                    LIMIT 1
+                )
+            )
+            FROM dados_uso_geral.dados_op d2
+            WHERE d2.op::text = i.op::text AND d2.planta = 'Jarinu'
+            LIMIT 1
+        ),
+        ''
+    ) as sensor
+FROM pc_inventory i
+LEFT JOIN dados_uso_geral.dados_op d ON i.op::text = d.op::text AND i.peca = d.item AND d.planta = 'Jarinu'
+GROUP BY i.op, i.peca, i.projeto, COALESCE(d.modelo, i.veiculo), d.etapa, d.prioridade
+ORDER BY MAX(i.id) DESC
+"""
+
+_POS_MONTAGEM_DIRETO = """
+SELECT
+    i.op,
+    i.peca,
+    i.projeto,
+    COALESCE(d.modelo, i.veiculo) as veiculo,
+    STRING_AGG(DISTINCT i.local, ', ' ORDER BY i.local) as locais,
+    COUNT(*) as quantidade,
+    CASE
+        WHEN (
+            SELECT a.etapa
+            FROM apontamento_pplug_jarinu a
+            WHERE a.op::text = i.op AND a.item = i.peca
+            ORDER BY a.data DESC
+            LIMIT 1
+        ) = 'INSPECAO FINAL' THEN 'PEÇA APROVADA INSP FINAL'
+        ELSE UPPER(d.etapa)
+    END as etapa,
+    COALESCE(UPPER(d.prioridade), 'NORMAL') as prioridade
+FROM pc_inventory i
+INNER JOIN dados_uso_geral.dados_op d ON i.op::text = d.op::text AND i.peca = d.item AND d.planta = 'Jarinu'
+WHERE UPPER(d.etapa) IN ('MONTAGEM', 'INSPECAO FINAL', 'BUFFER-AUTOCLAVE', 'AUTOCLAVE', 'EMBOLSADO')
+GROUP BY i.op, i.peca, i.projeto, COALESCE(d.modelo, i.veiculo), d.etapa, d.prioridade
+ORDER BY MAX(i.id) DESC
+"""
+
+# Tabelas de outros sistemas que as visões leem (só as colunas usadas)
+_TABELAS_EXTERNAS = """
+CREATE SCHEMA IF NOT EXISTS dados_uso_geral;
+CREATE TABLE dados_uso_geral.dados_op (
+    op BIGINT, item TEXT, planta TEXT, etapa TEXT, prioridade TEXT,
+    modelo TEXT, sensor TEXT, codigo_veiculo TEXT
+);
+CREATE INDEX ON dados_uso_geral.dados_op (op, item);
+CREATE TABLE public.ficha_tecnica_veiculos (codigo_veiculo TEXT, marca TEXT, modelo TEXT);
+CREATE TABLE public.plano_controle_corte_vidro2 (id SERIAL PRIMARY KEY, op TEXT, peca TEXT, sensor TEXT);
+CREATE TABLE public.apontamento_pplug_jarinu (id BIGINT, op BIGINT, item TEXT, etapa TEXT, data TIMESTAMP);
+CREATE TABLE public.arquivos_pc (id SERIAL PRIMARY KEY, projeto TEXT, peca TEXT, sensor TEXT);
+CREATE TABLE public.users_pc (id SERIAL PRIMARY KEY, username TEXT);
+"""
+
+_DADOS_SINTETICOS = """
+INSERT INTO dados_uso_geral.dados_op (op, item, planta, etapa, prioridade, modelo, sensor, codigo_veiculo)
+SELECT 300000 + o, pecas[1 + (o * 7 + p) %% 6],
+       CASE WHEN (o + p) %% 10 = 0 THEN 'Outra' ELSE 'Jarinu' END,
+       etapas[1 + (o * 13 + p * 5) %% 14],
+       CASE WHEN o %% 17 = 0 THEN 'urgente' END,
+       'MODELO ' || (o %% 40),
+       CASE WHEN p = 1 THEN 'PBS_' || (1 + o %% 3) WHEN (o + p) %% 3 = 0 THEN '' END,
+       (1000 + o %% 40)::text
+FROM generate_series(1, %(ops)s) o, generate_series(1, 6) p,
+     (SELECT ARRAY['PBS', 'PBD', 'PBE', 'VGD', 'VGE', 'TSA'] AS pecas,
+             ARRAY['CORTE', 'LAPIDACAO', 'SERIGRAFIA', 'FORNO-S', 'CORTE-CURVO', 'PRE-MONTAGEM',
+                   'MONTAGEM', 'INSPECAO FINAL', 'BUFFER-AUTOCLAVE', 'AUTOCLAVE', 'EMBOLSADO',
+                   'EXPEDICAO', 'montagem', 'BUFFER'] AS etapas) listas;
+
+INSERT INTO public.pc_inventory (op, peca, projeto, veiculo, local, sensor)
+SELECT (300000 + 1 + (n * 7919) %% (%(ops)s * 2))::text,
+       (ARRAY['PBS', 'PBD', 'PBE', 'VGD', 'VGE', 'TSA'])[1 + n %% 6],
+       (1000 + n %% 40)::text, 'VEICULO ' || (n %% 40), 'SLOT ' || (1 + n %% 169),
+       CASE WHEN n %% 4 = 0 THEN (1 + n %% 3)::text END
+FROM generate_series(1, %(estoque)s) n;
+
+INSERT INTO public.plano_controle_corte_vidro2 (op, peca, sensor)
+SELECT (300000 + o)::text, CASE WHEN o %% 5 = 0 THEN 'PBD' ELSE 'PBS' END, (1 + o %% 3)::text
+FROM generate_series(1, %(ops)s * 2) o;
+
+INSERT INTO public.apontamento_pplug_jarinu (op, item, etapa, data)
+SELECT d.op, d.item,
+       CASE WHEN a = 1 AND d.op %% 3 = 0 THEN 'INSPECAO FINAL' ELSE 'MONTAGEM' END,
+       TIMESTAMP '2026-10-01' - (a || ' hours')::interval
+FROM dados_uso_geral.dados_op d, generate_series(1, %(apontamentos)s) a
+WHERE d.planta = 'Jarinu';
+
+ANALYZE;
+"""
+
+
+def _normalizar(linhas):
+    return sorted(tuple('' if valor is None else str(valor) for valor in linha) for linha in linhas)
+
+
+def _cronometrar(funcao, repeticoes=3):
+    """Melhor tempo de ``repeticoes`` execuções e o resultado da última"""
+    melhor, resultado = None, None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor, resultado
+
+
+def _medir(dsn, ops=5000, estoque=8000, apontamentos=4):
+    import psycopg2
+    import migracoes
+
+    conn = psycopg2.connect(dsn)
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('public.pc_schema_version'), to_regclass('public.pc_inventory')")
+    if any(cursor.fetchone()):
+        print("ERRO: use um banco vazio (o _medir cria tabelas e dados sintéticos)")
+        return 1
+    cursor.execute(_TABELAS_EXTERNAS)
+    conn.commit()
+    migracoes.aplicar(conn)
+    cursor = conn.cursor()
+    cursor.execute(_DADOS_SINTETICOS, {'ops': ops, 'estoque': estoque, 'apontamentos': apontamentos})
+    conn.commit()
+    print(f"Dados: {ops * 6} linhas em dados_op, {estoque} no estoque, "
+          f"{ops * 6 * apontamentos} apontamentos (aprox.)")
+    print(f"Primeiro REFRESH CONCURRENTLY das duas visões: {atualizar(conn) * 1000:.1f} ms")
+
+    def consultar(sql):
+        cursor.execute(sql)
+        return cursor.fetchall()
+
+    for nome, direto, visao in (('estoque', _ESTOQUE_DIRETO, CONSULTA_ESTOQUE),
+                                ('pós-montagem', _POS_MONTAGEM_DIRETO, CONSULTA_POS_MONTAGEM)):
+        tempo_direto, linhas_diretas = _cronometrar(lambda: consultar(direto), repeticoes=1)
+        tempo_visao, linhas_visao = _cronometrar(lambda: consultar(visao))
+        diretas, da_visao = _normalizar(linhas_diretas), _normalizar(linhas_visao)
+        if diretas == da_visao:
+            comparacao = 'mesmo resultado'
+        elif sorted(linha[:-1] for linha in diretas) == sorted(linha[:-1] for linha in da_visao):
+            # A consulta direta pega uma linha qualquer de dados_op (LIMIT 1 sem ORDER BY)
+            # para o sensor de reserva; a visão prefere a que tem sensor
+            diferentes = len(set(diretas) - set(da_visao))
+            comparacao = f'mesmo resultado exceto o sensor de reserva em {diferentes} linhas'
+        else:
+            comparacao = 'RESULTADO DIFERENTE'
+        print(f"{nome:13} direta {tempo_direto * 1000:8.1f} ms | visão {tempo_visao * 1000:6.1f} ms "
+              f"({len(linhas_visao)} linhas, {comparacao})")
+    conn.commit()
+
+    tempo_refresh, _ = _cronometrar(lambda: atualizar(conn))
+    print(f"REFRESH CONCURRENTLY das duas visões sem mudanças: {tempo_refresh * 1000:.1f} ms")
+    cursor.execute("UPDATE public.pc_inventory SET local = 'SLOT 1' WHERE id % 100 = 0")
+    conn.commit()
+    print(f"REFRESH CONCURRENTLY após mudar 1% do estoque: {atualizar(conn) * 1000:.1f} ms")
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--medir':
+        sys.exit(_medir(sys.argv[2]))
+    print(__doc__)
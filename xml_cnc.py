@@ -0,0 +1,114 @@
+"""Geração do XML de ordem (RPOrderGenerator) enviado para a CNC.
+
+Antes cada arquivo era montado com ElementTree, serializado, relido com
+minidom e formatado com ``toprettyxml``. O documento tem sempre a mesma
+estrutura, então aqui ele sai de um modelo montado uma vez na importação; só
+os valores são escapados a cada chamada. A saída é byte a byte igual à do
+caminho antigo (declaração, indentação de 2 espaços, namespaces, ``<Tag/>``
+para valor vazio e o mesmo escape de texto do minidom).
+
+Conferência byte a byte com arquivos gerados pelo caminho antigo em
+tests/test_xml_cnc.py. Medição:
+    python xml_cnc.py    vazão do modelo e do ElementTree+minidom
+"""
+import re
+
+DRIVER = 'D006'
+TRANSACTION_ID = '000'
+MATERIAL = 'Acrílico-0'
+
+CAMPOS = (
+    'Driver', 'TransactionId', 'PartCode', 'CustomerCode', 'CustomerDescription',
+    'Material', 'Thickness', 'Order', 'QtyRequired', 'DeliveryDate', 'FilePart',
+)
+
+_CABECALHO = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<RPOrderGenerator xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xmlns:xsd="http://www.w3.org/2001/XMLSchema">\n'
+    '  <QueuedItem>\n'
+)
+_RODAPE = '  </QueuedItem>\n</RPOrderGenerator>\n'
+# (abertura, fechamento, forma vazia) de cada campo, na ordem do documento
+_MODELO = tuple((f'    <{tag}>', f'</{tag}>\n', f'    <{tag}/>\n') for tag in CAMPOS)
+
+# Caracteres que o XML 1.0 não aceita: o caminho antigo falhava no parse do minidom
+_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def escapar(texto):
+    """Escape de texto igual ao do minidom (& < " >), com quebras normalizadas para \\n."""
+    if _INVALIDOS.search(texto):
+        raise ValueError(f'Caractere inválido para XML em {texto!r}')
+    if '\r' in texto:
+        # O parser do minidom normalizava \r\n e \r para \n
+        texto = texto.replace('\r\n', '\n').replace('\r', '\n')
+    if '&' in texto:
+        texto = texto.replace('&', '&amp;')
+    if '<' in texto:
+        texto = texto.replace('<', '&lt;')
+    if '"' in texto:
+        texto = texto.replace('"', '&quot;')
+    if '>' in texto:
+        texto = texto.replace('>', '&gt;')
+    return texto
+
+
+def _renderizar(valores):
+    partes = [_CABECALHO]
+    for (abre, fecha, vazio), valor in zip(_MODELO, valores):
+        texto = '' if valor is None else str(valor)
+        if texto:
+            partes.append(abre)
+            partes.append(escapar(texto))
+            partes.append(fecha)
+        else:
+            partes.append(vazio)
+    partes.append(_RODAPE)
+    return ''.join(partes).encode('utf-8')
+
+
+def xml_ordem(part_code, customer_code, customer_description, thickness, order,
+              qty_required, delivery_date, file_part):
+    """Bytes (utf-8) do XML de uma ordem. Valores None ou vazios saem como <Tag/>."""
+    return _renderizar((
+        DRIVER, TRANSACTION_ID, part_code, customer_code, customer_description,
+        MATERIAL, thickness, order, qty_required, delivery_date, file_part,
+    ))
+
+
+def _xml_ordem_minidom(part_code, customer_code, customer_description, thickness, order,
+                       qty_required, delivery_date, file_part):
+    """Caminho antigo (ElementTree + minidom): gera os arquivos de referência dos testes e entra na medição."""
+    from xml.dom import minidom
+    from xml.etree.ElementTree import Element, SubElement, tostring
+
+    root = Element('RPOrderGenerator')
+    root.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
+    root.set('xmlns:xsd', 'http://www.w3.org/2001/XMLSchema')
+    queued_item = SubElement(root, 'QueuedItem')
+    valores = (DRIVER, TRANSACTION_ID, part_code, customer_code, customer_description,
+               MATERIAL, thickness, order, qty_required, delivery_date, file_part)
+    for tag, valor in zip(CAMPOS, valores):
+        SubElement(queued_item, tag).text = None if valor is None else str(valor)
+    return minidom.parseString(tostring(root, 'utf-8')).toprettyxml(indent='  ', encoding='utf-8')
+
+
+def _medir(quantidade=5000):
+    import time
+
+    ordens = [
+        (f'PC_{i:05d}_FRONTAL', 'COROLLA', f'SLOT {i % 169 + 1} | 1001 | {i:03d} | FRONTAL',
+         '1.5', f'{100000 + i}-A', str(i % 4 + 1), '17/10/2026', f'PC_{i:05d}_FRONTAL')
+        for i in range(quantidade)
+    ]
+    for nome, funcao in (('modelo', xml_ordem), ('ElementTree+minidom', _xml_ordem_minidom)):
+        inicio = time.perf_counter()
+        for ordem in ordens:
+            funcao(*ordem)
+        duracao = time.perf_counter() - inicio
+        print(f"{nome:>20}: {quantidade} ordens em {duracao:.3f}s ({quantidade / duracao:,.0f} ordens/s)")
+
+
+if __name__ == '__main__':
+    _medir()